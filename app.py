@@ -2,15 +2,51 @@ from config import *
 import streamlit as st
 import os
 
+import instrumentation
 from download_data import get_stock_data
 from preprocess_data import preprocess_stock_data
-from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from price_store import load_prices
+from return_stats import compute_return_stats, file_fingerprint
+from samplers import SAMPLERS
+from result_store import ResultStore
+from simulation_jobs import JobManager, load_run_info
 
 # Utility function to list uploaded files
 def list_uploaded_files(data_folder='data'):
     if not os.path.exists(data_folder):
         os.makedirs(data_folder)
-    return [f for f in os.listdir(data_folder) if f.endswith('.csv')]
+    return [f for f in os.listdir(data_folder) if f.endswith(('.csv', '.feather'))]
+
+
+# Cached loaders, shared by every session. Files are keyed by content hash, so a re-uploaded
+# or re-preprocessed file is loaded again while unchanged files are never re-read.
+@st.cache_data(max_entries=256)
+def file_hash(path, mtime_ns, size):
+    return file_fingerprint(path)
+
+
+def current_file_hash(path):
+    stat = os.stat(path)
+    return file_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@st.cache_data(max_entries=16, ttl=3600)
+def load_price_file(path, content_hash):
+    return load_prices(path)
+
+
+@st.cache_resource(max_entries=16, ttl=3600)
+def load_file_stats(path, content_hash):
+    return compute_return_stats(load_price_file(path, content_hash), content_hash)
+
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager()
+
+
+if 'runs' not in st.session_state:
+    st.session_state['runs'] = []
 
 # Streamlit App Title
 st.title("Monte Carlo Simulation for Portfolio Optimization")
@@ -93,7 +129,7 @@ with tab2:
         if st.button("Download Custom Data"):
             try:
                 symbols = [symbol.strip() for symbol in custom_symbols.split(",")]
-                get_stock_data(symbols, str(start_date), str(end_date), save_path=f"data/custom_data.csv")
+                get_stock_data(symbols, str(start_date), str(end_date), save_path=f"data/custom_data.feather")
                 st.success(f"Downloaded data for: {', '.join(symbols)}")
             except Exception as e:
                 st.error(f"Error downloading data: {e}")
@@ -104,9 +140,9 @@ with tab2:
     if st.button("Preprocess Selected Data"):
         try:
             input_path = f"data/{selected_file}"
-            output_path = f"data/cleaned_{selected_file}"
-            preprocess_stock_data(input_path=input_path, output_path=output_path)
-            st.success(f"Data preprocessed and saved as cleaned_{selected_file}!")
+            cleaned_file = f"cleaned_{os.path.splitext(selected_file)[0]}.feather"
+            preprocess_stock_data(input_path=input_path, output_path=f"data/{cleaned_file}")
+            st.success(f"Data preprocessed and saved as {cleaned_file}!")
         except Exception as e:
             st.error(f"Error during preprocessing: {e}")
 
@@ -115,41 +151,95 @@ with tab3:
     st.header("Simulation Settings")
     risk_free_rate = st.number_input("Enter Risk-Free Rate", min_value=0.0, max_value=0.1, value=0.01, step=0.001)
     num_of_portfolios = st.number_input("Number of Portfolios", min_value=1000, max_value=50000, value=10000, step=1000)
+    sampler_name = st.selectbox("Weight Sampler", list(SAMPLERS), help="'uniform' is the original sampler, the others cover the simplex more evenly.")
+    stop_early = st.checkbox("Stop early once the optimum has converged", help="Treats the number of portfolios as a maximum and refines around the best portfolio found so far.")
 
     # Select preprocessed file for simulation
     preprocessed_files = [f for f in list_uploaded_files() if f.startswith('cleaned_')]
     selected_cleaned_file = st.selectbox("Select preprocessed file for simulation", preprocessed_files)
 
-    # Run Simulation
+    # Run Simulation in the background, the results are stored under data/runs/<run_id>/
     if st.button("Run Monte Carlo Simulation"):
         try:
-            processed_df = pd.read_csv(f"data/{selected_cleaned_file}", index_col=0, parse_dates=True)
-            simulations_df = monte_carlo_simulation(processed_df, num_of_portfolios=num_of_portfolios, risk_free_rate=risk_free_rate)
-
-            # Store the simulation results for later use
-            simulations_df.to_csv("data/simulation_results.csv", index=False)
-            st.success("Monte Carlo simulation completed!")
+            input_path = f"data/{selected_cleaned_file}"
+            stats = load_file_stats(input_path, current_file_hash(input_path))
+            job = get_job_manager().submit(stats, input_file=selected_cleaned_file, risk_free_rate=risk_free_rate,
+                                           num_of_portfolios=int(num_of_portfolios), sampler=sampler_name, stop_early=stop_early)
+            st.session_state['runs'].append(job.run_id)
         except Exception as e:
             st.error(f"Error running simulation: {e}")
 
+    # Progress of this session's latest run, refreshed without rerunning the whole page
+    @st.fragment(run_every=1)
+    def run_status():
+        if not st.session_state['runs']:
+            return
+        job = get_job_manager().get(st.session_state['runs'][-1])
+        if job is None:
+            return
+        if job.finished:
+            if job.status == 'done':
+                st.success(f"Monte Carlo simulation {job.run_id} completed! {job.message}")
+            elif job.status == 'cancelled':
+                st.warning(f"Simulation {job.run_id} was cancelled.")
+            else:
+                st.error(f"Error running simulation: {job.message}")
+            if not st.session_state.get('shown_' + job.run_id):
+                # Rerun the full page once so the Results tab picks up the new run
+                st.session_state['shown_' + job.run_id] = True
+                st.rerun()
+            return
+        st.progress(job.progress, text=f"Simulation {job.run_id}: {job.status}")
+        if st.button("Cancel Simulation"):
+            get_job_manager().cancel(job.run_id)
+
+    run_status()
+
 # Results Tab
 with tab4:
     st.header("Simulation Results")
 
-    # Load and Display Results
-    if os.path.exists("data/simulation_results.csv"):
-        simulations_df = pd.read_csv("data/simulation_results.csv")
-        st.write("First 5 Monte Carlo Simulation Results")
-        st.dataframe(simulations_df.head())
-
-        # Plotting the Efficient Frontier
+    # Only this session's runs that are still on disk
+    runs = [run_id for run_id in reversed(st.session_state['runs']) if os.path.exists(f"data/runs/{run_id}/simulation_results.arrow")]
+    if runs:
+        run_id = st.selectbox("Select run", runs)
+        run_dir = f"data/runs/{run_id}"
+        st.json(load_run_info(run_dir)['params'], expanded=False)
+
+        # Queries only decompress the parts of the result file they need
+        results = ResultStore(f"{run_dir}/simulation_results.arrow")
+        st.write(f"Top 5 of {len(results):,} Portfolios by Sharpe Ratio")
+        st.dataframe(results.top_sharpe(5))
+
+        min_return = st.number_input("Minimum Return", value=0.0, step=0.01, format="%.3f")
+        min_volatility = results.min_volatility(min_return)
+        if min_volatility is not None:
+            st.write(f"Min Volatility Portfolio returning at least {min_return:.3f}")
+            st.dataframe(min_volatility.to_frame().T)
+        else:
+            st.write(f"No portfolio returns at least {min_return:.3f}")
+
+        # Plotting the Efficient Frontier from the render cached with the run
         st.write("Efficient Frontier")
-        plt.figure(figsize=(10, 6))
-        scatter = plt.scatter(simulations_df['Volatility'], simulations_df['Returns'], c=simulations_df['Sharpe Ratio'], cmap='viridis')
-        plt.colorbar(scatter, label='Sharpe Ratio')
-        plt.xlabel('Volatility')
-        plt.ylabel('Returns')
-        plt.title('Monte Carlo Simulation: Efficient Frontier')
-        st.pyplot(plt)
+        st.image(f"{run_dir}/simulation_results_plot.png")
     else:
         st.warning("No simulation results found. Please run the simulation first.")
+
+# Timing panel: per stage timings and counters of this app process (shared by every session).
+# Sessions only ever switch timing on: unticking hides the panel here but leaves it running for the others.
+with st.sidebar:
+    if st.checkbox("Show timings", value=instrumentation.enabled(), help="Times every pipeline stage, see instrumentation.py."):
+        instrumentation.enable()
+
+        @st.fragment(run_every=2)
+        def timing_panel():
+            report = instrumentation.report()
+            st.dataframe(instrumentation.report_frame(), use_container_width=True)
+            st.json(report['counters'], expanded=False)
+            if report['rss_peak_mb'] is not None:
+                st.caption(f"Peak memory (RSS): {report['rss_peak_mb']:,.0f} MB")
+            st.caption("Timings are collected for every session of this app until it restarts.")
+            if st.button("Reset Timings"):
+                instrumentation.reset()
+
+        timing_panel()
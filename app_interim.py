@@ -1,10 +1,12 @@
 from config import *
+import matplotlib.pyplot as plt
 import streamlit as st
 import os
 
 from download_data import get_stock_data
 from preprocess_data import preprocess_stock_data
 from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from price_store import load_prices, save_prices
 
 
 st.title("Monte Carlo Simulation for Portfolio Optimization")
@@ -37,6 +39,7 @@ uploaded_file = st.sidebar.file_uploader("Upload a CSV file", type=["csv"])
 if uploaded_file:
     with open('data/stock_data.csv', 'wb') as f:
         f.write(uploaded_file.getbuffer())
+    save_prices(load_prices('data/stock_data.csv'), 'data/stock_data.feather')
     st.success("File uploaded successfully!")
 
 # Download Example Data
@@ -76,7 +79,7 @@ if st.sidebar.button("3. Run Monte Carlo Simulation"):
 
 
 
-        processed_df = pd.read_csv('data/stock_data_cleaned.csv', index_col=0, parse_dates=True)
+        processed_df = load_prices('data/stock_data_cleaned.feather')
         simulations_df = monte_carlo_simulation(processed_df)
 
         # Display Results
@@ -0,0 +1,143 @@
+from config import *
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from frontier_optimisation import optimize_frontier
+from incremental_stats import IncrementalReturnStats
+from monte_carlo_portfolio_optimisation import stream_monte_carlo_simulation
+
+"""
+Walk-forward backtest with periodic rebalancing.
+
+- Statistics are re-estimated on a rolling lookback window that is updated incrementally day by day
+  (IncrementalReturnStats), never recomputed per window.
+- At every rebalance date the portfolio is re-optimised from the statistics known at that close,
+  then held out of sample (weights drift with prices) until the next rebalance.
+- Rebalance dates are independent once their statistics are known, so they are optimised in parallel.
+
+"""
+
+
+def _optimiser(method, objective, num_of_portfolios, sampler, risk_free_rate):
+    """
+    Build optimiser(stats, seed_seq) -> weights for one of the built-in methods.
+    """
+    if method == 'monte_carlo':
+        def optimiser(stats, seed_seq):
+            results = stream_monte_carlo_simulation(stats, num_of_portfolios, risk_free_rate, seed=seed_seq,
+                                                    top_k=1, n_bins=1, sampler=sampler)
+            return results[objective][stats.symbols].to_numpy(dtype=float)
+    elif method == 'frontier':
+        def optimiser(stats, seed_seq):
+            results = optimize_frontier(stats.mean_series, stats.cov_frame, risk_free_rate, num_points=2, factors=stats.factors)
+            return results[objective][stats.symbols].to_numpy(dtype=float)
+    else:
+        raise ValueError(f"Unknown method '{method}', expected 'monte_carlo' or 'frontier'")
+    return optimiser
+
+
+def _rolling_snapshots(processed_df, lookback, rebalance_every):
+    """
+    Walk through history once, returning (row position, ReturnStats) at every rebalance date.
+    """
+    log_return = np.log(1 + processed_df.pct_change()).to_numpy()
+    dates = processed_df.index
+    complete = ~np.isnan(log_return).any(axis=1)
+
+    rolling = IncrementalReturnStats(processed_df.columns, window=lookback)
+    snapshots, first_full = [], None
+    for i in range(1, len(dates)):
+        if complete[i]:
+            rolling.push_returns(log_return[i:i + 1], dates[i:i + 1])
+        if rolling.count < lookback:
+            continue
+        if first_full is None:
+            first_full = i
+        if (i - first_full) % rebalance_every == 0:
+            snapshots.append((i, rolling.to_return_stats()))
+    return snapshots
+
+
+def walk_forward_backtest(processed_df, lookback=252, rebalance_every=21, method='monte_carlo', objective='max_sharpe',
+                          optimiser=None, num_of_portfolios=10000, sampler=None, risk_free_rate=0.01,
+                          transaction_cost=0.001, seed=None, n_workers=None):
+    """
+    Backtest re-optimising every rebalance_every trading days on the last lookback days of returns.
+
+    - method is 'monte_carlo' (stream_monte_carlo_simulation) or 'frontier' (optimize_frontier), and
+      objective is 'max_sharpe' or 'min_volatility'. optimiser(stats, seed_seq) -> weights overrides both.
+    - transaction_cost is charged on turnover (sum of absolute weight changes) at every rebalance;
+      the portfolio starts in cash, so the first rebalance has a turnover of 1.
+    - Rebalances are optimised on n_workers threads (None uses every core), each with its own seed
+      spawned from seed, so results do not depend on n_workers.
+
+    Returns a dict with 'equity_curve' and 'returns' (daily, net of costs), 'weights' and 'turnover'
+    per rebalance date, and a 'summary' Series.
+    """
+    if optimiser is None:
+        optimiser = _optimiser(method, objective, num_of_portfolios, sampler, risk_free_rate)
+
+    snapshots = _rolling_snapshots(processed_df, lookback, rebalance_every)
+    if not snapshots:
+        raise ValueError(f"Not enough complete rows for a lookback of {lookback} days")
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(snapshots))
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=n_workers) as executor:
+        targets = list(executor.map(lambda job: optimiser(job[0][1], job[1]), zip(snapshots, seed_seqs)))
+
+    # Out of sample: trade at the close of the rebalance date, hold until the next one
+    simple_returns = processed_df.pct_change().fillna(0.0).to_numpy()
+    dates = processed_df.index
+    positions = [i for i, _ in snapshots] + [len(dates) - 1]
+
+    value = 1.0
+    held = np.zeros(len(processed_df.columns))      # Start in cash
+    equity = pd.Series(np.nan, index=dates)
+    equity.iloc[:positions[0] + 1] = 1.0
+    turnover, costs = [], []
+
+    for p, target in enumerate(targets):
+        start, stop = positions[p], positions[p + 1]
+        traded = np.abs(target - held).sum()
+        cost = value * transaction_cost * traded
+        value -= cost
+        turnover.append(traded)
+        costs.append(cost)
+        equity.iloc[start] = value
+
+        if stop > start:
+            asset_values = value * target * np.cumprod(1.0 + simple_returns[start + 1:stop + 1], axis=0)
+            path = asset_values.sum(axis=1)
+            equity.iloc[start + 1:stop + 1] = path
+            value = path[-1]
+            held = asset_values[-1] / value
+        else:
+            held = target
+
+    rebalance_dates = dates[positions[:-1]]
+    returns = equity.pct_change().fillna(0.0)
+
+    # Summarise from the first rebalance: the lookback before it is cash, not performance. The
+    # first rebalance's cost is still in the final value, which starts from 1.0
+    live_returns = returns.iloc[positions[0] + 1:]
+    years = len(live_returns) / 252
+    drawdown = 1.0 - equity.iloc[positions[0]:] / equity.iloc[positions[0]:].cummax()
+    summary = pd.Series({
+        'Annualised Return': equity.iloc[-1] ** (1 / years) - 1 if years > 0 else np.nan,
+        'Annualised Volatility': live_returns.std() * np.sqrt(252),
+        'Sharpe Ratio': (live_returns.mean() * 252 - risk_free_rate) / (live_returns.std() * np.sqrt(252)),
+        'Max Drawdown': drawdown.max(),
+        'Total Turnover': sum(turnover),
+        'Total Costs': sum(costs),
+        'Rebalances': len(targets),
+    })
+
+    return {
+        'equity_curve': equity,
+        'returns': returns,
+        'weights': pd.DataFrame(targets, index=rebalance_dates, columns=processed_df.columns),
+        'turnover': pd.Series(turnover, index=rebalance_dates),
+        'summary': summary,
+    }
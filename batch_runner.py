@@ -0,0 +1,285 @@
+from config import *
+import argparse
+import itertools
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import nullcontext
+
+import instrumentation
+from covariance import get_covariance_estimator
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from result_store import save_results
+from return_stats import load_return_stats
+from samplers import get_sampler
+
+
+"""
+Headless batch runner: python batch_runner.py jobs.json --output-dir runs/nightly
+
+- A job file describes a grid of scenarios. Every combination of the lists under "grid" is one
+  scenario, on top of the values under "defaults"; "scenarios" adds explicit extra ones:
+
+    {
+      "defaults": {"num_of_portfolios": 100000, "covariance": "sample", "seed": 42},
+      "grid": {
+        "dataset": ["data/stock_data_cleaned.feather"],
+        "risk_free_rate": [0.01, 0.02, 0.03],
+        "sampler": ["uniform", "dirichlet", {"name": "sparse", "max_assets": 5}],
+        "num_of_portfolios": [10000, 1000000]
+      },
+      "scenarios": [{"dataset": "data/other.feather", "risk_free_rate": 0.0}]
+    }
+
+- Samplers and covariance estimators are names from samplers.py / covariance.py, or a dict with
+  the name and constructor kwargs.
+- The same grid keys can be given on the command line (--risk-free-rate 0.01 0.02 ...), with or
+  without a job file, and replace the job file's lists.
+- Scenarios run on a process pool. The return statistics of every distinct dataset / date range /
+  estimator are computed once up front into the disk cache (return_stats.py), and scenarios are
+  queued grouped by dataset so each worker process also reuses them from its memory cache.
+- Every scenario writes <output_dir>/<scenario_id>/simulation_results.arrow (see result_store.py),
+  and <output_dir>/manifest.json lists every scenario with its parameters, status, timing, result
+  path and best portfolios. The manifest is rewritten as scenarios finish, so a crashed run still
+  leaves a record of what completed.
+
+"""
+
+DEFAULT_SCENARIO = {
+    'dataset': 'data/stock_data_cleaned.feather',
+    'start_date': None,
+    'end_date': None,
+    'covariance': 'sample',
+    'risk_free_rate': 0.01,
+    'sampler': 'uniform',
+    'num_of_portfolios': 10000,
+    'chunk_size': 50000,
+    'seed': None,
+    'save_weights': False,
+    'dtype': 'float64',             # 'float32' halves the memory and result file size
+    'engine': 'numpy',              # 'numba' or 'auto' for the compiled kernel, see jit_kernels.py
+}
+
+MANIFEST_NAME = 'manifest.json'
+
+
+def _named(spec):
+    """ 'dirichlet' or {'name': 'dirichlet', 'alpha': 0.5} -> (name, kwargs) """
+    if isinstance(spec, dict):
+        spec = dict(spec)
+        return spec.pop('name'), spec
+    return spec, {}
+
+
+def expand_scenarios(job: dict) -> list:
+    """
+    Expand a job description (see the module docstring) into a list of complete scenario dicts.
+    """
+    unknown = set(job) - {'defaults', 'grid', 'scenarios'}
+    if unknown:
+        raise ValueError(f"Unknown job file keys {sorted(unknown)}, expected defaults, grid and scenarios")
+
+    base = {**DEFAULT_SCENARIO, **job.get('defaults', {})}
+    grid = job.get('grid', {})
+    for key, values in grid.items():
+        if not isinstance(values, list):
+            raise ValueError(f"Grid values for '{key}' must be a list")
+
+    scenarios = []
+    if grid or not job.get('scenarios'):
+        for combination in itertools.product(*grid.values()):
+            scenarios.append({**base, **dict(zip(grid, combination))})
+    scenarios += [{**base, **extra} for extra in job.get('scenarios', [])]
+
+    for scenario in scenarios:
+        unknown = set(scenario) - set(DEFAULT_SCENARIO)
+        if unknown:
+            raise ValueError(f"Unknown scenario keys {sorted(unknown)}, expected {list(DEFAULT_SCENARIO)}")
+        # Check names here, not hours into a nightly run
+        for spec, factory in ((scenario['sampler'], get_sampler), (scenario['covariance'], get_covariance_estimator)):
+            name, options = _named(spec)
+            factory(name, **options)
+    return scenarios
+
+
+def _stats_key(scenario):
+    return (str(scenario['dataset']), str(scenario['start_date']), str(scenario['end_date']),
+            json.dumps(scenario['covariance'], sort_keys=True))
+
+
+def _load_stats(scenario):
+    name, options = _named(scenario['covariance'])
+    return load_return_stats(scenario['dataset'], scenario['start_date'], scenario['end_date'],
+                             covariance=get_covariance_estimator(name, **options))
+
+
+def run_scenario(scenario: dict, result_dir) -> dict:
+    """
+    Run one scenario and save its results under result_dir. Returns its manifest entry.
+
+    - Never raises: a failing scenario is reported with status 'failed' and the error, so one bad
+      scenario does not stop the rest of the grid.
+    """
+    result_dir = pathlib.Path(result_dir)
+    start_time = time.perf_counter()
+    entry = {'scenario_id': result_dir.name, 'params': scenario, 'status': 'failed'}
+    # Captured on their own: with max_workers=1 the process totals are the caller's
+    with instrumentation.capture() as captured:
+        try:
+            result_dir.mkdir(parents=True, exist_ok=True)
+            stats = _load_stats(scenario)
+            sampler_name, sampler_options = _named(scenario['sampler'])
+
+            simulations_df = monte_carlo_simulation(stats, num_of_portfolios=scenario['num_of_portfolios'],
+                                                    risk_free_rate=scenario['risk_free_rate'],
+                                                    chunk_size=scenario['chunk_size'], seed=scenario['seed'],
+                                                    sampler=get_sampler(sampler_name, **sampler_options),
+                                                    return_weights=scenario['save_weights'],
+                                                    dtype=np.dtype(scenario['dtype']), engine=scenario['engine'])
+
+            result_path = result_dir / 'simulation_results.arrow'
+            save_results(simulations_df, result_path, symbols=stats.symbols, dtype=np.dtype(scenario['dtype']),
+                         metadata={**scenario, 'fingerprint': stats.fingerprint, 'scenario_id': result_dir.name})
+
+            best = simulations_df['Sharpe Ratio'].idxmax()
+            safest = simulations_df['Volatility'].idxmin()
+            entry.update({
+                'status': 'done',
+                'result_path': str(result_path),
+                'fingerprint': stats.fingerprint,
+                'max_sharpe': simulations_df.loc[best, ['Returns', 'Volatility', 'Sharpe Ratio']].to_dict(),
+                'min_volatility': simulations_df.loc[safest, ['Returns', 'Volatility', 'Sharpe Ratio']].to_dict(),
+            })
+        except Exception as e:
+            entry['error'] = f"{type(e).__name__}: {e}"
+            entry['traceback'] = traceback.format_exc()
+    entry['seconds'] = time.perf_counter() - start_time
+    if instrumentation.enabled():
+        entry['timings'] = instrumentation.report(captured)
+    return entry
+
+
+def _write_manifest(output_dir, manifest):
+    # Write then rename, so readers never see a half written manifest
+    path = output_dir / MANIFEST_NAME
+    partial = path.with_suffix('.json.tmp')
+    with open(partial, 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+    partial.replace(path)
+
+
+def run_batch(scenarios: list, output_dir, max_workers=None, log=print) -> dict:
+    """
+    Run every scenario on a pool of max_workers processes (None: one per core, 1: in this process)
+    and write the manifest to output_dir. Returns the manifest.
+    """
+    output_dir = pathlib.Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # A seed per scenario is recorded in the manifest, so any scenario can be rerun exactly
+    for scenario in scenarios:
+        if scenario['seed'] is None:
+            scenario['seed'] = np.random.SeedSequence().entropy
+
+    ids = [f"scenario-{i:04d}" for i in range(len(scenarios))]
+    manifest = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'max_workers': max_workers,
+        'scenarios': [{'scenario_id': scenario_id, 'params': scenario, 'status': 'queued'}
+                      for scenario_id, scenario in zip(ids, scenarios)],
+    }
+    _write_manifest(output_dir, manifest)
+
+    # Statistics once per dataset / date range / estimator; failures are left for the scenarios to report
+    distinct = {_stats_key(scenario): scenario for scenario in scenarios}
+    for key, scenario in distinct.items():
+        try:
+            _load_stats(scenario)
+        except Exception as e:
+            log(f"Could not compute statistics for {key[0]}: {e}")
+
+    order = sorted(range(len(scenarios)), key=lambda i: _stats_key(scenarios[i]))
+
+    def record(i, entry):
+        manifest['scenarios'][i] = entry
+        _write_manifest(output_dir, manifest)
+        log(f"[{sum(s['status'] != 'queued' for s in manifest['scenarios'])}/{len(scenarios)}] "
+            f"{entry['scenario_id']} {entry['status']} in {entry['seconds']:.1f}s" +
+            (f": {entry['error']}" if 'error' in entry else ''))
+
+    if max_workers == 1:
+        for i in order:
+            record(i, run_scenario(scenarios[i], output_dir / ids[i]))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_scenario, scenarios[i], output_dir / ids[i]): i for i in order}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    manifest['finished'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    _write_manifest(output_dir, manifest)
+    return manifest
+
+
+"""
+Script: python batch_runner.py [jobs.json] [options]
+
+"""
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run a grid of Monte Carlo scenarios without the app.')
+    parser.add_argument('job_file', nargs='?', help='JSON job file with defaults / grid / scenarios')
+    parser.add_argument('--output-dir', default=None, help='defaults to data/batch/<time>')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes, defaults to one per core')
+    parser.add_argument('--dataset', nargs='+', help='cleaned price files')
+    parser.add_argument('--risk-free-rate', nargs='+', type=float)
+    parser.add_argument('--sampler', nargs='+')
+    parser.add_argument('--num-of-portfolios', '-n', nargs='+', type=int)
+    parser.add_argument('--covariance', nargs='+')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--save-weights', action='store_true', help='store the weights of every portfolio')
+    parser.add_argument('--dry-run', action='store_true', help='only list the scenarios')
+    parser.add_argument('--instrument', action='store_true', help='record per stage timings of every scenario in the manifest')
+    parser.add_argument('--profile', metavar='FILE', help='cProfile the whole batch to FILE (use --workers 1 to include the scenarios)')
+    args = parser.parse_args(argv)
+
+    job = {}
+    if args.job_file:
+        with open(args.job_file) as f:
+            job = json.load(f)
+
+    grid = dict(job.get('grid', {}))
+    for key in ('dataset', 'risk_free_rate', 'sampler', 'num_of_portfolios', 'covariance'):
+        if getattr(args, key) is not None:
+            grid[key] = getattr(args, key)
+    job['grid'] = grid
+    defaults = dict(job.get('defaults', {}))
+    if args.seed is not None:
+        defaults['seed'] = args.seed
+    if args.save_weights:
+        defaults['save_weights'] = True
+    job['defaults'] = defaults
+
+    scenarios = expand_scenarios(job)
+    if args.dry_run:
+        print(pd.DataFrame(scenarios).to_string())
+        return
+
+    if args.instrument:
+        # Worker processes read the flag from the environment
+        os.environ['MC_INSTRUMENT'] = '1'
+        instrumentation.enable()
+
+    output_dir = args.output_dir or pathlib.Path('data/batch') / time.strftime('%Y%m%d-%H%M%S')
+    with instrumentation.profile(args.profile) if args.profile else nullcontext():
+        manifest = run_batch(scenarios, output_dir, max_workers=args.workers)
+    failed = sum(entry['status'] != 'done' for entry in manifest['scenarios'])
+    print(f"{len(scenarios) - failed} of {len(scenarios)} scenarios done, manifest in {pathlib.Path(output_dir) / MANIFEST_NAME}")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+from config import *
+import argparse
+import importlib.util
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+from metrics import calculate_portfolio_metrics
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation, optimal_portfolios, stream_monte_carlo_simulation
+from preprocess_data import preprocess_stock_data
+from price_store import load_prices, save_prices
+from return_stats import compute_return_stats
+
+"""
+Benchmarks for the simulation, metrics and I/O hot paths, on synthetic prices.
+
+- python benchmarks.py                     quick sweep, results saved to benchmark_results/<time>-<commit>.json
+- python benchmarks.py --full              sweep up to 10M portfolios and 1000 assets
+- python benchmarks.py --compare a.json b.json
+
+Each axis (portfolios, assets, history length) is swept on its own around a baseline case.
+Timings are the best of --repeat runs; peak memory comes from one extra run under tracemalloc.
+
+"""
+
+RESULTS_DIR = pathlib.Path('benchmark_results')
+
+QUICK_SWEEP = {
+    'portfolio_counts': [1_000, 10_000, 100_000, 1_000_000],
+    'asset_counts': [3, 10, 50, 200],
+    'history_lengths': [252, 1260, 5040],
+}
+
+FULL_SWEEP = {
+    'portfolio_counts': [1_000, 10_000, 100_000, 1_000_000, 10_000_000],
+    'asset_counts': [3, 10, 50, 200, 1000],
+    'history_lengths': [252, 1260, 5040],
+}
+
+BASELINE = {'n_portfolios': 100_000, 'n_assets': 10, 'n_days': 1260}
+
+
+"""
+Synthetic prices
+
+"""
+
+def synthetic_prices(n_days=1260, n_assets=10, seed=0) -> pd.DataFrame:
+    """
+    Cleaned prices (one column per ticker) following correlated geometric Brownian motions.
+    """
+    rng = np.random.default_rng(seed)
+    n_factors = min(3, n_assets)
+    loadings = rng.normal(0.0, 0.01, size=(n_factors, n_assets))
+    daily = rng.normal(0.0, 1.0, size=(n_days, n_factors)) @ loadings
+    daily += rng.normal(0.0003, 0.01, size=(n_days, n_assets))
+    prices = 100.0 * np.exp(np.cumsum(daily, axis=0))
+    index = pd.bdate_range('2000-01-03', periods=n_days, name='Date')
+    return pd.DataFrame(prices, index=index, columns=[f"SYM{i:04d}" for i in range(n_assets)])
+
+
+def synthetic_raw_prices(n_days=1260, n_assets=10, seed=0) -> pd.DataFrame:
+    """
+    The same prices in the yfinance (Ticker, Price) multi-index layout.
+    """
+    close = synthetic_prices(n_days, n_assets, seed)
+    fields = {'Open': 0.999, 'High': 1.01, 'Low': 0.99, 'Close': 1.0, 'Adj Close': 1.0}
+    frames = {}
+    for ticker in close.columns:
+        frame = pd.DataFrame({field: close[ticker] * scale for field, scale in fields.items()})
+        frame['Volume'] = 1e6
+        frames[ticker] = frame
+    return pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+
+
+"""
+Measuring
+
+"""
+
+def _measure(fn, repeat=3):
+    seconds = min(_timed(fn) for _ in range(repeat))
+
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'seconds': seconds, 'peak_mb': peak / 2 ** 20}
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def bench_simulation(n_portfolios, n_assets, n_days, repeat=3):
+    processed_df = synthetic_prices(n_days, n_assets)
+    results = []
+
+    stats_run = _measure(lambda: compute_return_stats(processed_df), repeat)
+    results.append({'benchmark': 'return_stats', 'n_assets': n_assets, 'n_days': n_days, **stats_run})
+
+    stats = compute_return_stats(processed_df)
+    stages = {
+        'monte_carlo_simulation': lambda: monte_carlo_simulation(stats, n_portfolios, seed=0),
+        'stream_monte_carlo_simulation': lambda: stream_monte_carlo_simulation(stats, n_portfolios, seed=0),
+        'optimal_portfolios': lambda: optimal_portfolios(stats, n_portfolios, seed=0, engine='numpy'),
+    }
+    if importlib.util.find_spec('numba') is not None:
+        # Compile (or load the cached) kernel outside the timings
+        optimal_portfolios(stats, 1, engine='numba')
+        stages['monte_carlo_simulation_numba'] = lambda: monte_carlo_simulation(stats, n_portfolios, seed=0, engine='numba')
+        stages['optimal_portfolios_numba'] = lambda: optimal_portfolios(stats, n_portfolios, seed=0, engine='numba')
+    for name, fn in stages.items():
+        run = _measure(fn, repeat)
+        results.append({
+            'benchmark': name, 'n_portfolios': n_portfolios, 'n_assets': n_assets, 'n_days': n_days,
+            'portfolios_per_sec': n_portfolios / run['seconds'], **run,
+        })
+    return results
+
+
+def bench_metrics(n_assets, n_days, n_calls=1000, repeat=3):
+    processed_df = synthetic_prices(n_days, n_assets)
+    log_return = np.log(1 + processed_df.pct_change())
+    weights = np.random.default_rng(0).dirichlet(np.ones(n_assets), size=n_calls)
+
+    def run():
+        for w in weights:
+            calculate_portfolio_metrics(w, log_return)
+
+    result = _measure(run, repeat)
+    return [{
+        'benchmark': 'calculate_portfolio_metrics', 'n_calls': n_calls, 'n_assets': n_assets, 'n_days': n_days,
+        'calls_per_sec': n_calls / result['seconds'], **result,
+    }]
+
+
+def bench_io(n_assets, n_days, repeat=3):
+    raw_df = synthetic_raw_prices(n_days, n_assets)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = pathlib.Path(tmp)
+        raw_df.to_csv(tmp / 'raw.csv')
+        save_prices(raw_df, tmp / 'raw.feather')
+        preprocess_stock_data(tmp / 'raw.feather', tmp / 'cleaned.feather')
+        load_prices(tmp / 'raw.feather', field='Close').to_csv(tmp / 'cleaned.csv')
+
+        stages = {
+            'read_raw_csv': lambda: pd.read_csv(tmp / 'raw.csv', header=[0, 1], index_col=0),
+            'load_raw_feather_close': lambda: load_prices(tmp / 'raw.feather', field='Close'),
+            'preprocess_stock_data': lambda: preprocess_stock_data(tmp / 'raw.feather', tmp / 'out.feather'),
+            'read_cleaned_csv': lambda: pd.read_csv(tmp / 'cleaned.csv', index_col=0, parse_dates=True),
+            'load_cleaned_feather': lambda: load_prices(tmp / 'cleaned.feather'),
+        }
+        for name, fn in stages.items():
+            results.append({'benchmark': name, 'n_assets': n_assets, 'n_days': n_days, **_measure(fn, repeat)})
+    return results
+
+
+def run_suite(portfolio_counts, asset_counts, history_lengths, repeat=3):
+    cases = []
+    for axis, values in [('n_portfolios', portfolio_counts), ('n_assets', asset_counts), ('n_days', history_lengths)]:
+        cases += [dict(BASELINE, **{axis: value}) for value in values if dict(BASELINE, **{axis: value}) not in cases]
+
+    results = []
+    for case in cases:
+        print(f"simulation {case}")
+        results += bench_simulation(case['n_portfolios'], case['n_assets'], case['n_days'], repeat)
+
+    for n_assets in asset_counts:
+        for n_days in history_lengths:
+            print(f"metrics / io n_assets={n_assets} n_days={n_days}")
+            results += bench_metrics(n_assets, n_days, repeat=repeat)
+            results += bench_io(n_assets, n_days, repeat)
+    return results
+
+
+"""
+Saving and comparing
+
+"""
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def save_results(results, output=None):
+    commit = _git_commit()
+    report = {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if output is None:
+        RESULTS_DIR.mkdir(exist_ok=True)
+        output = RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{commit}.json"
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    return output
+
+
+def _case_key(result):
+    return tuple(sorted((k, v) for k, v in result.items() if k == 'benchmark' or k.startswith('n_')))
+
+
+def compare_results(old_path, new_path) -> pd.DataFrame:
+    """
+    Side by side timings of two saved runs, matched on benchmark name and problem size.
+    """
+    with open(old_path) as f:
+        old = {_case_key(r): r for r in json.load(f)['results']}
+    with open(new_path) as f:
+        new = {_case_key(r): r for r in json.load(f)['results']}
+
+    rows = []
+    for key in sorted(old.keys() & new.keys()):
+        case = dict(key)
+        case.update({
+            'old_seconds': old[key]['seconds'],
+            'new_seconds': new[key]['seconds'],
+            'speedup': old[key]['seconds'] / new[key]['seconds'],
+            'old_peak_mb': old[key]['peak_mb'],
+            'new_peak_mb': new[key]['peak_mb'],
+        })
+        rows.append(case)
+    return pd.DataFrame(rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the simulation, metrics and I/O hot paths.')
+    parser.add_argument('--full', action='store_true', help='sweep up to 10M portfolios and 1000 assets')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='JSON file to write, defaults to benchmark_results/<time>-<commit>.json')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two saved JSON runs')
+    args = parser.parse_args()
+
+    set_display_options()
+    pd.set_option('display.float_format', '{:.4g}'.format)
+
+    if args.compare:
+        print(compare_results(*args.compare).to_string(index=False))
+        return
+
+    sweep = FULL_SWEEP if args.full else QUICK_SWEEP
+    results = run_suite(**sweep, repeat=args.repeat)
+    print(pd.DataFrame(results).to_string(index=False))
+    print(f"Saved to {save_results(results, args.output)}")
+
+
+if __name__ == '__main__':
+    main()
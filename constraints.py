@@ -0,0 +1,377 @@
+from config import *
+from dataclasses import dataclass, field
+
+"""
+Portfolio constraints for the Monte Carlo simulation.
+
+- PortfolioConstraints holds per-asset bounds (negative lower bounds allow shorting), sector
+  bounds on net exposure, a cardinality limit and a gross leverage limit.
+- ConstrainedSampler draws feasible portfolios directly instead of rejecting infeasible ones:
+  sector totals are drawn first, then the weights within each sector, both as a Dirichlet draw
+  above the lower bounds pulled towards a feasible centre just far enough to fit under the upper
+  bounds. Gross leverage is enforced the same way, pulling a portfolio towards a feasible one
+  without optional shorts.
+- PortfolioConstraints.feasible checks a whole weights matrix at once.
+
+"""
+
+
+@dataclass
+class PortfolioConstraints:
+    symbols: list
+    lower: np.ndarray                                       # Per-asset min weight, < 0 allows shorting
+    upper: np.ndarray                                       # Per-asset max weight
+    sectors: np.ndarray = None                              # Sector label per asset, None for no sectors
+    sector_bounds: dict = field(default_factory=dict)       # Sector -> (min, max) net weight
+    max_assets: int = None                                  # Max number of non-zero weights
+    max_gross: float = None                                 # Max sum of |weights|, e.g. 1.6 for 130/30
+    budget: float = 1.0                                     # Weights sum to budget
+
+    @classmethod
+    def from_spec(cls, symbols, bounds=None, default_bounds=(0.0, 1.0), sectors=None, sector_caps=None,
+                  max_assets=None, max_gross=None, budget=1.0):
+        """
+        Build constraints from plain dicts keyed by symbol / sector.
+
+        - bounds: {'AAPL': (0.05, 0.3)}, other symbols get default_bounds.
+        - sectors: {'AAPL': 'Tech', ...}; sector_caps: {'Tech': 0.5} caps the net weight of a sector,
+          or {'Tech': (0.1, 0.5)} also sets a minimum.
+        """
+        symbols = list(symbols)
+        bounds = bounds or {}
+        lower = np.array([bounds.get(symbol, default_bounds)[0] for symbol in symbols], dtype=float)
+        upper = np.array([bounds.get(symbol, default_bounds)[1] for symbol in symbols], dtype=float)
+
+        sector_bounds = {}
+        for sector, cap in (sector_caps or {}).items():
+            sector_bounds[sector] = tuple(cap) if np.ndim(cap) else (-np.inf, cap)
+        labels = np.array([sectors.get(symbol) for symbol in symbols], dtype=object) if sectors else None
+
+        constraints = cls(symbols, lower, upper, labels, sector_bounds, max_assets, max_gross, budget)
+        constraints.validate()
+        return constraints
+
+    def _groups(self):
+        """
+        Group index per asset, (min, max) per group and the (num_of_symbols, num_of_groups) membership
+        matrix, so group totals are one matrix product. Assets without a sector share an unbounded group.
+        """
+        labels = self.sectors if self.sectors is not None else np.full(len(self.symbols), None, dtype=object)
+        names = list(dict.fromkeys(labels))
+        group = np.array([names.index(label) for label in labels])
+        bounds = np.array([self.sector_bounds.get(name, (-np.inf, np.inf)) for name in names], dtype=float)
+        return group, bounds, np.eye(len(names))[group]
+
+    def validate(self):
+        """ Raise ValueError for constraints no portfolio can satisfy """
+        problems = []
+        if np.any(self.lower > self.upper):
+            problems.append("a lower bound is above its upper bound")
+        if not self.lower.sum() <= self.budget <= self.upper.sum():
+            problems.append(f"the bounds cannot sum to {self.budget}")
+        _, bounds, membership = self._groups()
+        low = np.maximum(self.lower @ membership, bounds[:, 0])
+        high = np.minimum(self.upper @ membership, bounds[:, 1])
+        if np.any(low > high) or not low.sum() <= self.budget <= high.sum():
+            problems.append("the sector bounds cannot be met")
+        mandatory = np.sum((self.lower > 0) | (self.upper < 0))
+        if self.max_assets is not None and mandatory > self.max_assets:
+            problems.append(f"{mandatory} assets must be held but max_assets is {self.max_assets}")
+        if self.max_gross is not None and self.max_gross < abs(self.budget):
+            problems.append("max_gross is below the budget")
+        elif self.max_gross is not None and self.max_gross < self.budget + 2 * np.maximum(-self.upper, 0.0).sum():
+            problems.append("max_gross is below the gross leverage of the forced short positions")
+        if problems:
+            raise ValueError("Constraints are infeasible: " + '; '.join(problems))
+
+    def feasible(self, weights, tol=1e-9) -> np.ndarray:
+        """ Boolean mask of the rows of an (m, num_of_symbols) weights matrix that meet every constraint """
+        weights = np.atleast_2d(weights)
+        ok = np.abs(_row_sum(weights) - self.budget) <= tol
+        broken = weights < self.lower - tol
+        broken |= weights > self.upper + tol
+        if broken.any():
+            ok &= ~broken.any(axis=1)
+
+        if self.sector_bounds:
+            _, bounds, membership = self._groups()
+            # One row per sector, so the checks run down a few long rows
+            totals = membership.T @ weights.T
+            ok &= np.all((totals >= bounds[:, :1] - tol) & (totals <= bounds[:, 1:] + tol), axis=0)
+        if self.max_assets is not None:
+            held = weights > tol
+            held |= weights < -tol
+            ok &= np.count_nonzero(held, axis=1) <= self.max_assets
+        if self.max_gross is not None:
+            ok &= _row_sum(np.abs(weights)) <= self.max_gross + tol
+        return ok
+
+
+def _row_sum(a):
+    # A matrix product is several times faster than sum(axis=1)
+    return a @ np.ones(a.shape[1])
+
+
+def _ratio(a, b):
+    """ a / b, with 0 where b is 0 """
+    return np.divide(a, b, out=np.zeros(np.broadcast_shapes(np.shape(a), np.shape(b))), where=b != 0)
+
+
+def _step(excess, fill):
+    """
+    How far to go from the centre towards the draw: the largest t <= 1 with t * excess <= 1 - fill,
+    excess being the draw's largest overshoot of the centre in units of (upper - lower).
+    """
+    room = np.maximum(1.0 - fill, 0.0)     # fill can round to a hair above 1
+    t = np.ones(np.broadcast_shapes(np.shape(excess), np.shape(room)))
+    np.divide(room, excess, out=t, where=excess > room)
+    return t
+
+
+def _capped_dirichlet(gammas, lower, upper, budget):
+    """
+    Dirichlet point above lower (shares proportional to gammas), pulled in a straight line towards the
+    centre lower + fill * (upper - lower) just far enough to fit under upper.
+
+    - One portfolio per column, so that the few parts of each (e.g. sector totals) are contiguous rows.
+    - The centre spreads what the budget leaves above the lower bounds in proportion to the room below
+      the upper bounds, so it is feasible whenever the portfolio can be. The pull keeps the sum and the
+      lower bounds, and leaves the draws that already fit alone. Unlike a Euclidean projection, which
+      needs a root search per portfolio, the distance is one ratio.
+    """
+    spread = upper - lower
+    gammas = gammas * (spread > 0)     # Pinned parts take no share
+    room = budget - lower.sum(axis=0)
+    fill = _ratio(room, spread.sum(axis=0))
+    scale = _ratio(room, gammas.sum(axis=0))
+    t = _step(scale * _ratio(gammas, spread).max(axis=0) - fill, fill)
+    return lower + (t * scale) * gammas + ((1.0 - t) * fill) * spread
+
+
+class ConstrainedSampler:
+    """
+    Feasible weights for PortfolioConstraints, without rejection.
+
+    - alpha is the Dirichlet concentration of the draws above the lower bounds; with the default
+      long-only constraints and alpha=1 this is the same as DirichletSampler.
+    - check=True verifies every batch with PortfolioConstraints.feasible.
+    - The weights are drawn one portfolio per column and returned transposed, so the array is
+      Fortran-ordered; np.ascontiguousarray it if something needs C order.
+    - Pass it as sampler= to monte_carlo_simulation / adaptive_monte_carlo_simulation; the symbols must be
+      in the same order as the return statistics. Don't combine it with refine=True, the local draws
+      around the best portfolio ignore the constraints.
+    """
+    name = 'constrained'
+
+    def __init__(self, constraints: PortfolioConstraints, alpha=1.0, check=True, max_attempts=100):
+        constraints.validate()
+        self.constraints = constraints
+        self.alpha = alpha
+        self.check = check
+        self.max_attempts = max_attempts
+
+        # Portfolios are drawn one per column with the assets sorted by sector, so every sector is a slice
+        # of contiguous rows and the sums over a portfolio run along axis 0
+        group, self._group_bounds, membership = constraints._groups()
+        self._order = np.argsort(group, kind='stable')
+        self._inverse = np.argsort(self._order)
+        self._permuted = np.any(self._order != np.arange(len(self._order)))
+        self._membership = membership[self._order]
+        stops = np.cumsum(np.bincount(group))
+        self._sectors = [slice(start, stop) for start, stop in zip(np.concatenate([[0], stops[:-1]]), stops)]
+        lower = constraints.lower[self._order]
+        # No weight can go above its lower bound plus everything the other lower bounds leave over
+        upper = np.minimum(constraints.upper, constraints.lower + constraints.budget - constraints.lower.sum())[self._order]
+        self._forced = (lower > 0) | (upper < 0)
+        self._lower, self._upper = lower[:, None], upper[:, None]
+
+    @property
+    def max_gross(self):
+        """ Upper bound on the gross leverage (sum of |weights|) of the sampled portfolios """
+        c = self.constraints
+        # The shorts can't exceed the negative lower bounds, and the longs cover them plus the budget
+        gross = min(np.maximum(np.abs(c.lower), np.abs(c.upper)).sum(),
+                    abs(c.budget) + 2 * np.maximum(-c.lower, 0.0).sum())
+        return gross if c.max_gross is None else min(gross, c.max_gross)
+
+    def _holdings(self, rng, size):
+        """ Row indices of the assets each portfolio holds under max_assets, or None when that is all of them """
+        c = self.constraints
+        free, forced = np.flatnonzero(~self._forced), np.flatnonzero(self._forced)
+        choose = c.max_assets - len(forced) if c.max_assets is not None else len(free)
+        if choose >= len(free):
+            return None
+
+        # Floyd's algorithm, vectorised over the portfolios: a uniformly random subset in min(choose, rest) draws
+        picks = min(choose, len(free) - choose)
+        chosen = np.empty((picks, size), dtype=np.intp)
+        for i, j in enumerate(range(len(free) - picks, len(free))):
+            pick = rng.integers(0, j + 1, size=size)
+            pick[(chosen[:i] == pick).any(axis=0)] = j
+            chosen[i] = pick
+        if picks < choose:
+            # Picked the ones to leave out
+            held = np.ones((size, len(free)), dtype=bool)
+            held[np.arange(size), chosen] = False
+            chosen = np.nonzero(held)[1].reshape(size, choose).T
+        return np.vstack([free[chosen], np.repeat(forced[:, None], size, axis=1)])
+
+    def _gammas(self, rng, shape):
+        if self.alpha == 1.0:
+            return rng.standard_exponential(size=shape)
+        return rng.standard_gamma(self.alpha, size=shape)
+
+    def _by_sector(self, ufunc, a):
+        """ ufunc.reduce over the rows of every sector, one row per sector """
+        out = np.empty((len(self._sectors),) + a.shape[1:])
+        for sector, rows in enumerate(self._sectors):
+            ufunc.reduce(a[rows], axis=0, out=out[sector])
+        return out
+
+    def _fill(self, gammas, held, lower, upper):
+        """
+        Sector totals first, then the weights within each sector, both _capped_dirichlet draws. Works in
+        place on gammas, which has to be zero for the assets that can't move or aren't held.
+        """
+        budget = float(self.constraints.budget)
+        spread = upper - lower
+        if held is None:
+            asset_lower = self._by_sector(np.add, lower)
+            asset_upper = self._by_sector(np.add, upper)
+        else:
+            bounds = np.hstack([lower * self._membership, upper * self._membership]).T @ held
+            asset_lower, asset_upper = np.split(bounds, 2)
+        group_lower = np.maximum(asset_lower, self._group_bounds[:, :1])
+        group_upper = np.minimum(asset_upper, self._group_bounds[:, 1:])
+        ok = np.all(group_lower <= group_upper, axis=0)
+        ok &= (group_lower.sum(axis=0) <= budget) & (budget <= group_upper.sum(axis=0))
+
+        # The gammas summed per sector are Gamma(alpha * held assets): the Dirichlet share of each sector,
+        # independent of the shares within it
+        shares = self._by_sector(np.add, gammas)
+        if len(self._sectors) == 1:
+            totals = budget
+        else:
+            totals = _capped_dirichlet(shares, group_lower, group_upper, budget)
+
+        # _capped_dirichlet within every sector at once
+        room = totals - asset_lower
+        scale = _ratio(room, shares)
+        if np.all(np.max(room, axis=1) <= self._by_sector(np.minimum, spread)[:, 0]):
+            # No sector has room to take any weight past its upper bound: the Dirichlet points all fit
+            for sector, rows in enumerate(self._sectors):
+                gammas[rows] *= scale[sector]
+            if lower.any():
+                gammas += lower
+        else:
+            self._pull(gammas, lower, spread, scale, _ratio(room, asset_upper - asset_lower))
+        if held is not None:
+            gammas *= held
+        return gammas, ok
+
+    def _pull(self, gammas, lower, spread, scale, fill):
+        """ The within-sector weights lower + scale * gammas, pulled towards the centre of each sector, in place """
+        sector_lower = self._by_sector(np.maximum, lower)
+        sector_spread = self._by_sector(np.maximum, spread)
+        if all((lower[rows] == sector_lower[sector]).all() and (spread[rows] == sector_spread[sector]).all()
+               for sector, rows in enumerate(self._sectors)):
+            # The same bounds throughout every sector (e.g. default_bounds) factor out per sector
+            t = _step(_ratio(scale, sector_spread) * self._by_sector(np.maximum, gammas) - fill, fill)
+            centre = (1.0 - t) * fill * sector_spread + sector_lower
+            for sector, rows in enumerate(self._sectors):
+                gammas[rows] *= t[sector] * scale[sector]
+                gammas[rows] += centre[sector]
+            return
+
+        t = _step(scale * self._by_sector(np.maximum, gammas * _ratio(1.0, spread)) - fill, fill)
+        centre = (1.0 - t) * fill
+        for sector, rows in enumerate(self._sectors):
+            gammas[rows] *= t[sector] * scale[sector]
+            gammas[rows] += spread[rows] * centre[sector]
+        if lower.any():
+            gammas += lower
+
+    def _limit_gross(self, weights, anchor):
+        """ Pull every portfolio towards anchor, in place, until its gross leverage fits """
+        max_gross = self.constraints.max_gross
+        # Asset by asset, without a full size temporary
+        gross = np.zeros(weights.shape[1])
+        for row in weights:
+            gross += np.abs(row)
+        over = gross > max_gross
+        if over.any():
+            anchor_gross = np.broadcast_to(np.abs(anchor).sum(axis=0), gross.shape)
+            step = np.ones(len(gross))
+            step[over] = (max_gross - anchor_gross[over]) / (gross[over] - anchor_gross[over])
+            weights -= anchor
+            weights *= step
+            weights += anchor
+
+    def _draw_held(self, rng, index):
+        """ _draw for max_assets without sectors: only the held assets are drawn, then spread out """
+        c = self.constraints
+        lower, upper = self._lower[index, 0], self._upper[index, 0]
+        ok = (lower.sum(axis=0) <= c.budget) & (c.budget <= upper.sum(axis=0))
+        weights = _capped_dirichlet(self._gammas(rng, lower.shape), lower, upper, c.budget)
+        if c.max_gross is not None:
+            anchor_lower = np.minimum(np.maximum(lower, 0.0), upper)
+            ok &= anchor_lower.sum(axis=0) <= c.budget
+            self._limit_gross(weights, _capped_dirichlet(np.ones(lower.shape), anchor_lower, upper, c.budget))
+
+        full = np.zeros((len(self._lower), index.shape[1]))
+        np.put_along_axis(full, index, weights, axis=0)
+        return full, ok
+
+    def _draw(self, rng, size):
+        c = self.constraints
+        index = self._holdings(rng, size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # Portfolios that can't meet the bounds with their holdings come out as garbage, and are drawn again
+            if index is not None and len(self._sectors) == 1:
+                return self._draw_held(rng, index)
+
+            held = None
+            if index is not None:
+                held = np.zeros((len(self._lower), size), dtype=bool)
+                np.put_along_axis(held, index, True, axis=0)
+            gammas = self._gammas(rng, (len(self._lower), size))
+            movable = self._upper > self._lower
+            if not movable.all():
+                gammas *= movable
+            if held is not None:
+                gammas *= held
+            weights, ok = self._fill(gammas, held, self._lower, self._upper)
+
+            if c.max_gross is not None:
+                # Pull each portfolio towards one with the same holdings and no optional shorts (assets whose
+                # upper bound is negative stay at it) until gross leverage fits. Without max_assets every
+                # portfolio holds everything and shares one anchor
+                anchor_lower = np.minimum(np.maximum(self._lower, 0.0), self._upper)
+                equal = (self._upper > anchor_lower) * (1.0 if held is None else held)
+                anchor, anchor_ok = self._fill(equal, held, anchor_lower, self._upper)
+                ok = ok & anchor_ok
+                self._limit_gross(weights, anchor)
+        return weights, np.broadcast_to(ok, (size,)).copy()
+
+    def __call__(self, rng, size, num_of_symbols):
+        if num_of_symbols != len(self.constraints.symbols):
+            raise ValueError(f"Constraints are for {len(self.constraints.symbols)} symbols, got {num_of_symbols}")
+        weights, ok = self._draw(rng, size)
+        # Only a random choice of holdings that can't meet the sector bounds needs another draw
+        for _ in range(self.max_attempts):
+            if ok.all():
+                break
+            redraw, redraw_ok = self._draw(rng, int((~ok).sum()))
+            weights[:, ~ok], ok[~ok] = redraw, redraw_ok
+        if not ok.all():
+            raise RuntimeError("Could not draw holdings that meet the sector bounds, loosen max_assets or the sector bounds")
+
+        if self._permuted:
+            weights = weights[self._inverse]
+        # The transpose is a view: one row per portfolio, without copying
+        weights = weights.T
+        if self.check:
+            feasible = self.constraints.feasible(weights, tol=1e-8)
+            if not feasible.all():
+                raise RuntimeError(f"{int((~feasible).sum())} sampled portfolios break the constraints")
+        return weights
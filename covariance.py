@@ -0,0 +1,128 @@
+from config import *
+
+"""
+Covariance estimators for the return statistics.
+
+- An estimator is called as estimator(log_return) with the daily log returns and returns
+  (cov, factors): the daily covariance matrix, and for factor models a (loadings, specific_var)
+  pair such that cov = loadings @ loadings.T + diag(specific_var), otherwise None.
+- SampleCovariance is the original log_return.cov(). With many assets and a short history it is
+  noisy or singular, the other estimators trade a little bias for a well conditioned matrix.
+- Apart from the sample covariance, missing returns (e.g. before an asset listed) count as the
+  asset's mean return.
+
+"""
+
+
+def _demeaned(log_return: pd.DataFrame) -> np.ndarray:
+    values = log_return.to_numpy(dtype=float)
+    values = values - np.nanmean(values, axis=0)
+    return np.nan_to_num(values, nan=0.0)
+
+
+class SampleCovariance:
+    name = 'sample'
+
+    @property
+    def key(self):
+        return self.name
+
+    def __call__(self, log_return):
+        # pct_change() leaves an all-NaN first row; without it a complete (preprocessed) panel
+        # takes pandas' np.cov path instead of the much slower pairwise NaN handling
+        return log_return.dropna(how='all').cov().to_numpy(), None
+
+
+class LedoitWolfCovariance:
+    """
+    Ledoit-Wolf shrinkage of the sample covariance towards a scaled identity (sklearn.covariance).
+    """
+    name = 'ledoit_wolf'
+
+    @property
+    def key(self):
+        return self.name
+
+    def __call__(self, log_return):
+        from sklearn.covariance import ledoit_wolf
+
+        cov, _ = ledoit_wolf(_demeaned(log_return), assume_centered=True)
+        return cov, None
+
+
+class EWMACovariance:
+    """
+    Exponentially weighted covariance, the weight of a day halving every halflife trading days.
+    """
+    name = 'ewma'
+
+    def __init__(self, halflife=63):
+        self.halflife = halflife
+
+    @property
+    def key(self):
+        return f"{self.name}-{self.halflife}"
+
+    def __call__(self, log_return):
+        values = log_return.to_numpy(dtype=float)
+        age = np.arange(len(values))[::-1]
+        weights = 0.5 ** (age / self.halflife)
+        weights /= weights.sum()
+
+        mean = np.nansum(values * weights[:, None], axis=0)
+        centered = np.nan_to_num(values - mean, nan=0.0)
+        cov = (centered * weights[:, None]).T @ centered
+        # Same bias correction as pandas' ewm().cov()
+        return cov / (1.0 - np.sum(weights ** 2)), None
+
+
+class FactorCovariance:
+    """
+    K-factor statistical (PCA) model: the top n_factors principal components of the returns are the
+    common factors, and what they leave of each asset's variance is its specific variance.
+
+    - Portfolio variance is then ||w B||^2 + sum(w^2 D), O(n K) per portfolio instead of O(n^2).
+    """
+    name = 'factor'
+
+    def __init__(self, n_factors=5):
+        self.n_factors = n_factors
+
+    @property
+    def key(self):
+        return f"{self.name}-{self.n_factors}"
+
+    def __call__(self, log_return):
+        centered = _demeaned(log_return)
+        n_days = len(centered)
+
+        # Thin SVD of the (days, assets) returns: no (assets, assets) matrix is formed to find the factors
+        _, singular_values, components = np.linalg.svd(centered, full_matrices=False)
+        k = min(self.n_factors, len(singular_values))
+        loadings = components[:k].T * (singular_values[:k] / np.sqrt(n_days - 1))
+
+        total_var = np.sum(centered ** 2, axis=0) / (n_days - 1)
+        # Keep a small floor so the covariance stays positive definite
+        specific_var = np.maximum(total_var - np.sum(loadings ** 2, axis=1), 1e-6 * total_var.mean())
+
+        cov = loadings @ loadings.T + np.diag(specific_var)
+        return cov, (loadings, specific_var)
+
+
+COVARIANCE_ESTIMATORS = {
+    estimator.name: estimator for estimator in (SampleCovariance, LedoitWolfCovariance, EWMACovariance, FactorCovariance)
+}
+
+
+def get_covariance_estimator(covariance=None, **kwargs):
+    """
+    Estimator from a name in COVARIANCE_ESTIMATORS (with constructor kwargs), an existing estimator,
+    or None for the sample covariance.
+    """
+    if covariance is None:
+        return SampleCovariance()
+    if isinstance(covariance, str):
+        if covariance not in COVARIANCE_ESTIMATORS:
+            raise ValueError(f"Unknown covariance estimator '{covariance}', expected one of {list(COVARIANCE_ESTIMATORS)}")
+        return COVARIANCE_ESTIMATORS[covariance](**kwargs)
+    return covariance
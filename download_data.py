@@ -1,47 +1,251 @@
 from config import *
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
+from instrumentation import count, stage, timed
+from price_store import load_prices, save_prices
 
-# Our different Stock symbols
-symbols = ['AAPL', 'MSFT', 'TSLA', 'AMZN', 'AMD', 'DASH']
 
-number_of_symbols = len(symbols)
+"""
+Below are functions for Streamlit app.
+
+"""
+
+
+SYMBOL_CACHE_DIR = pathlib.Path('data/symbol_cache')
 
-# If we don't have the data, download it from Yahoo Finance   --- Later change this to a function so we can download and change symbols for GUI 
-if not pathlib.Path('stock_data.csv').exists():
 
-    # Download the data
-    data = yf.download(symbols, start='2020-03-20', end='2022-01-01', group_by='ticker')
-    data.to_csv(
-        'stock_data.csv',
-        index=True)
+class YahooFinanceProvider:
+    """
+    Fetch one symbol from Yahoo Finance, as a DataFrame with one column per price field.
 
+    - A range without any rows is returned as an empty frame; only real failures raise.
+    """
 
-    price_data_frame: pd.DataFrame = data
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        import yfinance as yf
+        from yfinance.exceptions import YFPricesMissingError
+
+        # Ticker.history is what yf.download runs per symbol, but it raises instead of swallowing errors into
+        # module globals (which concurrent downloads would also overwrite for each other)
+        with stage('download.fetch', symbol=symbol):
+            try:
+                data = yf.Ticker(symbol).history(start=start_date, end=end_date, auto_adjust=True, actions=False,
+                                                 raise_errors=True)
+            except YFPricesMissingError:
+                # Yahoo answered, there just are no rows: before listing, after delisting or no trading days
+                data = pd.DataFrame()
+        count('download.symbols')
+        if not data.empty:
+            # As yf.download does for daily data
+            data.index = data.index.tz_localize(None)
+        return data
+
+
+class LocalPriceProvider:
+    """
+    Serve symbols out of an existing raw (Ticker, Price) multi-index frame, e.g. an uploaded file.
+
+    - No network access, so it can stand in for Yahoo Finance offline.
+    """
 
-else:
-    # Load the existing CSV file
-    price_data_frame: pd.DataFrame = pd.read_csv('stock_data.csv')
+    def __init__(self, price_df: pd.DataFrame):
+        self.price_df = price_df
 
-print(price_data_frame.head())
+    def fetch(self, symbol: str, start_date: str, end_date: str) -> pd.DataFrame:
+        if symbol not in self.price_df.columns.get_level_values(0):
+            raise ValueError(f"{symbol} is not in the local price data")
+        data = self.price_df[symbol]
+        return data.loc[(data.index >= start_date) & (data.index < end_date)]
 
 
 """
-Below are functions for Streamlit app.
+Per-symbol cache
+
+- data/symbol_cache/<symbol>.feather holds every row fetched so far for a symbol.
+- data/symbol_cache/coverage.json records which [start, end) date ranges have been fetched,
+  so ranges without trading days (e.g. before a listing) are not fetched again.
+- A range is only recorded up to today and the day after its last returned row: days that have not
+  traded yet, or whose prices are not out yet, are fetched again next time.
 
 """
 
+def _load_coverage(cache_dir):
+    path = pathlib.Path(cache_dir) / 'coverage.json'
+    if not path.exists():
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_coverage(coverage, cache_dir):
+    with open(pathlib.Path(cache_dir) / 'coverage.json', 'w') as f:
+        json.dump(coverage, f, indent=2, sort_keys=True)
+
+
+def _add_range(ranges, start_date, end_date):
+    """ Insert [start_date, end_date) into a list of ranges, merging overlapping or touching ones """
+    merged = []
+    for start, end in sorted(ranges + [[start_date, end_date]]):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def _missing_ranges(ranges, start_date, end_date):
+    """ The parts of [start_date, end_date) not covered by ranges (ISO date strings compare in order) """
+    missing = []
+    cursor = start_date
+    for start, end in sorted(ranges):
+        if end <= cursor or start >= end_date:
+            continue
+        if start > cursor:
+            missing.append((cursor, start))
+        cursor = max(cursor, end)
+        if cursor >= end_date:
+            break
+    if cursor < end_date:
+        missing.append((cursor, end_date))
+    return missing
+
+
+def _covered_end(gap_end, frame):
+    """ End of the part of a fetched [gap_start, gap_end) range that is final, see above """
+    end = min(gap_end, pd.Timestamp.today().strftime('%Y-%m-%d'))
+    if not frame.empty:
+        end = min(end, (frame.index.max() + pd.Timedelta(days=1)).strftime('%Y-%m-%d'))
+    return end
+
+
+def _symbol_path(symbol, cache_dir):
+    return pathlib.Path(cache_dir) / f"{symbol}.feather"
+
+
+def _merge_into_cache(symbol, frames, cache_dir):
+    path = _symbol_path(symbol, cache_dir)
+    if path.exists():
+        frames = [load_prices(path)] + frames
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return
+    merged = pd.concat(frames).sort_index()
+    merged = merged[~merged.index.duplicated(keep='last')]
+    save_prices(merged, path)
+
+
+def _fetch_with_retry(provider, symbol, start_date, end_date, retries=3, backoff=1.0):
+    for attempt in range(retries + 1):
+        try:
+            return provider.fetch(symbol, start_date, end_date)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+
+def download_missing_data(symbols: list, start_date: str, end_date: str, provider=None,
+                          cache_dir=SYMBOL_CACHE_DIR, max_workers=8, retries=3, backoff=1.0):
+    """
+    Fetch only the (symbol, date range) gaps not already in the per-symbol cache.
 
-# Create a function to do the above
-def get_stock_data(symbols: list, start_date: str, end_date: str, save_path='data/stock_data.csv') -> pd.DataFrame:
+    - Gaps are fetched concurrently on a bounded thread pool, each retried with exponential backoff.
+      A gap with no rows (e.g. before a symbol was listed) is not a failure and is not retried.
+    - Successful fetches are merged into the cache even if other symbols fail; failures are raised
+      together at the end.
+    """
+    provider = provider or YahooFinanceProvider()
+    pathlib.Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    coverage = _load_coverage(cache_dir)
+
+    gaps = [
+        (symbol, gap_start, gap_end)
+        for symbol in symbols
+        for gap_start, gap_end in _missing_ranges(coverage.get(symbol, []), start_date, end_date)
+    ]
+
+    fetched, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_fetch_with_retry, provider, symbol, gap_start, gap_end, retries, backoff): (symbol, gap_start, gap_end)
+            for symbol, gap_start, gap_end in gaps
+        }
+        for future in as_completed(futures):
+            symbol, gap_start, gap_end = futures[future]
+            try:
+                fetched.setdefault(symbol, []).append((gap_start, gap_end, future.result()))
+            except Exception as e:
+                errors.setdefault(symbol, []).append(f"{gap_start} to {gap_end}: {e}")
+
+    # Cache writes happen here, on the calling thread, one file per symbol
+    for symbol, results in fetched.items():
+        _merge_into_cache(symbol, [frame for _, _, frame in results], cache_dir)
+        for gap_start, gap_end, frame in results:
+            covered_end = _covered_end(gap_end, frame)
+            if covered_end > gap_start:
+                coverage[symbol] = _add_range(coverage.get(symbol, []), gap_start, covered_end)
+    _save_coverage(coverage, cache_dir)
+
+    if errors:
+        details = '; '.join(f"{symbol} ({', '.join(failures)})" for symbol, failures in errors.items())
+        raise RuntimeError(f"Failed to download {len(errors)} symbol(s): {details}")
+
+
+@timed('download')
+def get_stock_data(symbols: list, start_date: str, end_date: str, save_path='data/stock_data.feather',
+                   provider=None, cache_dir=SYMBOL_CACHE_DIR, max_workers=8) -> pd.DataFrame:
     """
-    Download stock data from Yahoo Finance and save it to a CSV file.
+    Download stock data from Yahoo Finance and save it to the price store.
 
-    - We will do this under the data/stock_data.csv folder when working with the GUI.
+    - We will do this under the data/stock_data.feather file when working with the GUI.
+    - Only data missing from the per-symbol cache is downloaded, see download_missing_data.
+    - The result has the same (Ticker, Price) multi-index columns as yf.download(group_by='ticker').
     """
+    download_missing_data(symbols, start_date, end_date, provider=provider, cache_dir=cache_dir, max_workers=max_workers)
 
-    data = yf.download(symbols, start=start_date, end=end_date, group_by='ticker')
-    data.to_csv(save_path, index=True)
+    frames = {}
+    for symbol in symbols:
+        path = _symbol_path(symbol, cache_dir)
+        if path.exists():
+            cached = load_prices(path)
+            frames[symbol] = cached.loc[(cached.index >= start_date) & (cached.index < end_date)]
+    if not frames:
+        raise RuntimeError(f"No price data for {', '.join(symbols)} between {start_date} and {end_date}")
+
+    data = pd.concat(frames, axis=1, names=['Ticker', 'Price'])
+    save_prices(data, save_path)
 
     return data
 
 
+"""
+Script: python download_data.py
+
+"""
+
+# Our different Stock symbols
+symbols = ['AAPL', 'MSFT', 'TSLA', 'AMZN', 'AMD', 'DASH']
+
+number_of_symbols = len(symbols)
+
+
+def main():
+    set_display_options()
+
+    # If we don't have the data, download it from Yahoo Finance
+    if not pathlib.Path('stock_data.feather').exists():
+
+        # Download the data
+        price_data_frame: pd.DataFrame = get_stock_data(symbols, '2020-03-20', '2022-01-01', save_path='stock_data.feather')
+
+    else:
+        # Load the existing price store
+        price_data_frame: pd.DataFrame = load_prices('stock_data.feather')
+
+    print(price_data_frame.head())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,165 @@
+from config import *
+from collections import deque
+
+from return_stats import ReturnStats, cholesky_or_none
+
+"""
+Incremental return statistics.
+
+- Keeps the running count, mean and co-moment matrix of the daily log returns (Welford / Chan et al.),
+  so appending or evicting rows costs O(num_of_symbols^2) per row instead of a full recompute.
+- Rows with any NaN are skipped: the statistics are complete-case, unlike pandas' pairwise .cov().
+
+"""
+
+
+def _batch_moments(rows):
+    count = len(rows)
+    mean = rows.mean(axis=0)
+    centred = rows - mean
+    return count, mean, centred.T @ centred
+
+
+class IncrementalReturnStats:
+    """
+    Running mean and covariance of daily log returns, optionally over a rolling window of rows.
+
+    - The rows in the window (all of them without one) are kept for to_return_stats.
+    """
+
+    def __init__(self, symbols, window=None):
+        self.symbols = list(symbols)
+        self.window = window
+        num_of_symbols = len(self.symbols)
+
+        self.count = 0
+        self._mean = np.zeros(num_of_symbols)
+        self._comoment = np.zeros((num_of_symbols, num_of_symbols))
+
+        self.last_prices = None
+        self.last_date = None
+        # The rows themselves are kept too: a window evicts from them, and snapshots replay them (metrics, bootstrap)
+        self.rows = deque()
+        self.dates = deque()
+
+    @classmethod
+    def from_prices(cls, processed_df: pd.DataFrame, window=None):
+        stats = cls(processed_df.columns, window=window)
+        stats.append_prices(processed_df)
+        return stats
+
+    def _merge(self, rows):
+        if len(rows) == 1:
+            # Plain Welford update, a single outer product
+            self.count += 1
+            delta = rows[0] - self._mean
+            self._mean = self._mean + delta / self.count
+            self._comoment += np.outer(delta, rows[0] - self._mean)
+            return
+
+        count_b, mean_b, comoment_b = _batch_moments(rows)
+        count = self.count + count_b
+        delta = mean_b - self._mean
+        self._mean = self._mean + delta * count_b / count
+        self._comoment = self._comoment + comoment_b + np.outer(delta, delta) * self.count * count_b / count
+        self.count = count
+
+    def _unmerge(self, rows):
+        count_b, mean_b, comoment_b = _batch_moments(rows)
+        count = self.count - count_b
+        if count <= 0:
+            self.count = 0
+            self._mean[:] = 0.0
+            self._comoment[:] = 0.0
+            return
+        if len(rows) == 1:
+            # Welford update in reverse
+            mean = self._mean - (rows[0] - self._mean) / count
+            self._comoment -= np.outer(rows[0] - mean, rows[0] - self._mean)
+            self._mean = mean
+            self.count = count
+            return
+
+        mean = (self.count * self._mean - count_b * mean_b) / count
+        delta = mean_b - mean
+        self._comoment = self._comoment - comoment_b - np.outer(delta, delta) * count * count_b / self.count
+        self._mean = mean
+        self.count = count
+
+    def push_returns(self, rows: np.ndarray, dates=()):
+        """
+        NumPy level version of append_returns for a (rows, num_of_symbols) array without NaNs.
+        """
+        rows = np.atleast_2d(rows)
+        if not len(rows):
+            return
+
+        self._merge(rows)
+        self.rows.extend(rows)
+        self.dates.extend(dates if len(dates) else [None] * len(rows))
+        if self.window is not None:
+            excess = len(self.rows) - self.window
+            if excess > 0:
+                evicted = np.array([self.rows.popleft() for _ in range(excess)])
+                for _ in range(excess):
+                    self.dates.popleft()
+                self._unmerge(evicted)
+        if len(dates):
+            self.last_date = dates[-1]
+
+    def append_returns(self, log_return: pd.DataFrame):
+        """
+        Fold new rows of daily log returns in, evicting the oldest rows beyond the window.
+        """
+        log_return = log_return[self.symbols].dropna()
+        self.push_returns(log_return.to_numpy(dtype=float), log_return.index)
+
+    def append_prices(self, new_prices: pd.DataFrame):
+        """
+        Fold new rows of cleaned prices in. Rows at or before the last seen date are ignored,
+        so the full refreshed price frame can be passed in directly.
+        """
+        new_prices = new_prices[self.symbols]
+        if self.last_date is not None:
+            new_prices = new_prices.loc[new_prices.index > self.last_date]
+        if new_prices.empty:
+            return
+
+        prices = new_prices.to_numpy(dtype=float)
+        if self.last_prices is not None:
+            prices = np.vstack([self.last_prices, prices])
+            index = new_prices.index
+        else:
+            index = new_prices.index[1:]
+
+        log_return = pd.DataFrame(np.log(prices[1:] / prices[:-1]), index=index, columns=self.symbols)
+        self.last_prices = prices[-1]
+        self.append_returns(log_return)
+        self.last_date = new_prices.index[-1]
+
+    @property
+    def mean(self) -> np.ndarray:
+        """ Annualised expected returns """
+        return self._mean * 252
+
+    @property
+    def cov(self) -> np.ndarray:
+        """ Annualised covariance matrix (ddof=1, like pandas) """
+        if self.count < 2:
+            return np.full_like(self._comoment, np.nan)
+        return self._comoment / (self.count - 1) * 252
+
+    def to_return_stats(self) -> ReturnStats:
+        """
+        Snapshot as a ReturnStats, so it can be passed straight to the simulation and metrics.
+        """
+        log_return = pd.DataFrame(list(self.rows), index=list(self.dates), columns=self.symbols)
+        cov = self.cov
+        return ReturnStats(
+            fingerprint=f"incremental-{id(self)}-{self.count}-{self.last_date}",
+            symbols=self.symbols,
+            log_return=log_return,
+            mean=self.mean,
+            cov=cov,
+            cov_chol=cholesky_or_none(cov),
+        )
@@ -0,0 +1,241 @@
+from config import *
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+"""
+Lightweight instrumentation for the pipeline stages.
+
+- with stage('simulation', items=n): times a block; items (e.g. portfolios) gives a rate per second.
+  count('stats.cache_hit') adds to a counter, e.g. bytes read or cache hits.
+- Everything is off by default: stage() then returns a shared no-op context and count() returns at
+  once, a flag check per call. Enable with enable() or the MC_INSTRUMENT=1 environment variable.
+- Per stage it keeps calls, total / max seconds, items per second and, with enable(trace_memory=True),
+  the peak Python memory (tracemalloc) allocated inside the stage. The process peak RSS is recorded
+  as well where the resource module exists.
+- Every finished stage is also logged as one JSON line on the 'instrumentation' logger, and
+  report() / write_report() give the totals for the Streamlit timing panel or a JSON file.
+- with capture() as captured: also records a block's stages and counters on their own, e.g. per batch
+  scenario, without resetting the process totals; report(captured) gives them.
+- profile() wraps a block in cProfile, or pyinstrument when it is installed and asked for.
+
+"""
+
+logger = logging.getLogger('instrumentation')
+
+_enabled = os.environ.get('MC_INSTRUMENT', '') not in ('', '0')
+_trace_memory = False
+_lock = threading.Lock()
+_local = threading.local()
+_stages = {}
+_counters = {}
+_captures = []          # Open capture() blocks, each {'stages': {...}, 'counters': {...}}
+_NULL = nullcontext()
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def enable(trace_memory=False):
+    """ Start recording. trace_memory also tracks peak Python allocations per stage (slower) """
+    global _enabled, _trace_memory
+    _enabled = True
+    _trace_memory = trace_memory
+    if trace_memory:
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+
+def disable():
+    global _enabled, _trace_memory
+    _enabled = False
+    if _trace_memory:
+        import tracemalloc
+        tracemalloc.stop()
+    _trace_memory = False
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+        _counters.clear()
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:     # Windows
+        return None
+    # ru_maxrss is KB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 ** 2 if sys.platform == 'darwin' else 1024)
+
+
+@contextmanager
+def _timed_stage(name, items, fields):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    frame = {'child_peak': 0}
+    if _trace_memory:
+        import tracemalloc
+        # The enclosing stage keeps the peak so far, then the peak restarts for this stage
+        if stack:
+            stack[-1]['child_peak'] = max(stack[-1]['child_peak'], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(frame)
+
+    start = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        seconds = time.perf_counter() - start
+        stack.pop()
+        event = {'stage': name, 'seconds': seconds, **fields}
+        if items is not None:
+            event['items'] = items
+            event['items_per_sec'] = items / seconds if seconds > 0 else None
+        if _trace_memory:
+            peak = max(frame['child_peak'], tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1]['child_peak'] = max(stack[-1]['child_peak'], peak)
+            event['peak_mb'] = peak / 1024 ** 2
+        event['rss_peak_mb'] = _peak_rss_mb()
+
+        with _lock:
+            for stages in [_stages] + [captured['stages'] for captured in _captures]:
+                totals = stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'items': 0, 'peak_mb': None})
+                totals['calls'] += 1
+                totals['seconds'] += seconds
+                totals['max_seconds'] = max(totals['max_seconds'], seconds)
+                totals['items'] += items or 0
+                if 'peak_mb' in event:
+                    totals['peak_mb'] = max(totals['peak_mb'] or 0.0, event['peak_mb'])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(event, default=str))
+
+
+def stage(name, items=None, **fields):
+    """
+    Context manager timing a pipeline stage when instrumentation is enabled, a no-op otherwise.
+
+    - items is the amount of work done (portfolios, rows, ...), reported as items_per_sec.
+    - fields are added to the stage's JSON log line.
+    """
+    if not _enabled:
+        return _NULL
+    return _timed_stage(name, items, fields)
+
+
+def timed(name=None):
+    """ Decorator version of stage(), named after the function by default """
+    def decorator(func):
+        stage_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _timed_stage(stage_name, None, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    """ Add value to a counter, e.g. count('prices.bytes_read', nbytes) """
+    if not _enabled:
+        return
+    with _lock:
+        for counters in [_counters] + [captured['counters'] for captured in _captures]:
+            counters[name] = counters.get(name, 0) + value
+
+
+@contextmanager
+def capture():
+    """ Record the stages and counters of a block on their own as well, for report(captured) """
+    captured = {'stages': {}, 'counters': {}}
+    with _lock:
+        _captures.append(captured)
+    try:
+        yield captured
+    finally:
+        with _lock:
+            _captures.remove(captured)
+
+
+def report(captured=None) -> dict:
+    """
+    {'stages': {name: totals}, 'counters': {...}, 'rss_peak_mb': ...} of everything recorded since reset(),
+    or only of a capture() block.
+    """
+    source = captured if captured is not None else {'stages': _stages, 'counters': _counters}
+    with _lock:
+        stages = {name: dict(totals) for name, totals in source['stages'].items()}
+        counters = dict(source['counters'])
+    for totals in stages.values():
+        totals['items_per_sec'] = totals['items'] / totals['seconds'] if totals['items'] and totals['seconds'] > 0 else None
+    return {'stages': stages, 'counters': counters, 'rss_peak_mb': _peak_rss_mb()}
+
+
+def report_frame() -> pd.DataFrame:
+    """ One row per stage, slowest first, for printing or st.dataframe """
+    stages = report()['stages']
+    frame = pd.DataFrame.from_dict(stages, orient='index')
+    if frame.empty:
+        return frame
+    frame.index.name = 'Stage'
+    return frame.sort_values('seconds', ascending=False)
+
+
+def write_report(path):
+    with open(path, 'w') as f:
+        json.dump(report(), f, indent=2, default=str)
+
+
+@contextmanager
+def profile(output=None, profiler='cprofile', sort='cumulative', limit=30):
+    """
+    Profile a block with cProfile (default) or pyinstrument.
+
+    - output: a .prof file for cProfile (snakeviz / pstats) or an .html file for pyinstrument;
+      None prints the top limit entries instead.
+    """
+    if profiler == 'pyinstrument':
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield profiler
+        finally:
+            profiler.stop()
+            if output is None:
+                print(profiler.output_text(unicode=True))
+            else:
+                with open(output, 'w') as f:
+                    f.write(profiler.output_html())
+        return
+
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        if output is None:
+            pstats.Stats(profiler).sort_stats(sort).print_stats(limit)
+        else:
+            profiler.dump_stats(output)
@@ -0,0 +1,205 @@
+from config import *
+import warnings
+
+"""
+Optional Numba kernel for the Monte Carlo simulation.
+
+- One parallel loop over blocks of BLOCK_SIZE portfolios: each block draws and normalises its weights
+  and computes their returns in one pass, projects them onto the covariance factor with a single BLAS
+  call while they are in cache, then computes volatility and Sharpe ratio, stores them and keeps the
+  running max Sharpe / min volatility in a last pass. Nothing larger than a block is allocated.
+- The covariance enters as a factor F with cov = F F.T + diag(specific): the Cholesky factor
+  (specific = 0) or a factor model's loadings. Non positive definite covariances use the NumPy path.
+- Random numbers come from a SplitMix64 stream per block seeded from np.random.SeedSequence(seed), so a
+  seed gives the same portfolios whatever the number of threads or chunk size. They are the same
+  distribution as the NumPy samplers but not the same draws.
+- 'uniform' (normalised uniforms, as UniformSampler) and 'dirichlet' with alpha=1 (normalised
+  exponentials) are supported. Anything else, or a missing numba, falls back to NumPy.
+- Portfolios are always scored in float64; float32 buffers only store the results in single precision.
+- Importing this module imports numba, so the simulation only imports it for engine='numba'. The
+  kernel is compiled on first use and cached on disk afterwards.
+
+"""
+
+BLOCK_SIZE = 2048
+
+try:
+    import numba
+    _unavailable = None
+except ImportError as e:
+    numba = None
+    _unavailable = str(e)
+
+
+if numba is not None:
+    @numba.njit(inline='always')
+    def _next_uniform(state):
+        # SplitMix64, returns (new state, a double in (0, 1))
+        state = state + np.uint64(0x9E3779B97F4A7C15)
+        z = state
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z = z ^ (z >> np.uint64(31))
+        return state, ((z >> np.uint64(11)) + 0.5) * (1.0 / 9007199254740992.0)
+
+    @numba.njit(parallel=True, cache=True, fastmath={'reassoc', 'contract'})
+    def _kernel(mean, factor, specific, risk_free_rate, exponential, block_seeds, block_size, first_block,
+                last_block, num_of_portfolios, ret_out, vol_out, sharpe_out, weights_out, store, store_weights,
+                best_index, best_value, best_weights):
+        num_of_symbols = mean.shape[0]
+        for b in numba.prange(first_block, last_block):
+            start = b * block_size
+            rows = min(start + block_size, num_of_portfolios) - start
+            slot = b - first_block
+
+            # Draw and normalise the block's weights, with their returns in the same pass
+            weights = np.empty((rows, num_of_symbols))
+            ret = np.empty(rows)
+            state = block_seeds[b]
+            for r in range(rows):
+                total = 0.0
+                for j in range(num_of_symbols):
+                    state, u = _next_uniform(state)
+                    u = -np.log(u) if exponential else u
+                    weights[r, j] = u
+                    total += u
+                scale = 1.0 / total
+                row_ret = 0.0
+                for j in range(num_of_symbols):
+                    weights[r, j] *= scale
+                    row_ret += weights[r, j] * mean[j]
+                ret[r] = row_ret
+
+            # w F F.T w + sum(w^2 specific); the block stays in cache for one BLAS call
+            projected = weights @ factor
+            best_sharpe, best_vol = -np.inf, np.inf
+            for r in range(rows):
+                var = 0.0
+                for f in range(projected.shape[1]):
+                    var += projected[r, f] * projected[r, f]
+                for j in range(num_of_symbols):
+                    var += weights[r, j] * weights[r, j] * specific[j]
+                vol = np.sqrt(var)
+                sharpe = (ret[r] - risk_free_rate) / vol
+
+                if store:
+                    ret_out[start + r] = ret[r]
+                    vol_out[start + r] = vol
+                    sharpe_out[start + r] = sharpe
+
+                # Running max Sharpe / min volatility of the block
+                if sharpe > best_sharpe:
+                    best_sharpe = sharpe
+                    best_index[slot, 0] = start + r
+                    best_value[slot, 0], best_value[slot, 1], best_value[slot, 2] = ret[r], vol, sharpe
+                    best_weights[slot, 0, :] = weights[r]
+                if vol < best_vol:
+                    best_vol = vol
+                    best_index[slot, 1] = start + r
+                    best_value[slot, 3], best_value[slot, 4], best_value[slot, 5] = ret[r], vol, sharpe
+                    best_weights[slot, 1, :] = weights[r]
+
+            if store_weights:
+                for j in range(num_of_symbols):
+                    for r in range(rows):
+                        weights_out[j, start + r] = weights[r, j]
+
+
+def jit_available() -> bool:
+    return numba is not None
+
+
+def _sampler_mode(sampler):
+    """ Whether a sampler draws exponentials (True) or uniforms (False), None if the kernel can't run it """
+    name = sampler if isinstance(sampler, str) or sampler is None else getattr(sampler, 'name', None)
+    if name in (None, 'uniform'):
+        return False
+    if name == 'dirichlet' and getattr(sampler, 'alpha', 1.0) == 1.0:
+        return True
+    return None
+
+
+def jit_supported(stats, sampler=None) -> bool:
+    """ Whether the kernel can run this sampler on these statistics (numba itself aside) """
+    return _sampler_mode(sampler) is not None and (stats.cov_chol is not None or stats.factors is not None)
+
+
+def warn_fallback(stats, sampler=None):
+    """ Explain why engine='numba' fell back to NumPy """
+    if not jit_available():
+        reason = f"numba is not available ({_unavailable})"
+    else:
+        reason = "the kernel only runs the 'uniform' and 'dirichlet' (alpha=1) samplers on a positive definite covariance"
+    warnings.warn(f"Using the NumPy simulation: {reason}", RuntimeWarning, stacklevel=3)
+
+
+def _covariance_factor(stats):
+    if stats.factors is not None:
+        loadings, specific_var = stats.factors
+        return np.ascontiguousarray(loadings, dtype=float), np.asarray(specific_var, dtype=float)
+    return np.ascontiguousarray(stats.cov_chol, dtype=float), np.zeros(len(stats.symbols))
+
+
+class FusedSimulation:
+    """
+    Run the kernel over num_of_portfolios portfolios, a range of portfolios at a time.
+
+    - run(start, stop) scores portfolios [start, stop) (block aligned), storing them in buffers if given,
+      and folds them into the running max Sharpe / min volatility.
+    """
+
+    def __init__(self, stats, num_of_portfolios, risk_free_rate=0.01, seed=None, sampler=None, buffers=None,
+                 block_size=BLOCK_SIZE):
+        self.stats = stats
+        self.num_of_portfolios = num_of_portfolios
+        self.risk_free_rate = float(risk_free_rate)
+        self.exponential = _sampler_mode(sampler)
+        self.buffers = buffers
+        self.block_size = block_size
+        self.mean = np.asarray(stats.mean, dtype=float)
+        self.factor, self.specific = _covariance_factor(stats)
+
+        n_blocks = -(-num_of_portfolios // block_size)
+        seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+        self.block_seeds = seed_seq.generate_state(max(n_blocks, 1), dtype=np.uint64)
+        self.best = {'max_sharpe': None, 'min_volatility': None}
+
+    def run(self, start, stop):
+        first_block, last_block = start // self.block_size, -(-stop // self.block_size)
+        n_blocks = last_block - first_block
+        best_index = np.full((n_blocks, 2), -1, dtype=np.int64)
+        best_value = np.full((n_blocks, 6), np.nan)
+        best_weights = np.empty((n_blocks, 2, len(self.mean)))
+
+        buffers = self.buffers
+        empty = np.empty(0, dtype=float)
+        store = buffers is not None
+        store_weights = store and buffers.weights is not None
+        _kernel(self.mean, self.factor, self.specific, self.risk_free_rate, self.exponential, self.block_seeds,
+                self.block_size, first_block, last_block, self.num_of_portfolios,
+                buffers.returns if store else empty, buffers.volatility if store else empty,
+                buffers.sharpe if store else empty,
+                buffers.weights if store_weights else np.empty((0, 0)), store, store_weights,
+                best_index, best_value, best_weights)
+
+        # Fold the per block bests into the running ones
+        for key, column in (('max_sharpe', 0), ('min_volatility', 1)):
+            blocks = np.flatnonzero(best_index[:, column] >= 0)
+            if not len(blocks):
+                continue
+            values = best_value[blocks, 3 * column:3 * column + 3]      # ret, vol, sharpe
+            b = np.argmax(values[:, 2]) if key == 'max_sharpe' else np.argmin(values[:, 1])
+            ret, vol, sharpe = values[b]
+            current = self.best[key]
+            if current is None or (sharpe > current[3] if key == 'max_sharpe' else vol < current[2]):
+                self.best[key] = (best_weights[blocks[b], column].copy(), ret, vol, sharpe)
+
+    def result(self):
+        """ Same layout as OptimalPortfolioReducer.result() """
+        from reducers import portfolio_frame
+
+        def as_series(best):
+            weights, ret, vol, sharpe = best
+            return portfolio_frame(self.stats.symbols, weights[None, :], [ret], [vol], [sharpe]).iloc[0]
+
+        return {key: as_series(best) for key, best in self.best.items()}
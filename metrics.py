@@ -1,95 +1,212 @@
 from config import *
+from price_store import load_prices
+from return_stats import ReturnStats, get_log_return_stats
 
-# Load our processed data
-processed_df = pd.read_csv('stock_data_cleaned.csv', index_col=0, parse_dates=True)
-#print(processed_df)
+
+"""
+A nice way to print below
 
 
 """
 
- In this section, we will try -a single- Monte Carlo simulation for Portfolio Optimization
 
-- This will happen in each loop of the simulation.
+def print_weights_metrics(weights_df: pd.DataFrame, metrics_df: pd.DataFrame):
+    """
+    Print the weights and metrics of the portfolio.
+    """
+    from tabulate import tabulate
+
+    print("Weights:")
+    print(tabulate(weights_df, headers='keys', tablefmt='psql'))
+    print("\nMetrics:")
+    print(tabulate(metrics_df, headers='keys', tablefmt='psql'))
 
-"""
 
-"""
-Below calculating Log Returns and Portfolio Weights
 
 """
+Functions for Streamlit app
 
-# Calculate the Log Returns
-log_return = np.log(1 + processed_df.pct_change())
 
-# Generate some Random Portfolio Weights
-number_of_symbols = len(processed_df.columns)
-random_weights = np.array(np.random.random(number_of_symbols))
+"""
 
-# Normalize the weights to sum to 1
-rebalance_weights = random_weights / np.sum(random_weights)
-    #print(f"rebalance_weights: {rebalance_weights}")
+def calculate_portfolio_metrics(weights, log_return, risk_free_rate=0.01):
+    """
+    - log_return can be the log returns DataFrame or a ReturnStats; the mean and covariance
+      come from the cache instead of being recomputed on every call.
+    """
+    stats = log_return if isinstance(log_return, ReturnStats) else get_log_return_stats(log_return)
+    exp_ret = np.sum(stats.mean * weights)
+    exp_vol = np.sqrt(np.dot(weights.T, np.dot(stats.cov, weights)))
+    sharpe_ratio = (exp_ret - risk_free_rate) / exp_vol  # risk-free rate as 0.01
+    return exp_ret, exp_vol, sharpe_ratio
 
 
 """
-Expected Returns, Volatility and Sharpe Ratio
+Batched metrics: many weight vectors in one vectorised pass
 
 """
 
-# Calculate Expected Returns, Annualised
-exp_ret = np.sum((log_return.mean() * rebalance_weights) * 252)
+_numba_kernel = None
 
-# Calculate Expected Volatility, Annualised
-exp_vol = np.sqrt(
-    np.dot(rebalance_weights.T, np.dot(log_return.cov() * 252, rebalance_weights))
-)
-
-# Calculate the Sharpe Ratio
-risk_free_rate = 0.01                                                                       # Change as needed
-sharpe_ratio = (exp_ret - risk_free_rate) / exp_vol
 
+def _load_numba_kernel():
+    """
+    Compile the Numba path-metrics kernel on first use, or return None when Numba is not installed.
+    """
+    global _numba_kernel
+    if _numba_kernel is not None:
+        return _numba_kernel
+    try:
+        import numba
+    except ImportError:
+        return None
+
+    @numba.njit(parallel=True, cache=True)
+    def path_metrics(simple_returns, weights, daily_rf):
+        # One pass over history per portfolio: no (days, portfolios) temporaries
+        m, n = weights.shape
+        downside = np.empty(m, dtype=simple_returns.dtype)
+        max_drawdown = np.empty(m, dtype=simple_returns.dtype)
+        for j in numba.prange(m):
+            log_wealth, peak, worst, squares = 0.0, 0.0, 0.0, 0.0
+            for t in range(simple_returns.shape[0]):
+                r = 0.0
+                for i in range(n):
+                    r += simple_returns[t, i] * weights[j, i]
+                r = np.log1p(r)
+                below = min(r - daily_rf, 0.0)
+                squares += below * below
+                log_wealth += r
+                peak = max(peak, log_wealth)
+                worst = min(worst, log_wealth - peak)
+            downside[j] = np.sqrt(squares / simple_returns.shape[0])
+            max_drawdown[j] = 1.0 - np.exp(worst)
+        return downside, max_drawdown
+
+    _numba_kernel = path_metrics
+    return _numba_kernel
+
+
+def _numpy_path_metrics(simple_returns, weights, daily_rf):
+    portfolio_returns = np.log1p(simple_returns @ weights.T)           # (days, chunk)
+    below = np.minimum(portfolio_returns - daily_rf, 0.0)
+    downside = np.sqrt(np.mean(below * below, axis=0))
+    log_wealth = np.cumsum(portfolio_returns, axis=0)
+    peak = np.maximum(np.maximum.accumulate(log_wealth, axis=0), 0.0)
+    max_drawdown = 1.0 - np.exp((log_wealth - peak).min(axis=0))
+    return downside, max_drawdown
+
+
+def calculate_batch_metrics(weights, log_return, risk_free_rate=0.01, dtype=np.float64, chunk_size=2000,
+                            use_numba=False) -> pd.DataFrame:
+    """
+    Metrics for every row of an (m, num_of_symbols) weights matrix in one pass.
+
+    - log_return can be the log returns DataFrame or a precomputed ReturnStats.
+    - Returns, Volatility and Sharpe Ratio are the annualised figures of calculate_portfolio_metrics.
+    - Sortino Ratio and Max Drawdown replay the historical daily returns with daily rebalancing, over
+      the days every asset has a return (the leading NaN row of pct_change and any gaps are skipped,
+      not counted as 0 returns). The history is processed chunk_size portfolios at a time to bound the
+      (days, chunk_size) temporaries.
+    - Diversification Ratio is the weighted average asset volatility over the portfolio volatility.
+    - dtype=np.float32 halves memory; use_numba=True runs the history replay as a fused Numba kernel
+      and falls back to NumPy when Numba is not installed.
+    """
+    stats = log_return if isinstance(log_return, ReturnStats) else get_log_return_stats(log_return)
+    weights = np.atleast_2d(np.asarray(weights, dtype=dtype))
+
+    exp_ret = weights @ stats.mean.astype(dtype)
+    if stats.factors is not None:
+        projected = weights @ stats.factor_loadings.astype(dtype)
+        exp_vol = np.sqrt(np.einsum('ij,ij->i', projected, projected) + (weights * weights) @ stats.specific_var.astype(dtype))
+    elif stats.cov_chol is not None:
+        projected = weights @ stats.cov_chol.astype(dtype)
+        exp_vol = np.sqrt(np.einsum('ij,ij->i', projected, projected))
+    else:
+        exp_vol = np.sqrt(np.einsum('ij,ij->i', weights @ stats.cov.astype(dtype), weights))
+    asset_vol = np.sqrt(np.diag(stats.cov)).astype(dtype)
+
+    simple_returns = np.expm1(stats.log_return.dropna().to_numpy(dtype=dtype))
+    daily_rf = risk_free_rate / 252
+    kernel = _load_numba_kernel() if use_numba else None
+
+    downside = np.empty(len(weights), dtype=dtype)
+    max_drawdown = np.empty(len(weights), dtype=dtype)
+    for start in range(0, len(weights), chunk_size):
+        chunk = weights[start:start + chunk_size]
+        if kernel is not None:
+            downside[start:start + chunk_size], max_drawdown[start:start + chunk_size] = kernel(
+                simple_returns, np.ascontiguousarray(chunk), daily_rf)
+        else:
+            downside[start:start + chunk_size], max_drawdown[start:start + chunk_size] = _numpy_path_metrics(
+                simple_returns, chunk, daily_rf)
+
+    return pd.DataFrame({
+        'Returns': exp_ret,
+        'Volatility': exp_vol,
+        'Sharpe Ratio': (exp_ret - risk_free_rate) / exp_vol,
+        'Sortino Ratio': (exp_ret - risk_free_rate) / (downside * np.sqrt(252)),
+        'Max Drawdown': max_drawdown,
+        'Diversification Ratio': (weights @ asset_vol) / exp_vol,
+    })
 
-# Optional : Putting Weights, Portfolio Return, Volatility and Sharpe Ratio in a DataFrame
 
-weights_df = pd.DataFrame( data={
-    'random_weights': random_weights,
-    'rebalance_weights': rebalance_weights,
-})
+"""
+Script: python metrics.py
 
-metrics_df = pd.DataFrame( data={
-    'Expected Portfolio Returns': exp_ret,
-    'Expected Portfolio Volatility': exp_vol,
-    'Portfolio Sharpe Ratio': sharpe_ratio
-}, index=[0])
+ In this section, we will try -a single- Monte Carlo simulation for Portfolio Optimization
 
+- This will happen in each loop of the simulation.
 
 """
-A nice way to print below
 
+def main():
+    set_display_options()
 
-"""
+    # Load our processed data
+    processed_df = load_prices('stock_data_cleaned.feather')
+    #print(processed_df)
 
+    """
+    Below calculating Log Returns and Portfolio Weights
 
-def print_weights_metrics(weights_df: pd.DataFrame, metrics_df: pd.DataFrame):
     """
-    Print the weights and metrics of the portfolio.
+
+    # Calculate the Log Returns
+    log_return = np.log(1 + processed_df.pct_change())
+
+    # Generate some Random Portfolio Weights
+    number_of_symbols = len(processed_df.columns)
+    random_weights = np.array(np.random.random(number_of_symbols))
+
+    # Normalize the weights to sum to 1
+    rebalance_weights = random_weights / np.sum(random_weights)
+        #print(f"rebalance_weights: {rebalance_weights}")
+
     """
-    print("Weights:")
-    print(tabulate(weights_df, headers='keys', tablefmt='psql'))
-    print("\nMetrics:")
-    print(tabulate(metrics_df, headers='keys', tablefmt='psql'))
+    Expected Returns, Volatility and Sharpe Ratio
 
-print_weights_metrics(weights_df, metrics_df)
+    """
 
+    # Calculate the Sharpe Ratio
+    risk_free_rate = 0.01                                                                       # Change as needed
+    exp_ret, exp_vol, sharpe_ratio = calculate_portfolio_metrics(rebalance_weights, log_return, risk_free_rate)
 
+    # Optional : Putting Weights, Portfolio Return, Volatility and Sharpe Ratio in a DataFrame
 
-"""
-Functions for Streamlit app
+    weights_df = pd.DataFrame( data={
+        'random_weights': random_weights,
+        'rebalance_weights': rebalance_weights,
+    })
 
+    metrics_df = pd.DataFrame( data={
+        'Expected Portfolio Returns': exp_ret,
+        'Expected Portfolio Volatility': exp_vol,
+        'Portfolio Sharpe Ratio': sharpe_ratio
+    }, index=[0])
 
-"""
+    print_weights_metrics(weights_df, metrics_df)
 
-def calculate_portfolio_metrics(weights, log_return):
-    exp_ret = np.sum((log_return.mean() * weights) * 252)
-    exp_vol = np.sqrt(np.dot(weights.T, np.dot(log_return.cov() * 252, weights)))
-    sharpe_ratio = (exp_ret - risk_free_rate) / exp_vol  # risk-free rate as 0.01
-    return exp_ret, exp_vol, sharpe_ratio
\ No newline at end of file
+
+if __name__ == '__main__':
+    main()
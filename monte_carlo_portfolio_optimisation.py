@@ -1,12 +1,17 @@
 from config import *
-pd.set_option('display.max_colwidth', None)
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-# Load our processed data
-processed_df = pd.read_csv('stock_data_cleaned.csv', index_col=0, parse_dates=True)
+from price_store import load_prices
+from return_stats import ReturnStats, get_return_stats
+from frontier_optimisation import optimize_frontier
+from instrumentation import count, stage, timed
+from reducers import OptimalPortfolioReducer, TopKReducer, FrontierEnvelopeReducer, portfolio_frame
+from samplers import LocalSampler, get_sampler
+from simulation_buffers import SimulationBuffers
 
-# Some Variables
-num_of_symbols = len(processed_df.columns) 
-risk_free_rate = 0.01                            # Change as needed
 
 """
 ---------------------------Monte Carlo-------------------------------- 
@@ -15,196 +20,473 @@ risk_free_rate = 0.01                            # Change as needed
 
 """
 
-"""
-Below we will define some large matrices to hold the results of all our simulation.
 
 """
-
-# Defining number of simulations
-num_of_portfolios = 10000 
-
-# Predefining empty arrays to hold the results
-# Weight Array of NumPy zeroes
-all_weights = np.zeros((num_of_portfolios, num_of_symbols))
-
-# Return Array of Numpy zeroes
-ret_arr = np.zeros(num_of_portfolios)
-
-# Volatility Array of NumPy zeroes
-vol_arr = np.zeros(num_of_portfolios)
-
-# Sharpe Array of NumPy zeroes
-sharpe_arr = np.zeros(num_of_portfolios)
-
-
-
-"""
-Precompute a few statistics that can be kept outside the loop for efficiency
+Functions for Streamlit app
 
 """
 
-log_return = np.log(1 + processed_df.pct_change())   # Calculate the Log Returns
-log_return_mean = log_return.mean() * 252            # Annualized expected returns
-log_return_cov = log_return.cov() * 252              # Annualized covariance matrix
-
+def _portfolio_volatility(weights, log_return_cov, cov_chol=None, factors=None):
+    """
+    Annualised volatility for every row of a (chunk, num_of_symbols) weights matrix.
+
+    - With the Cholesky factor L of the covariance, w.T C w is just ||w L||^2.
+    - With a factor model (B, D) it is ||w B||^2 + sum(w^2 D), O(num_of_symbols * K) per portfolio.
+    - Falls back to the covariance itself when it is not positive definite.
+    """
+    if factors is not None:
+        loadings, specific_var = factors
+        projected = weights @ loadings
+        return np.sqrt(np.einsum('ij,ij->i', projected, projected) + (weights * weights) @ specific_var)
+    if cov_chol is None:
+        return np.sqrt(np.einsum('ij,ij->i', weights @ log_return_cov, weights))
+    projected = weights @ cov_chol
+    return np.sqrt(np.einsum('ij,ij->i', projected, projected))
+
+
+def _as_return_stats(processed_df) -> ReturnStats:
+    """
+    Cached statistics for a cleaned price DataFrame, or the ReturnStats itself if one was passed.
+    """
+    return processed_df if isinstance(processed_df, ReturnStats) else get_return_stats(processed_df)
+
+
+def _seed_sequence(seed):
+    """ seed can be None, an int or an existing SeedSequence (e.g. one spawned by a caller) """
+    return seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+
+
+def _chunk_bounds(num_of_portfolios, chunk_size):
+    return [(start, min(start + chunk_size, num_of_portfolios)) for start in range(0, num_of_portfolios, chunk_size)]
+
+
+def _simulate_chunk(seed_seq, size, stats: ReturnStats, sampler):
+    """
+    Draw and score one batch of portfolios with its own random Generator, in the dtype of stats.
+    """
+    rng = np.random.default_rng(seed_seq)
+    weights = sampler(rng, size, len(stats.symbols))
+    if weights.dtype != stats.mean.dtype:
+        weights = weights.astype(stats.mean.dtype)
+    return weights, weights @ stats.mean, _portfolio_volatility(weights, stats.cov, stats.cov_chol, stats.factors)
+
+
+def _max_volatility(stats: ReturnStats, sampler):
+    """
+    Upper end of the frontier buckets: no portfolio is more volatile than its gross leverage times its most
+    volatile asset. Samplers allowing shorts or leverage expose max_gross, the others are long-only.
+    """
+    return getattr(sampler, 'max_gross', 1.0) * np.sqrt(np.nanmax(np.diag(stats.cov)))
+
+
+class SimulationCancelled(Exception):
+    pass
+
+
+def _check_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise SimulationCancelled("Simulation was cancelled")
+
+
+def _jit_engine(engine, stats, sampler):
+    """
+    Whether to run the Numba kernel (jit_kernels.py): engine='numba' warns when it can't,
+    engine='auto' falls back to NumPy silently.
+    """
+    if engine == 'numpy':
+        return False
+    if engine not in ('numba', 'auto'):
+        raise ValueError(f"Unknown engine '{engine}', expected 'numpy', 'numba' or 'auto'")
+
+    import jit_kernels
+    if jit_kernels.jit_available() and jit_kernels.jit_supported(stats, sampler):
+        return True
+    if engine == 'numba':
+        jit_kernels.warn_fallback(stats, sampler)
+    return False
+
+
+def _jit_chunk_bounds(num_of_portfolios, chunk_size):
+    from jit_kernels import BLOCK_SIZE
+
+    # Chunks are whole kernel blocks, so the draws do not depend on chunk_size
+    return _chunk_bounds(num_of_portfolios, max(chunk_size // BLOCK_SIZE, 1) * BLOCK_SIZE)
+
+
+def monte_carlo_simulation(processed_df, num_of_portfolios=10000, risk_free_rate=0.01, chunk_size=50000,
+                           seed=None, n_workers=1, sampler=None, progress_callback=None, cancel_event=None,
+                           return_weights=False, dtype=np.float64, out=None, engine='numpy'):
+    """
+    Run the Monte Carlo simulation in batches instead of one portfolio at a time.
+
+    - processed_df is the cleaned price DataFrame, or a ReturnStats to skip the statistics entirely.
+    - Weights are drawn as a (chunk_size, num_of_symbols) matrix and scored all at once.
+    - chunk_size bounds the memory used by the weights of a single batch.
+    - Every chunk gets its own Generator spawned from np.random.SeedSequence(seed), so a given
+      seed gives the same results whatever n_workers is. seed may also be a SeedSequence.
+    - n_workers > 1 scores chunks on a thread pool (NumPy releases the GIL), None uses every core.
+    - sampler picks how weights are drawn, a name or instance from samplers.py (default 'uniform').
+    - progress_callback(portfolios_done, num_of_portfolios) is called after every chunk, and setting
+      cancel_event (a threading.Event) stops the run with SimulationCancelled before the next chunk.
+    - return_weights=True adds one weight column per symbol, as in the stream_monte_carlo_simulation frames.
+    - dtype=np.float32 scores and stores the portfolios in single precision, half the memory of float64.
+    - out: SimulationBuffers to write into (e.g. memory-mapped, see SimulationBuffers.allocate), returned
+      filled instead of a DataFrame; its dtype and whether it has weights replace dtype / return_weights.
+      Use out.to_frame() or out.to_arrow() for a view of the results that does not copy them.
+    - engine='numba' draws and scores each portfolio in one compiled parallel loop (jit_kernels.py) for
+      the 'uniform' and 'dirichlet' samplers, ignoring n_workers; its draws differ from the NumPy ones
+      for the same seed. It falls back to NumPy with a warning when numba or the sampler is unsupported,
+      engine='auto' without one. The kernel always scores in float64, so dtype only sets how the results
+      are stored.
+    """
+    stats = _as_return_stats(processed_df)
+    sampler = get_sampler(sampler)
+    progress_lock = threading.Lock()
+    done = [0]
+
+    buffers = out
+    if buffers is None:
+        buffers = SimulationBuffers.allocate(num_of_portfolios, stats.symbols, dtype=dtype, weights=return_weights)
+    buffers.validate(num_of_portfolios, len(stats.symbols))
+    if buffers.symbols is None:
+        buffers.symbols = list(stats.symbols)
+    scoring_stats = stats.astype(buffers.dtype)
+
+    if _jit_engine(engine, stats, sampler):
+        from jit_kernels import FusedSimulation
+
+        fused = FusedSimulation(stats, num_of_portfolios, risk_free_rate, _seed_sequence(seed), sampler, buffers)
+        with stage('simulation', items=num_of_portfolios, sampler=getattr(sampler, 'name', None), engine=engine):
+            for start, stop in _jit_chunk_bounds(num_of_portfolios, chunk_size):
+                _check_cancelled(cancel_event)
+                fused.run(start, stop)
+                if progress_callback is not None:
+                    progress_callback(stop, num_of_portfolios)
+        return out if out is not None else buffers.to_frame()
+
+    bounds = _chunk_bounds(num_of_portfolios, chunk_size)
+    seed_seqs = _seed_sequence(seed).spawn(len(bounds))
+
+    def run_chunk(chunk):
+        (start, stop), seed_seq = chunk
+        _check_cancelled(cancel_event)
+        weights, ret, vol = _simulate_chunk(seed_seq, stop - start, scoring_stats, sampler)
+        # Straight into the buffers, no full size temporaries
+        buffers.returns[start:stop] = ret
+        buffers.volatility[start:stop] = vol
+        np.divide(ret - risk_free_rate, vol, out=buffers.sharpe[start:stop])
+        if buffers.weights is not None:
+            buffers.weights[:, start:stop] = weights.T
+        if progress_callback is not None:
+            with progress_lock:
+                done[0] += stop - start
+                progress_callback(done[0], num_of_portfolios)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    with stage('simulation', items=num_of_portfolios, sampler=getattr(sampler, 'name', None), n_workers=n_workers):
+        if n_workers > 1 and len(bounds) > 1:
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                list(executor.map(run_chunk, zip(bounds, seed_seqs)))
+        else:
+            for chunk in zip(bounds, seed_seqs):
+                run_chunk(chunk)
+
+    if out is not None:
+        return out
+    return buffers.to_frame()
+
+
+def iter_simulation_chunks(processed_df, num_of_portfolios=10000, risk_free_rate=0.01, chunk_size=50000, seed=None,
+                           sampler=None):
+    """
+    Yield the simulation one chunk at a time as (weights, returns, volatility, sharpe) arrays.
+
+    - Uses the same per-chunk seeding as monte_carlo_simulation, so a seed gives the same portfolios.
+    """
+    stats = _as_return_stats(processed_df)
+    sampler = get_sampler(sampler)
+    bounds = _chunk_bounds(num_of_portfolios, chunk_size)
+    seed_seqs = _seed_sequence(seed).spawn(len(bounds))
+
+    for (start, stop), seed_seq in zip(bounds, seed_seqs):
+        weights, ret, vol = _simulate_chunk(seed_seq, stop - start, stats, sampler)
+        yield weights, ret, vol, (ret - risk_free_rate) / vol
+
+
+def stream_monte_carlo_simulation(processed_df, num_of_portfolios=10000, risk_free_rate=0.01, chunk_size=50000,
+                                  seed=None, top_k=100, n_bins=100, sampler=None):
+    """
+    Run the simulation without keeping every portfolio in memory.
+
+    Returns a dict with:
+    - 'max_sharpe' and 'min_volatility': the optimal portfolios as Series, weights included.
+    - 'top_k': the top_k portfolios by Sharpe ratio, best first.
+    - 'frontier': the best return in each of n_bins volatility buckets.
+
+    Memory is O(top_k + n_bins) whatever num_of_portfolios is.
+    """
+    if num_of_portfolios < 1:
+        raise ValueError(f"num_of_portfolios must be at least 1, got {num_of_portfolios}")
+    stats = _as_return_stats(processed_df)
+    symbols = stats.symbols
+    sampler = get_sampler(sampler)
+    max_vol = _max_volatility(stats, sampler)
+
+    reducers = {
+        'optimal': OptimalPortfolioReducer(symbols),
+        'top_k': TopKReducer(symbols, k=top_k),
+        'frontier': FrontierEnvelopeReducer(symbols, (0.0, max_vol), n_bins=n_bins),
+    }
+
+    with stage('simulation.stream', items=num_of_portfolios):
+        for chunk in iter_simulation_chunks(stats, num_of_portfolios, risk_free_rate, chunk_size, seed, sampler):
+            for reducer in reducers.values():
+                reducer.update(*chunk)
+
+    results = reducers['optimal'].result()
+    results['top_k'] = reducers['top_k'].result()
+    results['frontier'] = reducers['frontier'].result()
+    return results
+
+
+def optimal_portfolios(processed_df, num_of_portfolios=10000, risk_free_rate=0.01, chunk_size=50000, seed=None,
+                       sampler=None, engine='numpy'):
+    """
+    Only the max Sharpe ratio and min volatility portfolios, as Series with weights: the cheapest way to
+    search a large number of portfolios, nothing else is kept.
+
+    - engine='numpy' (default) streams the chunks through OptimalPortfolioReducer, so a seed gives the same
+      answer whether or not numba is installed. engine='numba' or 'auto' fold both into the compiled
+      sample-and-score loop instead, see monte_carlo_simulation; they draw different portfolios for the same seed.
+    """
+    if num_of_portfolios < 1:
+        raise ValueError(f"num_of_portfolios must be at least 1, got {num_of_portfolios}")
+    stats = _as_return_stats(processed_df)
+    sampler = get_sampler(sampler)
+
+    with stage('simulation.optimal', items=num_of_portfolios, engine=engine):
+        if _jit_engine(engine, stats, sampler):
+            from jit_kernels import FusedSimulation
+
+            fused = FusedSimulation(stats, num_of_portfolios, risk_free_rate, _seed_sequence(seed), sampler)
+            for start, stop in _jit_chunk_bounds(num_of_portfolios, chunk_size):
+                fused.run(start, stop)
+            return fused.result()
+
+        reducer = OptimalPortfolioReducer(stats.symbols)
+        for chunk in iter_simulation_chunks(stats, num_of_portfolios, risk_free_rate, chunk_size, seed, sampler):
+            reducer.update(*chunk)
+        return reducer.result()
+
+
+@timed('simulation.adaptive')
+def adaptive_monte_carlo_simulation(processed_df, risk_free_rate=0.01, batch_size=5000, max_portfolios=1000000,
+                                    tol=1e-4, patience=3, time_budget=None, seed=None, sampler=None,
+                                    refine=False, refine_fraction=0.5, refine_concentration=200.0,
+                                    top_k=100, n_bins=100, return_portfolios=False, return_weights=False,
+                                    progress_callback=None, cancel_event=None):
+    """
+    Run the simulation in batches until the answer stops improving.
+
+    - After every batch the max Sharpe ratio, min volatility and frontier envelope are compared with the
+      previous batch; once none of them improves by more than tol for patience batches in a row, it stops.
+    - It also stops at max_portfolios, or once time_budget seconds have passed.
+    - refine=True draws refine_fraction of every batch around the current max Sharpe weights (LocalSampler),
+      the rest from sampler as usual.
+    - return_portfolios=True also returns every simulated Returns / Volatility / Sharpe Ratio, like
+      monte_carlo_simulation; return_weights=True adds one weight column per symbol to them.
+    - progress_callback and cancel_event work as in monte_carlo_simulation, per batch.
+
+    Returns the same dict as stream_monte_carlo_simulation, plus:
+    - 'history': best Sharpe, min volatility and elapsed time after each batch.
+    - 'stopped': why it stopped ('converged', 'time_budget' or 'max_portfolios').
+    """
+    start_time = time.perf_counter()
+    stats = _as_return_stats(processed_df)
+    sampler = get_sampler(sampler)
+    seed_seq = _seed_sequence(seed)
+    max_vol = _max_volatility(stats, sampler)
+
+    optimal = OptimalPortfolioReducer(stats.symbols)
+    best_k = TopKReducer(stats.symbols, k=top_k)
+    frontier = FrontierEnvelopeReducer(stats.symbols, (0.0, max_vol), n_bins=n_bins)
+    portfolios = []
+    history = []
+
+    seen, quiet_batches, stopped = 0, 0, 'max_portfolios'
+    while seen < max_portfolios:
+        _check_cancelled(cancel_event)
+        size = min(batch_size, max_portfolios - seen)
+        batch_seed, local_seed = seed_seq.spawn(2)
+
+        # Split the batch between the global sampler and local refinement around the best portfolio
+        n_local = int(size * refine_fraction) if refine and optimal.max_sharpe is not None else 0
+        parts = [_simulate_chunk(batch_seed, size - n_local, stats, sampler)]
+        if n_local:
+            local = LocalSampler(optimal.max_sharpe[0], refine_concentration)
+            parts.append(_simulate_chunk(local_seed, n_local, stats, local))
+        weights, ret, vol = (np.concatenate(arrays) for arrays in zip(*parts))
+        sharpe = (ret - risk_free_rate) / vol
+        seen += size
+        count('simulation.adaptive.portfolios', size)
+
+        previous = (optimal.max_sharpe, optimal.min_volatility, frontier.ret.copy())
+        for reducer in (optimal, best_k, frontier):
+            reducer.update(weights, ret, vol, sharpe)
+        if return_portfolios:
+            portfolios.append((weights if return_weights else weights[:, :0], ret, vol, sharpe))
+
+        history.append({
+            'Portfolios': seen,
+            'Best Sharpe': optimal.max_sharpe[3],
+            'Min Volatility': optimal.min_volatility[2],
+            'Seconds': time.perf_counter() - start_time,
+        })
+        if progress_callback is not None:
+            progress_callback(seen, max_portfolios)
+
+        if previous[0] is not None:
+            filled = np.isfinite(previous[2])
+            improvement = max(
+                optimal.max_sharpe[3] - previous[0][3],
+                previous[1][2] - optimal.min_volatility[2],
+                np.mean(frontier.ret[filled] - previous[2][filled]) if filled.any() else np.inf,
+                np.inf if (np.isfinite(frontier.ret) & ~filled).any() else 0.0,
+            )
+            quiet_batches = quiet_batches + 1 if improvement <= tol else 0
+            if quiet_batches >= patience:
+                stopped = 'converged'
+                break
+
+        if time_budget is not None and time.perf_counter() - start_time >= time_budget:
+            stopped = 'time_budget'
+            break
+
+    results = optimal.result()
+    results['top_k'] = best_k.result()
+    results['frontier'] = frontier.result()
+    results['history'] = pd.DataFrame(history)
+    results['stopped'] = stopped
+    if return_portfolios:
+        weights_arr, ret_arr, vol_arr, sharpe_arr = (np.concatenate(arrays) for arrays in zip(*portfolios))
+        symbols = stats.symbols if return_weights else []
+        results['portfolios'] = portfolio_frame(symbols, weights_arr, ret_arr, vol_arr, sharpe_arr)
+    return results
+
+
+def convergence_report(processed_df, samplers=('uniform', 'dirichlet', 'sobol'), sample_counts=None,
+                       risk_free_rate=0.01, chunk_size=50000, seed=None) -> pd.DataFrame:
+    """
+    Best Sharpe ratio found against the number of portfolios sampled, for each sampler.
+
+    - sample_counts defaults to powers of 10 from 100 to 1M.
+    - 'Gap' is the distance to the exact max Sharpe ratio from optimize_frontier.
+    """
+    stats = _as_return_stats(processed_df)
+    sample_counts = sorted(sample_counts or [10 ** i for i in range(2, 7)])
+    best_sharpe = optimize_frontier(stats.mean_series, stats.cov_frame, risk_free_rate, num_points=2, factors=stats.factors)['max_sharpe']['Sharpe Ratio']
+
+    rows = []
+    for sampler in samplers:
+        sampler = get_sampler(sampler)
+        best, seen, checkpoints = -np.inf, 0, iter(sample_counts)
+        checkpoint = next(checkpoints)
+        for _, _, _, sharpe in iter_simulation_chunks(stats, sample_counts[-1], risk_free_rate, chunk_size, seed, sampler):
+            # Read off the running best at every checkpoint that falls inside this chunk
+            while checkpoint is not None and checkpoint <= seen + len(sharpe):
+                best = max(best, np.nanmax(sharpe[:checkpoint - seen]))
+                rows.append({'Sampler': sampler.name, 'Portfolios': checkpoint, 'Best Sharpe': best, 'Gap': best_sharpe - best})
+                checkpoint = next(checkpoints, None)
+            best = max(best, np.nanmax(sharpe))
+            seen += len(sharpe)
+
+    return pd.DataFrame(rows)
 
 
 """
-Below we start our Monte Carlo simulation
+Script: python monte_carlo_portfolio_optimisation.py
 
 """
-# Start Simulation
-for i in range(num_of_portfolios):
-
-    # Calculate random weights
-    weights = np.array(np.random.random(num_of_symbols))
-    weights = weights / np.sum(weights)
-
-    # Add weights to weights array
-    all_weights[i, :] = weights
-
-    # Calculate Expected Log Returns, Annualised
-    ret_arr[i] = np.sum(log_return_mean * weights)
 
-    # Calculate Expected Volatility, Annualised
-    vol_arr[i] = np.sqrt(
-        np.dot(weights.T, np.dot(log_return_cov, weights))
-        )
-    
-    # Calculate the Sharpe Ratio
-    sharpe_arr[i] = (ret_arr[i] - risk_free_rate) / vol_arr[i]
+def main():
+    set_display_options()
+    pd.set_option('display.max_colwidth', None)
 
+    # Load our processed data
+    processed_df = load_prices('stock_data_cleaned.feather')
 
-# Combining all simulation results
-simulations_data = [ret_arr, vol_arr, sharpe_arr, all_weights]
+    # Some Variables
+    risk_free_rate = 0.01                            # Change as needed
 
-# Creating a DataFrame from the simulation data
-simulations_df = pd.DataFrame(data=simulations_data).T
+    # Defining number of simulations
+    num_of_portfolios = 10000 
 
-# Naming the columns
-simulations_df.columns = [
-    'Returns',
-    'Volatility', 
-    'Sharpe Ratio', 
-    'Weights'
-]
+    """
+    Below we run our Monte Carlo simulation, keeping the weights of every portfolio (one column per symbol)
 
-# Make sure data types are correct
-simulations_df = simulations_df.infer_objects()
+    """
+    seed = np.random.SeedSequence().entropy
+    simulations_df = monte_carlo_simulation(processed_df, num_of_portfolios, risk_free_rate, seed=seed, return_weights=True)
 
-
-"""
-# Let's Display our Outputs
-
-"""
+    # Store every portfolio in the result store, see result_store.py for queries on it
+    from result_store import save_results
+    stats = _as_return_stats(processed_df)
+    save_results(simulations_df, 'simulation_results.arrow', metadata={'seed': seed, 'sampler': 'uniform', 'fingerprint': stats.fingerprint})
 
 
-# Full precision for floats
-pd.options.display.float_format = '{:.10f}'.format
+    """
+    # Let's Display our Outputs
 
+    """
 
-print('')
-print('='*80)
-print('Monte Carlo Simulation Results')
-print('-'*80)
-print(simulations_df.head())
-print('-'*80)
+    # Full precision for floats
+    pd.options.display.float_format = '{:.10f}'.format
 
+    print('')
+    print('='*80)
+    print('Monte Carlo Simulation Results')
+    print('-'*80)
+    print(simulations_df.head())
+    print('-'*80)
 
-# Reset to default formatting
-pd.reset_option('display.float_format')
+    # Reset to default formatting
+    pd.reset_option('display.float_format')
 
 
-"""
-Some Important Metrics
+    """
+    Some Important Metrics
 
+    """
 
-"""
+    # Max Sharpe Ratio
+    max_sharpe_ratios = simulations_df.loc[simulations_df['Sharpe Ratio'].idxmax()]
 
-# Max Sharpe Ratio
-max_sharpe_ratios = simulations_df.loc[simulations_df['Sharpe Ratio'].idxmax()]
+    # Min Volatility
+    min_volatility = simulations_df.loc[simulations_df['Volatility'].idxmin()]
 
-# Min Volatility
-min_volatility = simulations_df.loc[simulations_df['Volatility'].idxmin()]
+    print('')
+    print('='*80)
+    print('Max Sharpe Ratio Portfolio')
+    print('-'*80)
+    print(max_sharpe_ratios)
+    print('='*80)
+    print(min_volatility)
+    print('-'*80)
 
-print('')
-print('='*80)
-print('Max Sharpe Ratio Portfolio')
-print('-'*80)
-print(max_sharpe_ratios)
-print('='*80)
-print(min_volatility)
-print('-'*80)
 
+    """
+    Plotting the results
 
+    """
+    import matplotlib.pyplot as plt
+    from plotting import frontier_summary, plot_frontier
 
-"""
-Plotting the results
+    # Plotting the efficient frontier with Sharpe Ratio color map, aggregated on a grid
+    plot_frontier(frontier_summary(simulations_df), figsize=(12, 8))
+    plt.show()
 
-"""
-import matplotlib.pyplot as plt
-
-# Plotting the efficient frontier with Sharpe Ratio color map
-plt.figure(figsize=(12, 8))
-scatter = plt.scatter(
-    simulations_df['Volatility'], 
-    simulations_df['Returns'], 
-    c=simulations_df['Sharpe Ratio'], 
-    cmap='viridis'
-)
-plt.colorbar(scatter, label='Sharpe Ratio')  # Adding color bar for Sharpe Ratios
-plt.xlabel('Volatility')
-plt.ylabel('Returns')
-plt.title('Monte Carlo Simulation: Efficient Frontier')
-
-# Highlighting the max Sharpe ratio portfolio
-plt.scatter(
-    max_sharpe_ratios['Volatility'], 
-    max_sharpe_ratios['Returns'], 
-    color='red', 
-    marker='*', 
-    s=200, 
-    label='Max Sharpe Ratio'
-)
-
-# Highlighting the min volatility portfolio
-plt.scatter(
-    min_volatility['Volatility'], 
-    min_volatility['Returns'], 
-    color='blue', 
-    marker='*', 
-    s=200, 
-    label='Min Volatility'
-)
-
-plt.legend()
-plt.show()
-
-
-
-"""
-Functions for Streamlit app
-
-"""
 
-def monte_carlo_simulation(processed_df, num_of_portfolios=10000, risk_free_rate=0.01):
-    num_of_symbols = len(processed_df.columns)
-    log_return = np.log(1 + processed_df.pct_change())
-    log_return_mean = log_return.mean() * 252
-    log_return_cov = log_return.cov() * 252
-
-    all_weights = np.zeros((num_of_portfolios, num_of_symbols))
-    ret_arr = np.zeros(num_of_portfolios)
-    vol_arr = np.zeros(num_of_portfolios)
-    sharpe_arr = np.zeros(num_of_portfolios)
-
-    for i in range(num_of_portfolios):
-        weights = np.random.random(num_of_symbols)
-        weights /= np.sum(weights)
-        all_weights[i, :] = weights
-        ret_arr[i] = np.sum(log_return_mean * weights)
-        vol_arr[i] = np.sqrt(np.dot(weights.T, np.dot(log_return_cov, weights)))
-        sharpe_arr[i] = (ret_arr[i] - risk_free_rate) / vol_arr[i]
-
-    simulations_df = pd.DataFrame({'Returns': ret_arr, 'Volatility': vol_arr, 'Sharpe Ratio': sharpe_arr})
-    return simulations_df
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+from config import *
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from return_stats import ReturnStats, get_return_stats
+
+"""
+Forward Monte Carlo simulation of price paths, for tail risk of given portfolios.
+
+- Daily asset log returns are drawn either as correlated normals (Cholesky factor of the covariance)
+  or by bootstrapping whole historical days, so cross-asset correlation is kept either way.
+- Portfolios are rebalanced daily to their weights. Many portfolios can share the same paths.
+- Paths are simulated in chunks of (chunk_size, horizon, num_of_symbols), so memory is bounded by the
+  chunk size, not the number of paths. Only terminal wealth and max drawdown are kept per path.
+
+"""
+
+
+def _weights_matrix(weights, symbols):
+    """ (m, num_of_symbols) weights and row labels from a vector, matrix, Series or DataFrame """
+    if isinstance(weights, pd.DataFrame):
+        return weights[symbols].to_numpy(dtype=float), weights.index
+    if isinstance(weights, pd.Series):
+        return weights[symbols].to_numpy(dtype=float)[None, :], pd.RangeIndex(1)
+    weights = np.atleast_2d(np.asarray(weights, dtype=float))
+    return weights, pd.RangeIndex(len(weights))
+
+
+def _daily_factor(stats: ReturnStats):
+    """ Daily factor L with L L.T = daily covariance, falling back to an eigen square root """
+    if stats.cov_chol is not None:
+        return stats.cov_chol / np.sqrt(252)
+    eigenvalues, eigenvectors = np.linalg.eigh(stats.cov / 252)
+    return eigenvectors * np.sqrt(np.clip(eigenvalues, 0.0, None))
+
+
+def _simulate_paths_chunk(seed_seq, size, horizon, weights, stats, method, history, daily_factor, dtype):
+    """
+    Terminal log wealth and max drawdown of every portfolio on one chunk of paths, both (size, m).
+    """
+    rng = np.random.default_rng(seed_seq)
+    num_of_symbols = len(stats.symbols)
+
+    if method == 'bootstrap':
+        days = rng.integers(0, len(history), size=(size, horizon))
+        asset_returns = history[days]
+    else:
+        shocks = rng.standard_normal((size, horizon, num_of_symbols), dtype=dtype)
+        asset_returns = shocks @ daily_factor.T
+        del shocks
+        asset_returns += (stats.mean / 252).astype(dtype)
+
+    # Daily rebalancing: portfolio simple return is the weighted sum of asset simple returns
+    np.expm1(asset_returns, out=asset_returns)
+    portfolio_returns = asset_returns @ weights.T.astype(dtype)        # (size, horizon, m)
+    del asset_returns
+
+    log_wealth = np.cumsum(np.log1p(portfolio_returns, out=portfolio_returns), axis=1)
+    peak = np.maximum(np.maximum.accumulate(log_wealth, axis=1), 0.0)
+    max_drawdown = 1.0 - np.exp((log_wealth - peak).min(axis=1))
+    return log_wealth[:, -1, :], max_drawdown
+
+
+def simulate_portfolio_paths(processed_df, weights, horizon=252, num_paths=10000, method='normal', seed=None,
+                             chunk_size=2000, n_workers=1, dtype=np.float32, confidence=0.95,
+                             quantiles=(0.05, 0.5, 0.95), initial_wealth=1.0) -> pd.DataFrame:
+    """
+    Simulate num_paths forward paths of horizon trading days and report tail risk per portfolio.
+
+    - processed_df is the cleaned price DataFrame or a ReturnStats.
+    - weights is one weight vector, an (m, num_of_symbols) matrix, or a Series / DataFrame with a column
+      per symbol (e.g. the 'max_sharpe' or 'top_k' results of the simulation).
+    - method is 'normal' (correlated normals from the covariance) or 'bootstrap' (historical days).
+    - dtype=np.float32 halves the memory of each chunk; chunk_size and n_workers work as in
+      monte_carlo_simulation, and a seed gives the same result whatever n_workers is.
+
+    Returns one row per portfolio with VaR and CVaR of the horizon return at the given confidence,
+    the expected and tail max drawdown and terminal wealth quantiles.
+    """
+    stats = processed_df if isinstance(processed_df, ReturnStats) else get_return_stats(processed_df)
+    weight_matrix, labels = _weights_matrix(weights, stats.symbols)
+    if method not in ('normal', 'bootstrap'):
+        raise ValueError(f"Unknown method '{method}', expected 'normal' or 'bootstrap'")
+
+    history = stats.log_return.dropna().to_numpy(dtype=dtype) if method == 'bootstrap' else None
+    daily_factor = _daily_factor(stats).astype(dtype)
+
+    terminal = np.empty((num_paths, len(weight_matrix)), dtype=dtype)
+    drawdown = np.empty((num_paths, len(weight_matrix)), dtype=dtype)
+
+    bounds = [(start, min(start + chunk_size, num_paths)) for start in range(0, num_paths, chunk_size)]
+    seed_seqs = np.random.SeedSequence(seed).spawn(len(bounds))
+
+    def run_chunk(chunk):
+        (start, stop), seed_seq = chunk
+        terminal[start:stop], drawdown[start:stop] = _simulate_paths_chunk(
+            seed_seq, stop - start, horizon, weight_matrix, stats, method, history, daily_factor, dtype)
+
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers > 1 and len(bounds) > 1:
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            list(executor.map(run_chunk, zip(bounds, seed_seqs)))
+    else:
+        for chunk in zip(bounds, seed_seqs):
+            run_chunk(chunk)
+
+    # Summaries in float64, whatever the simulation dtype
+    horizon_return = np.expm1(terminal.astype(float))
+    var = -np.quantile(horizon_return, 1.0 - confidence, axis=0)
+    tail = horizon_return <= -var
+    cvar = -np.sum(np.where(tail, horizon_return, 0.0), axis=0) / np.maximum(tail.sum(axis=0), 1)
+
+    label = f"{confidence:.0%}"
+    report = pd.DataFrame({
+        'Expected Return': horizon_return.mean(axis=0),
+        f'VaR {label}': var,
+        f'CVaR {label}': cvar,
+        'Expected Max Drawdown': drawdown.mean(axis=0),
+        f'Max Drawdown {label}': np.quantile(drawdown, confidence, axis=0),
+    }, index=labels)
+    for q in quantiles:
+        report[f'Terminal Wealth {q:.0%}'] = initial_wealth * (1.0 + np.quantile(horizon_return, q, axis=0))
+    return report
@@ -0,0 +1,102 @@
+from config import *
+
+from instrumentation import timed
+from reducers import FrontierEnvelopeReducer
+
+"""
+Efficient frontier plots that take the same time to draw whatever the number of portfolios.
+
+- Simulated portfolios are aggregated once into a (volatility, return) grid holding the best Sharpe
+  ratio per cell, plus the frontier envelope and the max Sharpe / min volatility points.
+- The aggregate is small and saved next to the results (.npz), along with the rendered PNG,
+  so a rerun only has to load an image.
+
+"""
+
+
+@timed('plot.summary')
+def frontier_summary(simulations_df: pd.DataFrame, gridsize=(200, 150), n_bins=100) -> dict:
+    """
+    Aggregate a simulation results DataFrame (Returns, Volatility, Sharpe Ratio) for plotting.
+    """
+    ret = simulations_df['Returns'].to_numpy(dtype=float)
+    vol = simulations_df['Volatility'].to_numpy(dtype=float)
+    sharpe = simulations_df['Sharpe Ratio'].to_numpy(dtype=float)
+
+    vol_edges = np.linspace(vol.min(), vol.max(), gridsize[0] + 1)
+    ret_edges = np.linspace(ret.min(), ret.max(), gridsize[1] + 1)
+    ix = np.clip(np.searchsorted(vol_edges, vol, side='right') - 1, 0, gridsize[0] - 1)
+    iy = np.clip(np.searchsorted(ret_edges, ret, side='right') - 1, 0, gridsize[1] - 1)
+    cells = ix * gridsize[1] + iy
+
+    counts = np.bincount(cells, minlength=gridsize[0] * gridsize[1]).reshape(gridsize)
+    best_sharpe = np.full(gridsize[0] * gridsize[1], -np.inf)
+    np.maximum.at(best_sharpe, cells, sharpe)
+
+    # The reducers work without weights too, here they are just zero-width
+    envelope = FrontierEnvelopeReducer([], (vol.min(), vol.max()), n_bins=n_bins)
+    envelope.update(np.empty((len(ret), 0)), ret, vol, sharpe)
+    frontier = envelope.result()
+
+    # Only the efficient part: drop buckets beaten by a lower volatility bucket
+    efficient = frontier['Returns'] >= frontier['Returns'].cummax()
+    frontier = frontier[efficient]
+
+    i, j = np.nanargmax(sharpe), np.nanargmin(vol)
+    return {
+        'vol_edges': vol_edges,
+        'ret_edges': ret_edges,
+        'counts': counts,
+        'best_sharpe': best_sharpe.reshape(gridsize),
+        'frontier_vol': frontier['Volatility'].to_numpy(),
+        'frontier_ret': frontier['Returns'].to_numpy(),
+        'max_sharpe_point': np.array([vol[i], ret[i], sharpe[i]]),
+        'min_volatility_point': np.array([vol[j], ret[j], sharpe[j]]),
+        'num_of_portfolios': np.array(len(ret)),
+    }
+
+
+def save_frontier_summary(summary: dict, path):
+    np.savez_compressed(path, **summary)
+
+
+def load_frontier_summary(path) -> dict:
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def plot_frontier(summary: dict, figsize=(10, 6)):
+    """
+    Draw the aggregated frontier: best Sharpe ratio per cell, the envelope and the optimal portfolios.
+    """
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=figsize)
+    best_sharpe = np.ma.masked_where(summary['counts'] == 0, summary['best_sharpe'])
+    mesh = ax.pcolormesh(summary['vol_edges'], summary['ret_edges'], best_sharpe.T, cmap='viridis', shading='flat')
+    fig.colorbar(mesh, ax=ax, label='Sharpe Ratio')
+
+    ax.plot(summary['frontier_vol'], summary['frontier_ret'], color='black', linewidth=1, label='Frontier Envelope')
+
+    # Highlighting the max Sharpe ratio and min volatility portfolios
+    max_sharpe, min_vol = summary['max_sharpe_point'], summary['min_volatility_point']
+    ax.scatter(max_sharpe[0], max_sharpe[1], color='red', marker='*', s=200, label='Max Sharpe Ratio')
+    ax.scatter(min_vol[0], min_vol[1], color='blue', marker='*', s=200, label='Min Volatility')
+
+    ax.set_xlabel('Volatility')
+    ax.set_ylabel('Returns')
+    ax.set_title(f"Monte Carlo Simulation: Efficient Frontier ({int(summary['num_of_portfolios']):,} portfolios)")
+    ax.legend()
+    return fig
+
+
+@timed('plot.render')
+def render_frontier_png(summary: dict, path, dpi=100):
+    """
+    Render the frontier plot once to a PNG, so it can be shown again without redrawing.
+    """
+    import matplotlib.pyplot as plt
+
+    fig = plot_frontier(summary)
+    fig.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
@@ -1,28 +1,186 @@
 from config import *
-# Set display options to resemble Jupyter Notebook
-pd.set_option('display.width', None)             # No limit on the width of the display
-pd.set_option('display.max_columns', None)       # Show all columns
-pd.set_option('display.max_rows', 20)            # Limit rows to prevent overflow
-pd.set_option('display.float_format', '{:.2f}'.format)  # Format float numbers
+from dataclasses import dataclass
 
-# Pre-processing Below
+from instrumentation import timed
+from price_store import load_prices, price_fields, save_prices
 
-# Load the data    -  note header=[0, 1] and index_col=0 is used to read multi-index columns preserving the nice format
-price_df: pd.DataFrame = pd.read_csv('stock_data.csv', header=[0, 1], index_col=0)
 
+"""
+Data-quality pipeline
+
+- Works on the whole (days, tickers) price matrix at once with NumPy, no per-ticker loops.
+- Steps: calendar alignment, bad tick (spike) removal, split detection, coverage trimming and
+  forward fill with a limit. The result has no missing values, so the statistics downstream
+  never fall back to pandas' pairwise NaN handling.
+
+"""
+
+# Split ratios we look for, as new price / old price (2-for-1, 3-for-2, ... and reverse splits)
+SPLIT_RATIOS = np.array([1 / 2, 2 / 3, 1 / 3, 1 / 4, 1 / 5, 1 / 8, 1 / 10, 1 / 20, 2, 3, 4, 5, 8, 10, 20])
+
+
+@dataclass
+class PricePanel:
+    prices: np.ndarray              # (days, tickers) float64, C-contiguous, no NaNs
+    dates: pd.DatetimeIndex
+    tickers: list
+    report: pd.DataFrame            # One row per input ticker: coverage, fills, outliers, splits, kept
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.prices, index=self.dates, columns=self.tickers, copy=False)
+
+
+def _align_calendar(price_df: pd.DataFrame, calendar=None):
+    """ Sorted, de-duplicated dates; calendar is None (days anyone traded), a pandas freq such as 'B', or a DatetimeIndex """
+    if not (price_df.index.is_monotonic_increasing and price_df.index.is_unique):
+        price_df = price_df[~price_df.index.duplicated(keep='last')].sort_index()
+    prices = price_df.to_numpy(dtype=float, copy=True)
+    dates = pd.DatetimeIndex(price_df.index)
+
+    if calendar is not None:
+        if isinstance(calendar, str):
+            calendar = pd.date_range(dates[0], dates[-1], freq=calendar)
+        positions = dates.get_indexer(calendar)
+        aligned = np.full((len(calendar), prices.shape[1]), np.nan)
+        aligned[positions >= 0] = prices[positions[positions >= 0]]
+        prices, dates = aligned, pd.DatetimeIndex(calendar)
+
+    # Zero or negative prices are bad data, and days where nothing traded are not trading days
+    prices[prices <= 0] = np.nan
+    traded = ~np.isnan(prices).all(axis=1)
+    if traded.all():
+        return prices, dates
+    return prices[traded], dates[traded]
+
+
+def _first_last_valid(valid):
+    n_days = len(valid)
+    first = np.where(valid.any(axis=0), valid.argmax(axis=0), n_days)
+    last = np.where(valid.any(axis=0), n_days - 1 - valid[::-1].argmax(axis=0), -1)
+    return first, last
+
+
+def _forward_fill(prices, limit):
+    """ Forward fill gaps of at most limit days; returns the filled matrix and the number of fills per ticker """
+    fills = np.zeros(prices.shape[1], dtype=int)
+    # Only tickers with gaps are touched
+    gappy = np.flatnonzero(np.isnan(prices).any(axis=0))
+    if not len(gappy):
+        return prices, fills
+
+    subset = prices[:, gappy]
+    valid = ~np.isnan(subset)
+    rows = np.arange(len(subset))[:, None]
+    last_valid = np.maximum.accumulate(np.where(valid, rows, -1), axis=0)
+    fill = ~valid & (last_valid >= 0) & (rows - last_valid <= limit)
+    columns = np.broadcast_to(np.arange(len(gappy)), subset.shape)
+    subset[fill] = subset[last_valid[fill], columns[fill]]
+    prices[:, gappy] = subset
+    fills[gappy] = fill.sum(axis=0)
+    return prices, fills
+
+
+def _spikes(log_return, abs_return, threshold):
+    """
+    Bad ticks: a daily log return more than threshold standard deviations out that is reversed the
+    next day, i.e. a single price off the path. Returns the (day, ticker) positions of the bad prices.
+    """
+    missing = np.isnan(log_return)
+    count = np.maximum(len(log_return) - missing.sum(axis=0), 2)
+    filled = np.where(missing, 0.0, log_return)
+    mean = filled.sum(axis=0) / count
+    scale = np.sqrt(np.maximum(np.einsum('ij,ij->j', filled, filled) / count - mean ** 2, 0.0))
 
-# Select only the 'Date' and 'Close' columns
-price_df = price_df.loc[:, (slice(None), 'Close')]
+    with np.errstate(invalid='ignore'):
+        rows, columns = np.nonzero(abs_return[:-1] > threshold * scale)
+    out, back = log_return[rows, columns], log_return[rows + 1, columns]
+    with np.errstate(invalid='ignore'):
+        reverted = (np.abs(back) > threshold * scale[columns]) & (np.abs(out + back) < 0.5 * np.abs(out))
+    return rows[reverted] + 1, columns[reverted]
 
-# Flatten the multi-index columns, we don't need the Price row
-price_df.columns = price_df.columns.get_level_values(0)
-#print(price_df.head())
 
+def _split_factors(log_return, abs_return, tolerance):
+    """
+    Detect splits as one-day price ratios within tolerance of a common split ratio, and return the
+    factor to multiply every earlier price by (1 everywhere else) for the tickers that split.
+    """
+    # Only the rare big moves are checked against every candidate ratio
+    with np.errstate(invalid='ignore'):
+        rows, columns = np.nonzero(abs_return > np.log(1.45))
+    moves = np.exp(log_return[rows, columns])
+    matches = np.abs(moves[:, None] / SPLIT_RATIOS - 1.0) < tolerance
+    is_split = matches.any(axis=1)
+    rows, columns = rows[is_split], columns[is_split]
 
-# Saving the data to a CSV file
-price_df.to_csv('stock_data_cleaned.csv', index=True)
+    # Every price before a split is scaled by its ratio
+    split_columns = np.unique(columns)
+    jumps = np.ones((len(log_return), len(split_columns)))
+    jumps[rows, np.searchsorted(split_columns, columns)] = SPLIT_RATIOS[matches[is_split].argmax(axis=1)]
+    factors = np.ones((len(log_return) + 1, len(split_columns)))
+    factors[:-1] = np.cumprod(jumps[::-1], axis=0)[::-1]
+    return split_columns, factors, np.bincount(columns, minlength=log_return.shape[1])
 
 
+@timed('preprocess.clean_prices')
+def clean_prices(price_df: pd.DataFrame, calendar=None, ffill_limit=5, min_coverage=0.8, adjust_splits=False,
+                 split_tolerance=0.05, outlier_threshold=8.0) -> PricePanel:
+    """
+    Turn one price per ticker (e.g. the 'Close' columns) into a complete, aligned PricePanel.
+
+    - calendar: None keeps every day any ticker traded, or a pandas freq ('B') / DatetimeIndex to align to.
+    - adjust_splits=True scales prices before a detected split (a one-day move within split_tolerance of a
+      ratio in SPLIT_RATIOS). Only for raw, unadjusted prices: on adjusted prices a genuine -33% or +100%
+      day would be taken for a split and rescale the history before it.
+    - Spikes beyond outlier_threshold standard deviations that revert the next day are treated as missing.
+    - Tickers whose listed span covers less than min_coverage of the calendar are dropped (e.g. a late
+      listing), then the panel is trimmed to the span every remaining ticker covers.
+    - Gaps of up to ffill_limit days are forward filled; days with longer gaps are dropped.
+    """
+    tickers = np.asarray(price_df.columns.astype(str))
+    prices, dates = _align_calendar(price_df, calendar)
+    n_days = len(dates)
+
+    # Detection only compares big moves against thresholds, so float32 is plenty and twice as fast
+    log_return = np.diff(np.log(prices, dtype=np.float32), axis=0)
+    abs_return = np.abs(log_return)
+
+    # Spikes first: a bad tick and its reversal would otherwise look like two splits
+    spike_rows, spike_columns = _spikes(log_return, abs_return, outlier_threshold)
+    prices[spike_rows, spike_columns] = np.nan
+    abs_return[spike_rows - 1, spike_columns] = np.nan      # The move into and out of the bad price
+    abs_return[spike_rows, spike_columns] = np.nan
+
+    splits = np.zeros(len(tickers), dtype=int)
+    if adjust_splits:
+        split_columns, factors, splits = _split_factors(log_return, abs_return, split_tolerance)
+        prices[:, split_columns] *= factors
+
+    first, last = _first_last_valid(~np.isnan(prices))
+    coverage = np.clip(last - first + 1, 0, None) / max(n_days, 1)
+    kept = coverage >= min_coverage
+
+    start = first[kept].max() if kept.any() else 0
+    stop = last[kept].min() + 1 if kept.any() else 0
+    prices, filled = _forward_fill(prices[start:stop] if kept.all() else prices[start:stop, kept], ffill_limit)
+
+    complete = ~np.isnan(prices).any(axis=1)
+    panel_dates = dates[start:stop]
+    if not complete.all():
+        prices, panel_dates = prices[complete], panel_dates[complete]
+
+    fills = np.zeros(len(tickers), dtype=int)
+    fills[kept] = filled
+    report = pd.DataFrame({
+        'First Date': dates[np.minimum(first, n_days - 1)].where(first < n_days),
+        'Last Date': dates[np.maximum(last, 0)].where(last >= 0),
+        'Coverage': coverage,
+        'Filled': fills,
+        'Outliers': np.bincount(spike_columns, minlength=len(tickers)),
+        'Splits': splits,
+        'Kept': kept,
+    }, index=pd.Index(tickers, name='Ticker'))
+
+    return PricePanel(prices=prices, dates=panel_dates, tickers=list(tickers[kept]), report=report)
 
 
 """
@@ -30,9 +188,38 @@ Below are functions for Streamlit app.
 
 """
 
-def preprocess_stock_data(input_path='data/stock_data.csv', output_path='data/stock_data_cleaned.csv'):
-    price_df = pd.read_csv(input_path, header=[0, 1], index_col=0)
-    price_df = price_df.loc[:, (slice(None), 'Close')]
-    price_df.columns = price_df.columns.get_level_values(0)
-    price_df.to_csv(output_path, index=True)
-    return price_df
\ No newline at end of file
+@timed('preprocess')
+def preprocess_stock_data(input_path='data/stock_data.feather', output_path='data/stock_data_cleaned.feather',
+                          adjusted=True, **clean_options):
+    """
+    Load one price per ticker, run it through clean_prices and save the cleaned prices.
+
+    - adjusted=True uses 'Adj Close' when the raw data has it, otherwise 'Close'
+      (recent yfinance versions already adjust 'Close' and have no 'Adj Close').
+    - adjusted=False reads the raw 'Close' and detects splits in it (adjust_splits).
+    - clean_options are passed to clean_prices.
+    """
+    field = 'Adj Close' if adjusted and 'Adj Close' in price_fields(input_path) else 'Close'
+    clean_options.setdefault('adjust_splits', not adjusted)
+    panel = clean_prices(load_prices(input_path, field=field), **clean_options)
+    price_df = panel.to_frame()
+    save_prices(price_df, output_path)
+    return price_df
+
+
+"""
+Script: python preprocess_data.py
+
+"""
+
+def main():
+    # Pre-processing Below
+
+    # Load only the 'Close' columns, flattened to one column per ticker (we don't need the Price row),
+    # clean them and save them to the price store
+    price_df: pd.DataFrame = preprocess_stock_data('stock_data.feather', 'stock_data_cleaned.feather')
+    #print(price_df.head())
+
+
+if __name__ == '__main__':
+    main()
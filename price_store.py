@@ -0,0 +1,153 @@
+from config import *
+
+from instrumentation import count, timed
+
+"""
+Columnar price store.
+
+- Raw yfinance data (Ticker, Price) multi-index columns and cleaned single-level price frames are both
+  kept as uncompressed Feather (Arrow IPC) files, one float64 column per series.
+- Reads are memory-mapped and only touch the requested columns, so loading the Close prices of a few
+  tickers out of a large universe never reads the rest of the file.
+- CSV files (e.g. uploads in the yfinance multi-index format) are still accepted by load_prices.
+- pyarrow is only imported when a Feather file is actually read or written.
+
+"""
+
+INDEX_COLUMN = '__index__'
+SEPARATOR = '|'       # Raw columns are stored as 'AAPL|Close'
+
+
+def _is_feather(path):
+    return pathlib.Path(path).suffix in ('.feather', '.arrow')
+
+
+def _datetime_index(index):
+    index = pd.to_datetime(index)
+    return index.tz_localize(None) if index.tz is not None else index
+
+
+@timed('save_prices')
+def save_prices(price_df: pd.DataFrame, path):
+    """
+    Save raw (multi-index columns) or cleaned (one column per ticker) prices.
+
+    - A .csv path keeps writing CSV, anything else is written as Feather.
+    """
+    if not _is_feather(path):
+        price_df.to_csv(path, index=True)
+        return
+
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    layout = 'raw' if isinstance(price_df.columns, pd.MultiIndex) else 'cleaned'
+    if layout == 'raw':
+        names = [SEPARATOR.join(map(str, column)) for column in price_df.columns]
+    else:
+        names = [str(column) for column in price_df.columns]
+
+    index = _datetime_index(price_df.index)
+    arrays = [pa.array(index.to_numpy())]
+    arrays += [pa.array(price_df.iloc[:, i].to_numpy(dtype=float)) for i in range(price_df.shape[1])]
+
+    # Plain NumPy arrays keep NaN as NaN rather than null, so columns can be read back zero-copy
+    table = pa.Table.from_arrays(arrays, names=[INDEX_COLUMN] + names)
+    table = table.replace_schema_metadata({'layout': layout})
+    feather.write_feather(table, str(path), compression='uncompressed')
+
+
+def _feather_columns(path):
+    import pyarrow as pa
+
+    # Only the footer is read here, not the data
+    schema = pa.ipc.open_file(pa.memory_map(str(path))).schema
+    layout = (schema.metadata or {}).get(b'layout', b'cleaned').decode()
+    return layout, [name for name in schema.names if name != INDEX_COLUMN]
+
+
+def _load_feather(path, field, tickers):
+    import pyarrow.feather as feather
+
+    layout, names = _feather_columns(path)
+
+    if layout == 'raw':
+        pairs = [tuple(name.split(SEPARATOR, 1)) for name in names]
+        if tickers is not None:
+            pairs = [pair for pair in pairs if pair[0] in tickers]
+        if field is not None:
+            pairs = [pair for pair in pairs if pair[1] == field]
+        selected = [SEPARATOR.join(pair) for pair in pairs]
+    else:
+        selected = names if tickers is None else [name for name in names if name in tickers]
+
+    table = feather.read_table(str(path), columns=[INDEX_COLUMN] + selected, memory_map=True)
+    count('prices.bytes_read', table.nbytes)
+    index = pd.DatetimeIndex(table.column(INDEX_COLUMN).to_numpy(), name='Date')
+    # Columns come out of the memory map zero-copy, the DataFrame below is the only copy
+    data = {name: table.column(name).to_numpy() for name in selected}
+    price_df = pd.DataFrame(data, index=index, columns=selected)
+
+    if layout == 'raw':
+        if field is not None:
+            price_df.columns = [pair[0] for pair in pairs]
+            price_df.columns.name = None
+        else:
+            price_df.columns = pd.MultiIndex.from_tuples(pairs, names=['Ticker', 'Price'])
+    return price_df
+
+
+def _csv_is_multi_index(path):
+    # yfinance multi-index CSVs have two header rows followed by an empty 'Date,,,' row
+    with open(path) as f:
+        lines = [f.readline().rstrip('\r\n') for _ in range(3)]
+    # A short file has no third row, and a one column file no empty fields to check
+    values = lines[2].split(',')
+    return len(values) > 1 and all(value == '' for value in values[1:])
+
+
+def _load_csv(path, field, tickers):
+    count('prices.bytes_read', pathlib.Path(path).stat().st_size)
+    if _csv_is_multi_index(path):
+        price_df = pd.read_csv(path, header=[0, 1], index_col=0)
+        price_df.index = _datetime_index(price_df.index)
+        if field is not None:
+            price_df = price_df.loc[:, (slice(None), field)]
+            price_df.columns = price_df.columns.get_level_values(0)
+            price_df.columns.name = None
+    else:
+        price_df = pd.read_csv(path, index_col=0, parse_dates=True)
+
+    if tickers is not None:
+        level = price_df.columns.get_level_values(0)
+        price_df = price_df.loc[:, level.isin(tickers)]
+    return price_df
+
+
+def price_fields(path) -> list:
+    """
+    The price fields (e.g. 'Close', 'Adj Close') of a raw multi-index file, without reading the prices.
+    Cleaned files have none.
+    """
+    if _is_feather(path):
+        layout, names = _feather_columns(path)
+        fields = [name.split(SEPARATOR, 1)[1] for name in names] if layout == 'raw' else []
+    elif _csv_is_multi_index(path):
+        fields = pd.read_csv(path, header=[0, 1], index_col=0, nrows=0).columns.get_level_values(1)
+    else:
+        fields = []
+    return list(dict.fromkeys(fields))
+
+
+@timed('load_prices')
+def load_prices(path, field=None, tickers=None) -> pd.DataFrame:
+    """
+    Load prices from a Feather or CSV file.
+
+    - field picks one price field (e.g. 'Close') out of raw multi-index data, giving one column per ticker.
+    - tickers restricts the columns to the given symbols.
+    - Cleaned files ignore field since they only hold one price per ticker.
+    """
+    if _is_feather(path):
+        return _load_feather(path, field, tickers)
+    return _load_csv(path, field, tickers)
@@ -0,0 +1,125 @@
+from config import *
+
+"""
+Streaming reducers for the Monte Carlo simulation.
+
+- Each reducer sees the simulation one chunk at a time through update(weights, ret, vol, sharpe)
+  and only keeps what it needs, so memory does not grow with the number of portfolios.
+
+"""
+
+
+def portfolio_frame(symbols, weights, ret, vol, sharpe):
+    frame = pd.DataFrame(weights, columns=symbols)
+    frame.insert(0, 'Sharpe Ratio', sharpe)
+    frame.insert(0, 'Volatility', vol)
+    frame.insert(0, 'Returns', ret)
+    return frame
+
+
+class OptimalPortfolioReducer:
+    """
+    Keep the max Sharpe ratio and min volatility portfolios seen so far.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = list(symbols)
+        self.max_sharpe = None
+        self.min_volatility = None
+
+    def update(self, weights, ret, vol, sharpe):
+        i = np.nanargmax(sharpe)
+        if self.max_sharpe is None or sharpe[i] > self.max_sharpe[3]:
+            self.max_sharpe = (weights[i].copy(), ret[i], vol[i], sharpe[i])
+
+        j = np.nanargmin(vol)
+        if self.min_volatility is None or vol[j] < self.min_volatility[2]:
+            self.min_volatility = (weights[j].copy(), ret[j], vol[j], sharpe[j])
+
+    def _as_series(self, best):
+        weights, ret, vol, sharpe = best
+        return portfolio_frame(self.symbols, weights[None, :], [ret], [vol], [sharpe]).iloc[0]
+
+    def result(self):
+        return {
+            'max_sharpe': self._as_series(self.max_sharpe),
+            'min_volatility': self._as_series(self.min_volatility),
+        }
+
+
+class TopKReducer:
+    """
+    Keep the k portfolios with the highest Sharpe ratio.
+
+    - Each chunk is cut down to its own top k with np.argpartition before merging.
+    """
+
+    def __init__(self, symbols, k=100):
+        self.symbols = list(symbols)
+        self.k = k
+        self.weights = np.empty((0, len(self.symbols)))
+        self.ret = np.empty(0)
+        self.vol = np.empty(0)
+        self.sharpe = np.empty(0)
+
+    def _keep(self, sharpe):
+        sharpe = np.nan_to_num(sharpe, nan=-np.inf)
+        if len(sharpe) <= self.k:
+            return np.arange(len(sharpe))
+        return np.argpartition(sharpe, -self.k)[-self.k:]
+
+    def update(self, weights, ret, vol, sharpe):
+        keep = self._keep(sharpe)
+        self.weights = np.concatenate([self.weights, weights[keep]])
+        self.ret = np.concatenate([self.ret, ret[keep]])
+        self.vol = np.concatenate([self.vol, vol[keep]])
+        self.sharpe = np.concatenate([self.sharpe, sharpe[keep]])
+
+        keep = self._keep(self.sharpe)
+        self.weights, self.ret, self.vol, self.sharpe = (
+            self.weights[keep], self.ret[keep], self.vol[keep], self.sharpe[keep])
+
+    def result(self):
+        order = np.argsort(-np.nan_to_num(self.sharpe, nan=-np.inf), kind='stable')
+        return portfolio_frame(
+            self.symbols, self.weights[order], self.ret[order], self.vol[order], self.sharpe[order])
+
+
+class FrontierEnvelopeReducer:
+    """
+    Keep the best return seen in each volatility bucket, i.e. a binned efficient frontier.
+
+    - vol_range fixes the bucket edges up front, so chunks can be folded in one at a time.
+      Volatilities outside of it land in the first or last bucket.
+    """
+
+    def __init__(self, symbols, vol_range, n_bins=100):
+        self.symbols = list(symbols)
+        self.edges = np.linspace(vol_range[0], vol_range[1], n_bins + 1)
+        self.weights = np.full((n_bins, len(self.symbols)), np.nan)
+        self.ret = np.full(n_bins, -np.inf)
+        self.vol = np.full(n_bins, np.nan)
+        self.sharpe = np.full(n_bins, np.nan)
+
+    def update(self, weights, ret, vol, sharpe):
+        n_bins = len(self.ret)
+        bins = np.clip(np.searchsorted(self.edges, vol, side='right') - 1, 0, n_bins - 1)
+
+        # Best row per bin within the chunk: sort by (bin, return) and take the last row of each bin
+        order = np.lexsort((np.nan_to_num(ret, nan=-np.inf), bins))
+        last = np.r_[bins[order][1:] != bins[order][:-1], True]
+        best_rows = order[last]
+        best_bins = bins[best_rows]
+
+        better = ret[best_rows] > self.ret[best_bins]
+        rows, target = best_rows[better], best_bins[better]
+        self.weights[target] = weights[rows]
+        self.ret[target] = ret[rows]
+        self.vol[target] = vol[rows]
+        self.sharpe[target] = sharpe[rows]
+
+    def result(self):
+        filled = np.isfinite(self.ret)
+        frontier = portfolio_frame(
+            self.symbols, self.weights[filled], self.ret[filled], self.vol[filled], self.sharpe[filled])
+        return frontier.sort_values('Volatility', ignore_index=True)
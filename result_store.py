@@ -0,0 +1,143 @@
+from config import *
+import json
+
+from instrumentation import timed
+
+"""
+Simulation result store.
+
+- Returns, Volatility, Sharpe Ratio and one weight column per symbol are written as typed Arrow IPC
+  columns (float64, or float32 to halve the size), compressed per record batch with zstd or lz4.
+- Rows are sorted by Sharpe ratio (best first) and written in fixed size batches. The schema metadata
+  holds the run metadata (seed, sampler, data fingerprint, ...) and a summary block with the min / max
+  of every metric per batch.
+- Queries open the file memory-mapped and use the summary to decompress only the batches that can
+  contain an answer: the top 100 portfolios by Sharpe ratio only touch the first batch.
+- pyarrow is only imported when a result file is actually read or written.
+
+"""
+
+METRIC_COLUMNS = ['Returns', 'Volatility', 'Sharpe Ratio']
+
+
+def _weights_matrix(simulations_df):
+    """ Weights as an (m, num_of_symbols) matrix, from one column per symbol or a 'Weights' column of arrays """
+    if 'Weights' in simulations_df.columns:
+        return np.stack(simulations_df['Weights'].to_numpy()), None
+    symbols = [column for column in simulations_df.columns if column not in METRIC_COLUMNS]
+    if not symbols:
+        return None, []
+    return simulations_df[symbols].to_numpy(), symbols
+
+
+@timed('results.save')
+def save_results(simulations_df: pd.DataFrame, path, metadata=None, symbols=None, dtype=np.float64,
+                 compression='zstd', batch_size=65536):
+    """
+    Save a simulation DataFrame (Returns, Volatility, Sharpe Ratio, and optionally weights) to a result file.
+
+    - Weights are taken from one column per symbol, or from the 'Weights' column of arrays written by the
+      script; symbols names them in the latter case. Results without weights are stored as metrics only.
+    - metadata is any JSON-serialisable dict, e.g. seed, sampler and the data fingerprint of the run.
+    - compression=None writes uncompressed batches, which are read back zero-copy.
+    """
+    import pyarrow as pa
+
+    weights, weight_symbols = _weights_matrix(simulations_df)
+    if weight_symbols is None:
+        weight_symbols = list(symbols) if symbols is not None else [f"Asset {i}" for i in range(weights.shape[1])]
+
+    order = np.argsort(-simulations_df['Sharpe Ratio'].to_numpy(), kind='stable')
+    columns = [simulations_df[name].to_numpy()[order].astype(dtype) for name in METRIC_COLUMNS]
+    if weights is not None:
+        weights = weights[order].astype(dtype)
+        columns += [np.ascontiguousarray(weights[:, i]) for i in range(weights.shape[1])]
+    names = METRIC_COLUMNS + [str(symbol) for symbol in weight_symbols]
+
+    # Per batch min / max of every metric, so queries can skip batches without reading them
+    batches = []
+    for start in range(0, len(order), batch_size):
+        batch = {'rows': int(min(batch_size, len(order) - start))}
+        for name, column in zip(METRIC_COLUMNS, columns):
+            part = column[start:start + batch_size]
+            batch[name] = [float(np.nanmin(part)), float(np.nanmax(part))]
+        batches.append(batch)
+
+    summary = {'num_of_portfolios': int(len(order)), 'batch_size': int(batch_size), 'symbols': [str(s) for s in weight_symbols],
+               'dtype': np.dtype(dtype).name, 'batches': batches}
+    schema = pa.schema([pa.field(name, pa.from_numpy_dtype(np.dtype(dtype))) for name in names],
+                       metadata={'metadata': json.dumps(metadata or {}, default=str), 'summary': json.dumps(summary)})
+
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    with pa.OSFile(str(path), 'wb') as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        for start in range(0, len(order), batch_size):
+            writer.write_batch(pa.record_batch([column[start:start + batch_size] for column in columns], schema=schema))
+
+
+class ResultStore:
+    """
+    Read-only, memory-mapped view of a result file written by save_results.
+    """
+
+    def __init__(self, path):
+        import pyarrow as pa
+
+        self.path = pathlib.Path(path)
+        self._reader = pa.ipc.open_file(pa.memory_map(str(path)))
+        schema_metadata = self._reader.schema.metadata
+        self.metadata = json.loads(schema_metadata[b'metadata'])
+        self.summary = json.loads(schema_metadata[b'summary'])
+        self.symbols = self.summary['symbols']
+
+    def __len__(self):
+        return self.summary['num_of_portfolios']
+
+    def _batch(self, i, columns=None) -> pd.DataFrame:
+        batch = self._reader.get_batch(i)
+        columns = columns or batch.schema.names
+        return pd.DataFrame({name: batch.column(name).to_numpy() for name in columns}, columns=columns)
+
+    def read(self, columns=None) -> pd.DataFrame:
+        """ Every portfolio, sorted by Sharpe ratio; columns=METRIC_COLUMNS skips the weights """
+        frames = [self._batch(i, columns) for i in range(self._reader.num_record_batches)]
+        if not frames:
+            return pd.DataFrame(columns=columns or METRIC_COLUMNS + self.symbols)
+        return pd.concat(frames, ignore_index=True)
+
+    def top_sharpe(self, k=100) -> pd.DataFrame:
+        """ The k best portfolios by Sharpe ratio, best first, read from the first batches only """
+        frames, rows = [], 0
+        for i, batch in enumerate(self.summary['batches']):
+            if rows >= k:
+                break
+            frames.append(self._batch(i))
+            rows += batch['rows']
+        if not frames:
+            return pd.DataFrame(columns=METRIC_COLUMNS + self.symbols)
+        return pd.concat(frames, ignore_index=True).iloc[:k]
+
+    def min_volatility(self, min_return=None) -> pd.Series:
+        """
+        The least volatile portfolio, optionally among those returning at least min_return.
+
+        - Batches whose max return is below min_return, or whose min volatility cannot beat the best
+          portfolio found so far, are never read. Returns None if no portfolio qualifies.
+        """
+        candidates = [
+            (batch['Volatility'][0], i) for i, batch in enumerate(self.summary['batches'])
+            if min_return is None or batch['Returns'][1] >= min_return
+        ]
+
+        best = None
+        for batch_min_vol, i in sorted(candidates):
+            if best is not None and batch_min_vol >= best['Volatility']:
+                break
+            frame = self._batch(i)
+            if min_return is not None:
+                frame = frame[frame['Returns'] >= min_return]
+            if frame.empty:
+                continue
+            row = frame.loc[frame['Volatility'].idxmin()]
+            if best is None or row['Volatility'] < best['Volatility']:
+                best = row
+        return best
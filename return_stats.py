@@ -0,0 +1,273 @@
+from config import *
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+
+from covariance import get_covariance_estimator
+from instrumentation import count, stage
+from price_store import load_prices
+
+"""
+Cached return statistics.
+
+- Log returns, annualised mean / covariance and the Cholesky factor are computed once per dataset
+  and reused by the simulation, the metrics and the optimiser.
+- Statistics are keyed by a fingerprint of the price data, date range and covariance estimator,
+  memoized in memory (LRU) and in .npz files under STATS_CACHE_DIR (LRU by access time).
+
+"""
+
+STATS_CACHE_DIR = pathlib.Path('data/stats_cache')
+MEMORY_CACHE_SIZE = 32
+DISK_CACHE_SIZE = 64
+
+_memory_cache = OrderedDict()
+_memory_lock = threading.Lock()       # Jobs and batch workers share the cache across threads
+
+
+@dataclass
+class ReturnStats:
+    fingerprint: str
+    symbols: list
+    log_return: pd.DataFrame
+    mean: np.ndarray                # Annualised expected returns
+    cov: np.ndarray                 # Annualised covariance matrix
+    cov_chol: np.ndarray = None     # Lower Cholesky factor of cov, None if cov is not positive definite
+    factor_loadings: np.ndarray = None  # Factor models only: cov = B B.T + diag(specific_var), annualised
+    specific_var: np.ndarray = None
+
+    @property
+    def factors(self):
+        """ (loadings, specific_var) for a factor model covariance, otherwise None """
+        return None if self.factor_loadings is None else (self.factor_loadings, self.specific_var)
+
+    @property
+    def mean_series(self) -> pd.Series:
+        return pd.Series(self.mean, index=self.symbols)
+
+    @property
+    def cov_frame(self) -> pd.DataFrame:
+        return pd.DataFrame(self.cov, index=self.symbols, columns=self.symbols)
+
+    def astype(self, dtype):
+        """ The same statistics with the mean / covariance arrays cast to dtype (e.g. np.float32 for scoring) """
+        if self.mean.dtype == dtype:
+            return self
+
+        def cast(array):
+            return None if array is None else array.astype(dtype)
+
+        return replace(self, mean=cast(self.mean), cov=cast(self.cov), cov_chol=cast(self.cov_chol),
+                       factor_loadings=cast(self.factor_loadings), specific_var=cast(self.specific_var))
+
+
+def cholesky_or_none(cov):
+    try:
+        return np.linalg.cholesky(cov)
+    except np.linalg.LinAlgError:
+        return None
+
+
+def _date_key(start_date, end_date):
+    return f"{start_date}|{end_date}".encode()
+
+
+def dataset_fingerprint(processed_df: pd.DataFrame, start_date=None, end_date=None) -> str:
+    """
+    Hash the contents of a cleaned price DataFrame together with the requested date range.
+    """
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(processed_df, index=True).to_numpy().tobytes())
+    digest.update('|'.join(map(str, processed_df.columns)).encode())
+    digest.update(_date_key(start_date, end_date))
+    return digest.hexdigest()
+
+
+def file_fingerprint(path, start_date=None, end_date=None) -> str:
+    """
+    Hash the raw bytes of a cleaned price file together with the requested date range, without parsing it.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    digest.update(_date_key(start_date, end_date))
+    return digest.hexdigest()
+
+
+def _estimator_fingerprint(fingerprint, estimator):
+    # The sample covariance keeps the plain fingerprint, so existing cache entries stay valid
+    return fingerprint if estimator.key == 'sample' else f"{fingerprint}-{estimator.key}"
+
+
+def _stats_from_log_return(log_return: pd.DataFrame, fingerprint, estimator) -> ReturnStats:
+    cov, factors = estimator(log_return)
+    cov = cov * 252
+    loadings, specific_var = factors if factors is not None else (None, None)
+    return ReturnStats(
+        fingerprint=fingerprint,
+        symbols=list(log_return.columns),
+        log_return=log_return,
+        mean=(log_return.mean() * 252).to_numpy(),
+        cov=cov,
+        cov_chol=cholesky_or_none(cov),
+        factor_loadings=loadings * np.sqrt(252) if loadings is not None else None,
+        specific_var=specific_var * 252 if specific_var is not None else None,
+    )
+
+
+def compute_return_stats(processed_df: pd.DataFrame, fingerprint=None, covariance=None) -> ReturnStats:
+    """
+    Compute the statistics from scratch. Same pandas semantics as before (NaNs skipped per column / pair).
+
+    - covariance picks the covariance estimator, a name or instance from covariance.py (default 'sample').
+    """
+    estimator = get_covariance_estimator(covariance)
+    log_return = np.log(1 + processed_df.pct_change())
+    fingerprint = fingerprint or _estimator_fingerprint(dataset_fingerprint(processed_df), estimator)
+    return _stats_from_log_return(log_return, fingerprint, estimator)
+
+
+"""
+Memory and disk caches
+
+"""
+
+def _remember(stats: ReturnStats):
+    with _memory_lock:
+        _memory_cache[stats.fingerprint] = stats
+        _memory_cache.move_to_end(stats.fingerprint)
+        while len(_memory_cache) > MEMORY_CACHE_SIZE:
+            _memory_cache.popitem(last=False)
+
+
+def _disk_path(fingerprint):
+    return STATS_CACHE_DIR / f"{fingerprint}.npz"
+
+
+def _save_to_disk(stats: ReturnStats):
+    STATS_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    index = stats.log_return.index
+    # Write then rename: processes computing the same statistics at once must not interleave
+    # their writes, and readers must never load a half written file
+    path = _disk_path(stats.fingerprint)
+    partial = tempfile.NamedTemporaryFile(dir=STATS_CACHE_DIR, prefix=f"{stats.fingerprint}.", suffix='.tmp',
+                                          delete=False)
+    try:
+        with partial:
+            np.savez(
+                partial,
+                symbols=np.asarray(stats.symbols, dtype=str),
+                index=np.asarray(index.astype(str), dtype=str),
+                index_is_datetime=isinstance(index, pd.DatetimeIndex),
+                log_return=stats.log_return.to_numpy(),
+                mean=stats.mean,
+                cov=stats.cov,
+                cov_chol=stats.cov_chol if stats.cov_chol is not None else np.empty((0, 0)),
+                factor_loadings=stats.factor_loadings if stats.factor_loadings is not None else np.empty((0, 0)),
+                specific_var=stats.specific_var if stats.specific_var is not None else np.empty(0),
+            )
+        os.replace(partial.name, path)
+    finally:
+        pathlib.Path(partial.name).unlink(missing_ok=True)
+
+    # Evict the least recently used files
+    cached = sorted(STATS_CACHE_DIR.glob('*.npz'), key=lambda p: p.stat().st_mtime)
+    for stale in cached[:-DISK_CACHE_SIZE]:
+        stale.unlink(missing_ok=True)
+
+
+def _load_from_disk(fingerprint):
+    path = _disk_path(fingerprint)
+    if not path.exists():
+        return None
+
+    with np.load(path, allow_pickle=False) as data:
+        symbols = data['symbols'].tolist()
+        index = pd.Index(data['index'])
+        if data['index_is_datetime']:
+            index = pd.to_datetime(index)
+        cov_chol = data['cov_chol']
+        has_factors = 'factor_loadings' in data.files and data['factor_loadings'].size
+        stats = ReturnStats(
+            fingerprint=fingerprint,
+            symbols=symbols,
+            log_return=pd.DataFrame(data['log_return'], index=index, columns=symbols),
+            mean=data['mean'],
+            cov=data['cov'],
+            cov_chol=cov_chol if cov_chol.size else None,
+            factor_loadings=data['factor_loadings'] if has_factors else None,
+            specific_var=data['specific_var'] if has_factors else None,
+        )
+
+    path.touch()  # Mark as recently used
+    return stats
+
+
+def _cached(fingerprint, compute, use_disk):
+    with _memory_lock:
+        stats = _memory_cache.get(fingerprint)
+    if stats is not None:
+        count('stats.memory_hits')
+    elif use_disk:
+        stats = _load_from_disk(fingerprint)
+        if stats is not None:
+            count('stats.disk_hits')
+    if stats is None:
+        count('stats.misses')
+        with stage('return_stats.compute'):
+            stats = compute()
+        if use_disk:
+            _save_to_disk(stats)
+    _remember(stats)
+    return stats
+
+
+def get_return_stats(processed_df: pd.DataFrame, start_date=None, end_date=None, use_disk=True,
+                     covariance=None) -> ReturnStats:
+    """
+    Return statistics for a cleaned price DataFrame, computing them only on a cache miss.
+
+    - covariance picks the covariance estimator, see compute_return_stats.
+    """
+    estimator = get_covariance_estimator(covariance)
+    fingerprint = _estimator_fingerprint(dataset_fingerprint(processed_df, start_date, end_date), estimator)
+
+    def compute():
+        return compute_return_stats(processed_df.loc[start_date:end_date], fingerprint, estimator)
+
+    return _cached(fingerprint, compute, use_disk)
+
+
+def load_return_stats(path, start_date=None, end_date=None, use_disk=True, covariance=None) -> ReturnStats:
+    """
+    Return statistics for a cleaned price file. On a cache hit the file is not parsed at all.
+    """
+    estimator = get_covariance_estimator(covariance)
+    fingerprint = _estimator_fingerprint(file_fingerprint(path, start_date, end_date), estimator)
+
+    def compute():
+        processed_df = load_prices(path)
+        return compute_return_stats(processed_df.loc[start_date:end_date], fingerprint, estimator)
+
+    return _cached(fingerprint, compute, use_disk)
+
+
+def get_log_return_stats(log_return: pd.DataFrame, covariance=None) -> ReturnStats:
+    """
+    Same as get_return_stats for callers that already hold the log returns (memory cache only).
+    """
+    estimator = get_covariance_estimator(covariance)
+    fingerprint = _estimator_fingerprint('log-' + dataset_fingerprint(log_return), estimator)
+    return _cached(fingerprint, lambda: _stats_from_log_return(log_return, fingerprint, estimator), use_disk=False)
+
+
+def clear_return_stats_cache(disk=False):
+    with _memory_lock:
+        _memory_cache.clear()
+    if disk and STATS_CACHE_DIR.exists():
+        for path in STATS_CACHE_DIR.glob('*.npz'):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,141 @@
+from config import *
+import warnings
+
+"""
+Weight samplers for the Monte Carlo simulation.
+
+- A sampler is called as sampler(rng, size, num_of_symbols) and returns a (size, num_of_symbols)
+  matrix of long-only weights, each row summing to 1.
+- UniformSampler is the original np.random.random draw normalised to 1. It is not uniform on the
+  simplex: it piles mass near equal weights and rarely reaches the corners.
+- Bounds, sector caps, cardinality and shorting are handled by constraints.ConstrainedSampler.
+
+"""
+
+
+class UniformSampler:
+    name = 'uniform'
+
+    def __call__(self, rng, size, num_of_symbols):
+        weights = rng.random((size, num_of_symbols))
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+
+class DirichletSampler:
+    """
+    Dirichlet(alpha) weights. alpha=1 is uniform on the simplex, alpha < 1 favours corners
+    (concentrated portfolios), alpha > 1 favours equal weights.
+    """
+    name = 'dirichlet'
+
+    def __init__(self, alpha=1.0):
+        self.alpha = alpha
+
+    def __call__(self, rng, size, num_of_symbols):
+        # Normalised gammas are Dirichlet, and much faster than rng.dirichlet for large batches
+        weights = rng.standard_gamma(self.alpha, size=(size, num_of_symbols))
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+
+class _QuasiRandomSampler:
+    """
+    Low-discrepancy points mapped onto the simplex through -log(u), i.e. the inverse CDF
+    construction of Dirichlet(1), so they cover the simplex evenly rather than clumping.
+
+    - Every chunk is its own scrambled sequence seeded from the chunk's Generator.
+    """
+
+    def _engine(self, num_of_symbols, rng):
+        raise NotImplementedError
+
+    def __call__(self, rng, size, num_of_symbols):
+        engine = self._engine(num_of_symbols, rng)
+        with warnings.catch_warnings():
+            # Sobol' prefers powers of 2, chunks are whatever size they are
+            warnings.simplefilter('ignore', UserWarning)
+            points = engine.random(size)
+        weights = -np.log1p(-points)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+
+class SobolSampler(_QuasiRandomSampler):
+    name = 'sobol'
+
+    def _engine(self, num_of_symbols, rng):
+        from scipy.stats import qmc
+        return qmc.Sobol(d=num_of_symbols, scramble=True, seed=rng)
+
+
+class HaltonSampler(_QuasiRandomSampler):
+    name = 'halton'
+
+    def _engine(self, num_of_symbols, rng):
+        from scipy.stats import qmc
+        return qmc.Halton(d=num_of_symbols, scramble=True, seed=rng)
+
+
+class SparseSampler:
+    """
+    Cardinality-constrained draws: each portfolio holds max_assets randomly chosen assets,
+    with Dirichlet(alpha) weights among them.
+    """
+    name = 'sparse'
+
+    def __init__(self, max_assets=5, alpha=1.0):
+        self.max_assets = max_assets
+        self.alpha = alpha
+
+    def __call__(self, rng, size, num_of_symbols):
+        weights = rng.standard_gamma(self.alpha, size=(size, num_of_symbols))
+        k = min(self.max_assets, num_of_symbols)
+        if k < num_of_symbols:
+            # Zero all but k random assets per row
+            dropped = np.argpartition(rng.random((size, num_of_symbols)), k, axis=1)[:, k:]
+            np.put_along_axis(weights, dropped, 0.0, axis=1)
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+
+class LocalSampler:
+    """
+    Perturbation search around a current best portfolio: Dirichlet draws centred on center.
+
+    - Higher concentration keeps draws closer to center. floor lets assets at 0 come back in.
+    """
+    name = 'local'
+
+    def __init__(self, center, concentration=200.0, floor=0.05):
+        self.center = np.asarray(center, dtype=float)
+        self.concentration = concentration
+        self.floor = floor
+
+    def __call__(self, rng, size, num_of_symbols):
+        alpha = self.center * self.concentration + self.floor
+        weights = rng.standard_gamma(alpha, size=(size, num_of_symbols))
+        weights /= weights.sum(axis=1, keepdims=True)
+        return weights
+
+
+SAMPLERS = {
+    'uniform': UniformSampler,
+    'dirichlet': DirichletSampler,
+    'sobol': SobolSampler,
+    'halton': HaltonSampler,
+    'sparse': SparseSampler,
+}
+
+
+def get_sampler(sampler=None, **kwargs):
+    """
+    Sampler from a name in SAMPLERS (with constructor kwargs), an existing sampler, or None for the default.
+    """
+    if sampler is None:
+        return UniformSampler()
+    if isinstance(sampler, str):
+        if sampler not in SAMPLERS:
+            raise ValueError(f"Unknown sampler '{sampler}', expected one of {list(SAMPLERS)}")
+        return SAMPLERS[sampler](**kwargs)
+    return sampler
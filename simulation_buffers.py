@@ -0,0 +1,104 @@
+from config import *
+import json
+from dataclasses import dataclass
+
+"""
+Preallocated output buffers for monte_carlo_simulation.
+
+- One contiguous array per metric, and the weights symbol-major as a (num_of_symbols, num_of_portfolios)
+  array so each symbol's weights are contiguous as well. Chunks are written straight into them.
+- to_frame() and to_arrow() wrap the buffers without copying them: the DataFrame columns and Arrow
+  columns share memory with the arrays (pandas copy-on-write keeps the buffers safe from edits).
+- allocate(directory=...) backs every array with an .npy memory map, for runs larger than RAM;
+  open() maps a finished run back in read-only.
+- float32 buffers halve the memory of a run.
+
+"""
+
+METRIC_NAMES = {'returns': 'Returns', 'volatility': 'Volatility', 'sharpe': 'Sharpe Ratio'}
+
+
+@dataclass
+class SimulationBuffers:
+    returns: np.ndarray             # (num_of_portfolios,)
+    volatility: np.ndarray          # (num_of_portfolios,)
+    sharpe: np.ndarray              # (num_of_portfolios,)
+    weights: np.ndarray = None      # (num_of_symbols, num_of_portfolios), None to skip the weights
+    symbols: list = None
+
+    @classmethod
+    def allocate(cls, num_of_portfolios, symbols, dtype=np.float64, weights=False, directory=None):
+        """
+        Empty buffers for num_of_portfolios portfolios over symbols.
+
+        - directory: create them as .npy memory maps in that directory instead of in memory.
+        """
+        symbols = list(symbols)
+        if directory is None:
+            def empty(name, shape):
+                return np.empty(shape, dtype=dtype)
+        else:
+            directory = pathlib.Path(directory)
+            directory.mkdir(parents=True, exist_ok=True)
+            with open(directory / 'symbols.json', 'w') as f:
+                json.dump(symbols, f)
+
+            def empty(name, shape):
+                return np.lib.format.open_memmap(directory / f"{name}.npy", mode='w+', dtype=dtype, shape=shape)
+
+        buffers = {name: empty(name, (num_of_portfolios,)) for name in METRIC_NAMES}
+        if weights:
+            buffers['weights'] = empty('weights', (len(symbols), num_of_portfolios))
+        return cls(**buffers, symbols=symbols)
+
+    @classmethod
+    def open(cls, directory, mode='r'):
+        """ Memory-map buffers written by allocate(directory=...) """
+        directory = pathlib.Path(directory)
+        with open(directory / 'symbols.json') as f:
+            symbols = json.load(f)
+        buffers = {name: np.load(directory / f"{name}.npy", mmap_mode=mode) for name in METRIC_NAMES}
+        if (directory / 'weights.npy').exists():
+            buffers['weights'] = np.load(directory / 'weights.npy', mmap_mode=mode)
+        return cls(**buffers, symbols=symbols)
+
+    def __len__(self):
+        return len(self.returns)
+
+    @property
+    def dtype(self):
+        return self.returns.dtype
+
+    def validate(self, num_of_portfolios, num_of_symbols):
+        """ Raise ValueError unless the buffers fit a run of num_of_portfolios over num_of_symbols """
+        for name in METRIC_NAMES:
+            array = getattr(self, name)
+            if array.shape != (num_of_portfolios,):
+                raise ValueError(f"{name} buffer has shape {array.shape}, expected ({num_of_portfolios},)")
+            if array.dtype != self.dtype:
+                raise ValueError(f"{name} buffer is {array.dtype}, the other buffers are {self.dtype}")
+        if self.weights is not None and self.weights.shape != (num_of_symbols, num_of_portfolios):
+            raise ValueError(f"weights buffer has shape {self.weights.shape}, expected ({num_of_symbols}, {num_of_portfolios})")
+
+    def _symbol_names(self):
+        if self.symbols is not None:
+            return [str(symbol) for symbol in self.symbols]
+        return [f"Asset {i}" for i in range(len(self.weights))]
+
+    def to_frame(self) -> pd.DataFrame:
+        """ Returns, Volatility, Sharpe Ratio and one column per symbol, sharing memory with the buffers """
+        columns = {METRIC_NAMES[name]: getattr(self, name) for name in METRIC_NAMES}
+        if self.weights is not None:
+            # One row of the symbol-major weights per column: pandas keeps each as its own block instead of
+            # consolidating (and copying) them the way concat does before pandas 3
+            columns.update(zip(self._symbol_names(), self.weights))
+        return pd.DataFrame(columns, copy=False)
+
+    def to_arrow(self):
+        """ The same columns as to_frame() as a pyarrow Table, without copying """
+        import pyarrow as pa
+
+        columns = {METRIC_NAMES[name]: pa.array(getattr(self, name)) for name in METRIC_NAMES}
+        if self.weights is not None:
+            columns.update(zip(self._symbol_names(), map(pa.array, self.weights)))
+        return pa.table(columns)
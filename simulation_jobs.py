@@ -0,0 +1,151 @@
+from config import *
+import json
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from monte_carlo_portfolio_optimisation import SimulationCancelled, monte_carlo_simulation, adaptive_monte_carlo_simulation
+from plotting import frontier_summary, render_frontier_png, save_frontier_summary
+from result_store import save_results
+
+
+"""
+Background simulation jobs for the Streamlit app
+
+- Simulations run on a small shared thread pool instead of inside the button handler, so the
+  page stays responsive; NumPy releases the GIL for the heavy matrix work.
+- Every run writes to its own data/runs/<run_id>/ directory, so concurrent users never share files.
+
+"""
+
+RUNS_DIR = pathlib.Path('data/runs')
+
+# pyplot keeps global state, so figures are rendered one at a time
+_plot_lock = threading.Lock()
+
+
+@dataclass
+class SimulationJob:
+    run_id: str
+    params: dict
+    result_dir: pathlib.Path
+    cancel_event: threading.Event = field(default_factory=threading.Event)
+    status: str = 'queued'              # queued, running, done, cancelled or failed
+    progress: float = 0.0
+    message: str = ''
+    future: object = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ('done', 'cancelled', 'failed')
+
+
+def _write_run_info(job: SimulationJob):
+    with open(job.result_dir / 'run.json', 'w') as f:
+        json.dump({'run_id': job.run_id, 'status': job.status, 'message': job.message, 'params': job.params}, f, indent=2)
+
+
+def load_run_info(result_dir) -> dict:
+    with open(pathlib.Path(result_dir) / 'run.json') as f:
+        return json.load(f)
+
+
+def run_simulation_job(job: SimulationJob, stats):
+    """
+    Run one simulation and store the results, plot data and parameters under job.result_dir.
+
+    - stats is the ReturnStats of the selected file, so the prices are not parsed again here.
+    - Progress is reported through job.progress (0 to 1); job.cancel_event stops the run between chunks.
+    """
+    params = job.params
+    job.status = 'running'
+
+    # Record the seed actually used so the run can be reproduced from its metadata
+    params.setdefault('seed', np.random.SeedSequence().entropy)
+
+    def on_progress(done, total):
+        job.progress = done / total
+
+    try:
+        if params.get('stop_early'):
+            adaptive = adaptive_monte_carlo_simulation(stats, risk_free_rate=params['risk_free_rate'],
+                                                       max_portfolios=params['num_of_portfolios'], sampler=params['sampler'],
+                                                       seed=params['seed'], refine=True, return_portfolios=True, return_weights=True,
+                                                       progress_callback=on_progress,
+                                                       cancel_event=job.cancel_event)
+            simulations_df = adaptive['portfolios']
+            job.message = f"Stopped after {len(simulations_df):,} portfolios ({adaptive['stopped']})."
+        else:
+            # Small chunks so progress moves and cancellation is picked up quickly
+            simulations_df = monte_carlo_simulation(stats, num_of_portfolios=params['num_of_portfolios'],
+                                                    risk_free_rate=params['risk_free_rate'], sampler=params['sampler'],
+                                                    seed=params['seed'], chunk_size=max(1000, params['num_of_portfolios'] // 20),
+                                                    progress_callback=on_progress, cancel_event=job.cancel_event,
+                                                    return_weights=True)
+
+        save_results(simulations_df, job.result_dir / 'simulation_results.arrow',
+                     metadata={**params, 'fingerprint': stats.fingerprint, 'run_id': job.run_id})
+        summary = frontier_summary(simulations_df)
+        save_frontier_summary(summary, job.result_dir / 'simulation_results_plot.npz')
+        with _plot_lock:
+            render_frontier_png(summary, job.result_dir / 'simulation_results_plot.png')
+        job.progress = 1.0
+        job.status = 'done'
+    except SimulationCancelled:
+        job.status = 'cancelled'
+    except Exception as e:
+        job.status = 'failed'
+        job.message = str(e)
+    finally:
+        _write_run_info(job)
+
+
+class JobManager:
+    """
+    Shared pool of simulation workers, one per app process (see st.cache_resource in app.py).
+
+    - At most max_workers simulations run at once, the rest wait in the queue.
+    - Only the newest max_runs finished runs are kept on disk, older run directories are deleted.
+    """
+
+    def __init__(self, max_workers=2, runs_dir=RUNS_DIR, max_runs=50):
+        self.runs_dir = pathlib.Path(runs_dir)
+        self.max_runs = max_runs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='simulation')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, stats, **params) -> SimulationJob:
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        result_dir = self.runs_dir / run_id
+        result_dir.mkdir(parents=True)
+
+        job = SimulationJob(run_id=run_id, params=params, result_dir=result_dir)
+        _write_run_info(job)
+        with self._lock:
+            self._jobs[run_id] = job
+        job.future = self._executor.submit(run_simulation_job, job, stats)
+        self._evict()
+        return job
+
+    def get(self, run_id):
+        with self._lock:
+            return self._jobs.get(run_id)
+
+    def cancel(self, run_id):
+        job = self.get(run_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    def _evict(self):
+        runs = sorted((path for path in self.runs_dir.iterdir() if path.is_dir()), key=lambda path: path.stat().st_mtime)
+        with self._lock:
+            for path in runs[:max(len(runs) - self.max_runs, 0)]:
+                job = self._jobs.get(path.name)
+                if job is not None and not job.finished:
+                    continue
+                self._jobs.pop(path.name, None)
+                shutil.rmtree(path, ignore_errors=True)
@@ -0,0 +1,26 @@
+import pathlib
+import sys
+
+import pytest
+
+# The modules live flat in the repository root
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+from benchmarks import synthetic_prices
+from return_stats import compute_return_stats
+
+
+@pytest.fixture
+def prices():
+    return synthetic_prices(n_days=300, n_assets=8, seed=0)
+
+
+@pytest.fixture
+def stats(prices):
+    return compute_return_stats(prices)
+
+
+@pytest.fixture(autouse=True)
+def data_dir(tmp_path, monkeypatch):
+    # Caches and results default to relative data/ paths, keep them out of the repository
+    monkeypatch.chdir(tmp_path)
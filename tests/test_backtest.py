@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from backtest import walk_forward_backtest
+
+
+def _growing_prices(n_days=400, daily=0.001):
+    # Two assets compounding at the same daily rate: any portfolio earns exactly that rate
+    index = pd.bdate_range('2020-01-01', periods=n_days)
+    path = 100.0 * (1.0 + daily) ** np.arange(n_days)
+    return pd.DataFrame({'A': path, 'B': path}, index=index)
+
+
+def _equal_weights(stats, seed_seq):
+    return np.full(len(stats.symbols), 1.0 / len(stats.symbols))
+
+
+@pytest.mark.parametrize('transaction_cost', [0.0, 0.01])
+def test_summary_on_a_known_path(transaction_cost):
+    prices = _growing_prices()
+    result = walk_forward_backtest(prices, lookback=100, rebalance_every=50, optimiser=_equal_weights,
+                                   transaction_cost=transaction_cost, n_workers=1)
+    summary = result['summary']
+
+    first = prices.index.get_loc(result['weights'].index[0])
+    held_days = len(prices) - 1 - first
+    final = (1.0 - transaction_cost) * 1.001 ** held_days
+    assert result['equity_curve'].iloc[-1] == pytest.approx(final)
+    # Annualised over the days invested, not the lookback before the first rebalance
+    assert summary['Annualised Return'] == pytest.approx(final ** (252 / held_days) - 1)
+    assert summary['Annualised Volatility'] == pytest.approx(0.0, abs=1e-12)
+    assert summary['Max Drawdown'] == pytest.approx(0.0, abs=1e-12)
+    # Only the first rebalance trades: the assets never drift apart
+    assert summary['Total Turnover'] == pytest.approx(1.0)
+    assert summary['Total Costs'] == pytest.approx(transaction_cost)
+    assert summary['Rebalances'] == len(result['weights'])
+
+
+def test_warm_up_is_held_in_cash():
+    prices = _growing_prices()
+    result = walk_forward_backtest(prices, lookback=100, rebalance_every=50, optimiser=_equal_weights,
+                                   transaction_cost=0.0, n_workers=1)
+    first = prices.index.get_loc(result['weights'].index[0])
+    assert (result['equity_curve'].iloc[:first + 1] == 1.0).all()
+
+
+def test_results_independent_of_n_workers(prices):
+    kwargs = dict(lookback=100, rebalance_every=50, num_of_portfolios=500, seed=4)
+    serial = walk_forward_backtest(prices, n_workers=1, **kwargs)
+    threaded = walk_forward_backtest(prices, n_workers=3, **kwargs)
+    pd.testing.assert_frame_equal(serial['weights'], threaded['weights'])
+    pd.testing.assert_series_equal(serial['summary'], threaded['summary'])
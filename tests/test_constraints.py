@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constraints import ConstrainedSampler, PortfolioConstraints, _capped_dirichlet
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation, stream_monte_carlo_simulation
+from return_stats import compute_return_stats
+
+SYMBOLS = [f"SYM{i:04d}" for i in range(8)]
+SECTORS = {symbol: ['Tech', 'Health', 'Energy'][i % 3] for i, symbol in enumerate(SYMBOLS)}
+
+CASES = {
+    'long_only': dict(),
+    'bounds': dict(default_bounds=(0.02, 0.3), bounds={'SYM0000': (0.1, 0.2)}),
+    'sectors': dict(default_bounds=(0.0, 0.4), sectors=SECTORS, sector_caps={'Tech': 0.3, 'Health': (0.2, 0.5)}),
+    'cardinality': dict(default_bounds=(0.0, 0.5), max_assets=3, sectors=SECTORS, sector_caps={'Tech': 0.4}),
+    'shorts': dict(default_bounds=(-0.1, 0.4), max_gross=1.4),
+    'holdings': dict(default_bounds=(-0.1, 0.5), bounds={'SYM0002': (0.05, 0.3)}, max_assets=4, max_gross=1.5),
+    'forced_short': dict(default_bounds=(-0.1, 0.5), bounds={'SYM0001': (-0.2, -0.05)}, max_gross=1.5,
+                         sectors=SECTORS, sector_caps={'Energy': (-0.2, 0.5)}),
+}
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_samples_are_feasible(case):
+    constraints = PortfolioConstraints.from_spec(SYMBOLS, **CASES[case])
+    weights = ConstrainedSampler(constraints, check=False)(np.random.default_rng(0), 5000, len(SYMBOLS))
+
+    assert weights.shape == (5000, len(SYMBOLS))
+    assert constraints.feasible(weights, tol=1e-8).all()
+
+
+@pytest.mark.parametrize('case', ['cardinality', 'holdings', 'forced_short'])
+def test_samples_are_reproducible(case):
+    sampler = ConstrainedSampler(PortfolioConstraints.from_spec(SYMBOLS, **CASES[case]))
+    first = sampler(np.random.default_rng(3), 1000, len(SYMBOLS))
+    second = sampler(np.random.default_rng(3), 1000, len(SYMBOLS))
+    np.testing.assert_array_equal(first, second)
+
+
+def test_infeasible_constraints_are_rejected():
+    with pytest.raises(ValueError):
+        PortfolioConstraints.from_spec(SYMBOLS, default_bounds=(0.0, 0.1))
+    with pytest.raises(ValueError):
+        PortfolioConstraints.from_spec(SYMBOLS, default_bounds=(-0.1, 0.5), bounds={'SYM0001': (-0.5, -0.3)},
+                                       max_gross=1.4)
+
+
+def test_last_redraw_is_enough():
+    # Every draw of 2 holdings out of 8 breaks the Tech minimum unless it picks a Tech asset
+    constraints = PortfolioConstraints.from_spec(SYMBOLS, default_bounds=(0.0, 1.0), max_assets=2,
+                                                 sectors=SECTORS, sector_caps={'Tech': (0.2, 1.0)})
+    weights = ConstrainedSampler(constraints, max_attempts=50)(np.random.default_rng(1), 200, len(SYMBOLS))
+    assert constraints.feasible(weights, tol=1e-8).all()
+
+
+def test_capped_dirichlet_meets_bounds_and_budget():
+    # One portfolio per column
+    gammas = np.random.default_rng(0).standard_exponential(size=(6, 500))
+    lower, upper = np.full((6, 1), -0.1), np.full((6, 1), 0.5)
+    weights = _capped_dirichlet(gammas, lower, upper, 1.0)
+
+    np.testing.assert_allclose(weights.sum(axis=0), 1.0)
+    assert (weights >= lower - 1e-12).all() and (weights <= upper + 1e-12).all()
+    # Portfolios that already fit are the plain Dirichlet draw above the lower bounds
+    dirichlet = lower + gammas / gammas.sum(axis=0) * 1.6
+    fits = (dirichlet <= upper).all(axis=0)
+    assert fits.any() and not fits.all()
+    np.testing.assert_allclose(weights[:, fits], dirichlet[:, fits])
+
+
+def test_simulation_with_constraints(stats):
+    constraints = PortfolioConstraints.from_spec(stats.symbols, **CASES['shorts'])
+    simulations_df = monte_carlo_simulation(stats, 3000, seed=0, sampler=ConstrainedSampler(constraints),
+                                            return_weights=True)
+    assert constraints.feasible(simulations_df[stats.symbols].to_numpy(), tol=1e-8).all()
+
+
+def test_frontier_covers_leveraged_portfolios():
+    # One common factor at different scales: long the volatile assets, short the calm ones beats any asset
+    rng = np.random.default_rng(0)
+    daily = rng.normal(0.0, 0.01, size=(300, 1)) * np.linspace(0.5, 1.5, 6) + rng.normal(0.0, 0.001, size=(300, 6))
+    prices = pd.DataFrame(100.0 * np.exp(np.cumsum(daily, axis=0)), index=pd.bdate_range('2020-01-01', periods=300),
+                          columns=SYMBOLS[:6])
+    stats = compute_return_stats(prices)
+    sampler = ConstrainedSampler(PortfolioConstraints.from_spec(stats.symbols, default_bounds=(-0.3, 0.8), max_gross=1.8))
+    max_asset_vol = np.sqrt(np.diag(stats.cov)).max()
+
+    simulations_df = monte_carlo_simulation(stats, 3000, seed=0, sampler=sampler)
+    frontier = stream_monte_carlo_simulation(stats, 3000, seed=0, sampler=sampler)['frontier']
+    assert (simulations_df['Volatility'] > max_asset_vol).any()
+    # Not all clipped into the last bucket
+    assert (frontier['Volatility'] > max_asset_vol).sum() > 1
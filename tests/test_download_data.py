@@ -0,0 +1,118 @@
+import pandas as pd
+import pytest
+
+from benchmarks import synthetic_raw_prices
+from download_data import (LocalPriceProvider, YahooFinanceProvider, _add_range, _load_coverage, _missing_ranges, download_missing_data,
+                           get_stock_data)
+
+
+class CountingProvider(LocalPriceProvider):
+    def __init__(self, price_df):
+        super().__init__(price_df)
+        self.calls = []
+
+    def fetch(self, symbol, start_date, end_date):
+        self.calls.append((symbol, start_date, end_date))
+        return super().fetch(symbol, start_date, end_date)
+
+
+@pytest.fixture
+def raw_prices():
+    # 2000-01-03 to 2000-12-29
+    return synthetic_raw_prices(n_days=260, n_assets=3, seed=0)
+
+
+def test_missing_ranges():
+    ranges = [['2020-01-01', '2020-02-01'], ['2020-03-01', '2020-04-01']]
+    assert _missing_ranges(ranges, '2020-01-15', '2020-03-15') == [('2020-02-01', '2020-03-01')]
+    assert _missing_ranges(ranges, '2019-12-01', '2020-05-01') == [
+        ('2019-12-01', '2020-01-01'), ('2020-02-01', '2020-03-01'), ('2020-04-01', '2020-05-01')]
+    assert _missing_ranges(ranges, '2020-01-05', '2020-01-20') == []
+    assert _missing_ranges([], '2020-01-01', '2020-02-01') == [('2020-01-01', '2020-02-01')]
+
+
+def test_add_range_merges_touching_ranges():
+    ranges = _add_range([['2020-01-01', '2020-02-01']], '2020-03-01', '2020-04-01')
+    assert ranges == [['2020-01-01', '2020-02-01'], ['2020-03-01', '2020-04-01']]
+    assert _add_range(ranges, '2020-02-01', '2020-03-01') == [['2020-01-01', '2020-04-01']]
+
+
+def test_only_gaps_are_fetched(raw_prices, tmp_path):
+    provider = CountingProvider(raw_prices)
+    cache_dir = tmp_path / 'cache'
+    save_path = tmp_path / 'stock_data.feather'
+    get_stock_data(['SYM0000', 'SYM0001'], '2000-02-01', '2000-06-01', save_path, provider=provider, cache_dir=cache_dir)
+    provider.calls.clear()
+
+    data = get_stock_data(['SYM0000', 'SYM0001'], '2000-01-01', '2000-09-01', save_path, provider=provider,
+                          cache_dir=cache_dir)
+
+    assert sorted(provider.calls) == [
+        ('SYM0000', '2000-01-01', '2000-02-01'), ('SYM0000', '2000-06-01', '2000-09-01'),
+        ('SYM0001', '2000-01-01', '2000-02-01'), ('SYM0001', '2000-06-01', '2000-09-01')]
+    expected = raw_prices.loc['2000-01-01':'2000-08-31', ['SYM0000', 'SYM0001']]
+    pd.testing.assert_frame_equal(data, expected, check_freq=False, check_index_type=False)
+
+
+def test_partial_failure_keeps_the_successes(raw_prices, tmp_path):
+    provider = CountingProvider(raw_prices)
+    cache_dir = tmp_path / 'cache'
+
+    with pytest.raises(RuntimeError, match='MISSING'):
+        download_missing_data(['SYM0000', 'MISSING'], '2000-01-01', '2000-03-01', provider=provider,
+                              cache_dir=cache_dir, retries=1, backoff=0.0)
+    assert (cache_dir / 'SYM0000.feather').exists()
+    assert 'MISSING' not in _load_coverage(cache_dir)
+
+    provider.calls.clear()
+    download_missing_data(['SYM0000'], '2000-01-01', '2000-03-01', provider=provider, cache_dir=cache_dir)
+    assert provider.calls == []
+
+
+def test_gap_before_listing_is_covered(raw_prices, tmp_path):
+    provider = CountingProvider(raw_prices)
+    cache_dir = tmp_path / 'cache'
+
+    download_missing_data(['SYM0000'], '1999-01-01', '1999-12-01', provider=provider, cache_dir=cache_dir)
+    assert provider.calls == [('SYM0000', '1999-01-01', '1999-12-01')]
+    assert _load_coverage(cache_dir)['SYM0000'] == [['1999-01-01', '1999-12-01']]
+
+    provider.calls.clear()
+    download_missing_data(['SYM0000'], '1999-01-01', '1999-12-01', provider=provider, cache_dir=cache_dir)
+    assert provider.calls == []
+
+
+def test_coverage_stops_at_the_last_returned_row(raw_prices, tmp_path):
+    provider = CountingProvider(raw_prices)
+    cache_dir = tmp_path / 'cache'
+    future = (pd.Timestamp.today() + pd.Timedelta(days=30)).strftime('%Y-%m-%d')
+
+    download_missing_data(['SYM0000'], '2000-11-01', future, provider=provider, cache_dir=cache_dir)
+    # The data ends on Friday 2000-12-29; the gap after it is fetched again, then covered up to today
+    assert _load_coverage(cache_dir)['SYM0000'] == [['2000-11-01', '2000-12-30']]
+
+    download_missing_data(['SYM0000'], '2000-11-01', future, provider=provider, cache_dir=cache_dir)
+    assert provider.calls[-1] == ('SYM0000', '2000-12-30', future)
+    today = pd.Timestamp.today().strftime('%Y-%m-%d')
+    assert _load_coverage(cache_dir)['SYM0000'] == [['2000-11-01', today]]
+
+
+def test_yahoo_without_rows_is_not_a_failure(monkeypatch):
+    yf = pytest.importorskip('yfinance')
+    from yfinance.exceptions import YFPricesMissingError
+
+    class Ticker:
+        def __init__(self, symbol):
+            self.symbol = symbol
+
+        def history(self, start, end, **kwargs):
+            if start < '2020-12-09':
+                # What Yahoo says for dates before DASH was listed
+                raise YFPricesMissingError(self.symbol, f"(1d {start} -> {end})")
+            index = pd.date_range('2020-12-09', periods=3, tz='America/New_York', name='Date')
+            return pd.DataFrame({'Close': [189.5, 186.0, 175.0]}, index=index)
+
+    monkeypatch.setattr(yf, 'Ticker', Ticker)
+    provider = YahooFinanceProvider()
+    assert provider.fetch('DASH', '2020-01-01', '2020-12-01').empty
+    assert provider.fetch('DASH', '2020-12-09', '2020-12-12').index.tz is None
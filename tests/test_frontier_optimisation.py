@@ -0,0 +1,47 @@
+import pytest
+
+from benchmarks import synthetic_prices
+from covariance import get_covariance_estimator
+from frontier_optimisation import optimize_frontier
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from return_stats import compute_return_stats
+
+
+def _check_weights(row, symbols):
+    weights = row[symbols].to_numpy(dtype=float)
+    assert weights.sum() == pytest.approx(1.0)
+    assert (weights >= 0.0).all()
+
+
+def test_beats_every_sampled_portfolio(stats):
+    results = optimize_frontier(stats.mean_series, stats.cov_frame, risk_free_rate=0.02, num_points=10)
+    simulations_df = monte_carlo_simulation(stats, 20000, risk_free_rate=0.02, seed=0)
+
+    _check_weights(results['max_sharpe'], stats.symbols)
+    _check_weights(results['min_volatility'], stats.symbols)
+    assert results['max_sharpe']['Sharpe Ratio'] >= simulations_df['Sharpe Ratio'].max()
+    assert results['min_volatility']['Volatility'] <= simulations_df['Volatility'].min()
+    # Nothing on the frontier beats the max Sharpe portfolio, and it runs upwards from the min volatility one
+    assert results['frontier']['Sharpe Ratio'].max() <= results['max_sharpe']['Sharpe Ratio'] + 1e-8
+    assert results['frontier']['Returns'].is_monotonic_increasing
+    assert results['frontier']['Volatility'].iloc[0] == pytest.approx(results['min_volatility']['Volatility'])
+
+
+@pytest.mark.parametrize('n_assets', [100, 200])
+def test_many_assets(n_assets):
+    stats = compute_return_stats(synthetic_prices(n_days=500, n_assets=n_assets, seed=0))
+    results = optimize_frontier(stats.mean_series, stats.cov_frame, num_points=3)
+
+    _check_weights(results['max_sharpe'], stats.symbols)
+    assert results['max_sharpe']['Sharpe Ratio'] >= results['frontier']['Sharpe Ratio'].max() - 1e-8
+
+
+def test_factor_covariance_matches_the_dense_one():
+    stats = compute_return_stats(synthetic_prices(n_days=500, n_assets=100, seed=1),
+                                 covariance=get_covariance_estimator('factor'))
+    dense = stats.cov_frame
+    expected = optimize_frontier(stats.mean_series, dense, num_points=2)
+    results = optimize_frontier(stats.mean_series, dense, num_points=2, factors=stats.factors)
+
+    assert results['max_sharpe']['Sharpe Ratio'] == pytest.approx(expected['max_sharpe']['Sharpe Ratio'], rel=1e-6)
+    assert results['min_volatility']['Volatility'] == pytest.approx(expected['min_volatility']['Volatility'], rel=1e-6)
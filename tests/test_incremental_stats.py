@@ -0,0 +1,43 @@
+import numpy as np
+
+from incremental_stats import IncrementalReturnStats
+from metrics import calculate_batch_metrics
+
+
+def test_appending_rows_matches_a_full_recompute(prices, stats):
+    incremental = IncrementalReturnStats.from_prices(prices.iloc[:100])
+    for start in range(100, len(prices), 37):
+        incremental.append_prices(prices.iloc[:start + 37])
+
+    np.testing.assert_allclose(incremental.mean, stats.mean, rtol=1e-10)
+    np.testing.assert_allclose(incremental.cov, stats.cov, rtol=1e-10)
+
+
+def test_rows_already_seen_are_skipped(prices):
+    incremental = IncrementalReturnStats.from_prices(prices)
+    count = incremental.count
+    incremental.append_prices(prices)
+    assert incremental.count == count
+
+
+def test_rolling_window_matches_the_last_rows(prices):
+    window = 60
+    incremental = IncrementalReturnStats(prices.columns, window=window)
+    for stop in range(2, len(prices) + 1, 25):
+        incremental.append_prices(prices.iloc[:stop])
+    incremental.append_prices(prices)
+
+    log_return = np.log(prices / prices.shift(1)).iloc[-window:]
+    np.testing.assert_allclose(incremental.mean, log_return.mean().to_numpy() * 252, rtol=1e-8)
+    np.testing.assert_allclose(incremental.cov, log_return.cov().to_numpy() * 252, rtol=1e-8)
+
+
+def test_snapshot_keeps_the_history_without_a_window(prices, stats):
+    incremental = IncrementalReturnStats.from_prices(prices.iloc[:150])
+    incremental.append_prices(prices)
+    snapshot = incremental.to_return_stats()
+
+    np.testing.assert_allclose(snapshot.log_return.to_numpy(), stats.log_return.dropna().to_numpy(), rtol=1e-12)
+    weights = np.full((2, len(stats.symbols)), 1.0 / len(stats.symbols))
+    np.testing.assert_allclose(calculate_batch_metrics(weights, snapshot).to_numpy(),
+                               calculate_batch_metrics(weights, stats).to_numpy(), rtol=1e-8)
@@ -0,0 +1,70 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from covariance import get_covariance_estimator
+from monte_carlo_portfolio_optimisation import _portfolio_volatility, monte_carlo_simulation, optimal_portfolios
+from return_stats import compute_return_stats
+
+pytest.importorskip('numba')
+
+
+def _numpy_scores(stats, weights, risk_free_rate):
+    ret = weights @ stats.mean
+    vol = _portfolio_volatility(weights, stats.cov, stats.cov_chol, stats.factors)
+    return ret, vol, (ret - risk_free_rate) / vol
+
+
+@pytest.mark.parametrize('covariance', ['sample', 'factor'])
+@pytest.mark.parametrize('sampler', ['uniform', 'dirichlet'])
+def test_scores_match_numpy(prices, covariance, sampler):
+    stats = compute_return_stats(prices, covariance=get_covariance_estimator(covariance))
+    simulations_df = monte_carlo_simulation(stats, 5000, risk_free_rate=0.02, seed=0, sampler=sampler,
+                                            return_weights=True, engine='numba')
+    weights = simulations_df[stats.symbols].to_numpy()
+    np.testing.assert_allclose(weights.sum(axis=1), 1.0)
+
+    ret, vol, sharpe = _numpy_scores(stats, weights, 0.02)
+    np.testing.assert_allclose(simulations_df['Returns'], ret, rtol=1e-10, atol=1e-14)
+    np.testing.assert_allclose(simulations_df['Volatility'], vol, rtol=1e-10)
+    np.testing.assert_allclose(simulations_df['Sharpe Ratio'], sharpe, rtol=1e-10, atol=1e-12)
+
+
+def test_seed_independent_of_chunk_size(stats):
+    small = monte_carlo_simulation(stats, 10000, seed=5, chunk_size=2048, return_weights=True, engine='numba')
+    large = monte_carlo_simulation(stats, 10000, seed=5, chunk_size=50000, return_weights=True, engine='numba')
+    pd.testing.assert_frame_equal(small, large)
+
+
+def test_optimal_portfolios_match_the_full_simulation(stats):
+    simulations_df = monte_carlo_simulation(stats, 5000, seed=2, chunk_size=2048, return_weights=True, engine='numba')
+    best = optimal_portfolios(stats, 5000, seed=2, chunk_size=2048, engine='numba')
+
+    pd.testing.assert_series_equal(best['max_sharpe'], simulations_df.loc[simulations_df['Sharpe Ratio'].idxmax()],
+                                   check_names=False)
+    pd.testing.assert_series_equal(best['min_volatility'], simulations_df.loc[simulations_df['Volatility'].idxmin()],
+                                   check_names=False)
+
+
+def test_float32_results_are_scored_in_float64(stats):
+    single = monte_carlo_simulation(stats, 3000, seed=1, dtype=np.float32, engine='numba')
+    double = monte_carlo_simulation(stats, 3000, seed=1, engine='numba')
+
+    assert (single.dtypes == np.float32).all()
+    np.testing.assert_array_equal(single.to_numpy(), double.to_numpy().astype(np.float32))
+
+
+def test_auto_engine_falls_back_silently(stats):
+    with warnings.catch_warnings():
+        warnings.simplefilter('error')
+        optimal_portfolios(stats, 1000, seed=0, sampler='sparse', engine='auto')
+    with pytest.warns(RuntimeWarning):
+        optimal_portfolios(stats, 1000, seed=0, sampler='sparse', engine='numba')
+
+
+@pytest.mark.parametrize('engine', ['auto', 'numpy'])
+def test_no_portfolios_is_rejected(stats, engine):
+    with pytest.raises(ValueError):
+        optimal_portfolios(stats, 0, engine=engine)
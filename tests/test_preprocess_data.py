@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+from preprocess_data import clean_prices
+
+
+def test_clean_prices_pass_through(prices):
+    panel = clean_prices(prices)
+
+    pd.testing.assert_frame_equal(panel.to_frame(), prices, check_freq=False, check_names=False)
+    assert panel.report['Kept'].all()
+    assert (panel.report[['Filled', 'Outliers', 'Splits']] == 0).all().all()
+
+
+def test_splits_only_adjusted_when_asked(prices):
+    raw = prices.copy()
+    raw.iloc[150:, 0] /= 2          # 2-for-1 split
+    raw.iloc[200:, 1] *= 2 / 3      # A genuine -33% day looks the same as a 3-for-2 split
+
+    adjusted = clean_prices(raw, adjust_splits=True)
+    np.testing.assert_allclose(adjusted.prices[:, 0], prices['SYM0000'] / 2)
+    assert adjusted.report.loc['SYM0000', 'Splits'] == 1
+
+    untouched = clean_prices(raw)
+    np.testing.assert_array_equal(untouched.prices, raw.to_numpy())
+    assert (untouched.report['Splits'] == 0).all()
+
+
+def test_spike_is_replaced_by_the_previous_price(prices):
+    raw = prices.copy()
+    raw.iloc[100, 3] *= 3
+
+    panel = clean_prices(raw)
+    assert panel.report.loc['SYM0003', 'Outliers'] == 1
+    assert panel.report.loc['SYM0003', 'Filled'] == 1
+    assert panel.prices[100, 3] == prices.iloc[99, 3]
+    np.testing.assert_array_equal(np.delete(panel.prices, 100, axis=0), np.delete(prices.to_numpy(), 100, axis=0))
+
+
+def test_late_listings_are_dropped_or_trimmed(prices):
+    raw = prices.copy()
+    raw.iloc[:100, 2] = np.nan      # Covers 2/3 of the calendar: dropped
+    raw.iloc[:30, 5] = np.nan       # Covers 90%: kept, and the panel starts when it lists
+
+    panel = clean_prices(raw)
+    assert not panel.report.loc['SYM0002', 'Kept']
+    assert panel.report.loc['SYM0005', 'Coverage'] == 0.9
+    assert panel.tickers == [symbol for symbol in prices.columns if symbol != 'SYM0002']
+    assert panel.dates[0] == prices.index[30] and len(panel.dates) == 270
+
+
+def test_forward_fill_limit(prices):
+    raw = prices.copy()
+    raw.iloc[50:53, 4] = np.nan     # Filled
+    raw.iloc[200:207, 6] = 0.0      # Bad data; only the first 5 days are filled, the last 2 are dropped
+
+    panel = clean_prices(raw, ffill_limit=5)
+    assert not np.isnan(panel.prices).any()
+    assert panel.report.loc['SYM0004', 'Filled'] == 3
+    assert panel.report.loc['SYM0006', 'Filled'] == 5
+    assert (panel.prices[50:53, 4] == prices.iloc[49, 4]).all()
+    assert list(panel.dates) == list(prices.index.delete([205, 206]))
+
+
+def test_calendar_alignment(prices):
+    # A stray weekend tick, and a day nobody traded
+    saturday = prices.iloc[[4]].set_axis([pd.Timestamp('2000-01-08')])
+    raw = pd.concat([prices, saturday]).sort_index()
+    raw.loc[prices.index[40]] = np.nan
+
+    assert len(clean_prices(raw).dates) == len(prices)
+    panel = clean_prices(raw, calendar='B')
+    pd.testing.assert_index_equal(panel.dates, prices.index.delete(40), check_names=False)
+    assert (panel.report['Filled'] == 0).all()
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation, stream_monte_carlo_simulation
+from reducers import FrontierEnvelopeReducer, OptimalPortfolioReducer, TopKReducer, portfolio_frame
+
+SYMBOLS = ['A', 'B', 'C']
+
+
+def _chunks(n=1000, chunk_size=128, seed=0):
+    rng = np.random.default_rng(seed)
+    weights = rng.dirichlet(np.ones(len(SYMBOLS)), size=n)
+    ret = rng.normal(0.05, 0.1, size=n)
+    vol = rng.uniform(0.05, 0.3, size=n)
+    sharpe = ret / vol
+    sharpe[::97] = np.nan
+    full = portfolio_frame(SYMBOLS, weights, ret, vol, sharpe)
+    chunks = [(weights[i:i + chunk_size], ret[i:i + chunk_size], vol[i:i + chunk_size], sharpe[i:i + chunk_size])
+              for i in range(0, n, chunk_size)]
+    return full, chunks
+
+
+def test_optimal_portfolios_match_the_full_frame():
+    full, chunks = _chunks()
+    reducer = OptimalPortfolioReducer(SYMBOLS)
+    for chunk in chunks:
+        reducer.update(*chunk)
+
+    result = reducer.result()
+    pd.testing.assert_series_equal(result['max_sharpe'], full.loc[full['Sharpe Ratio'].idxmax()], check_names=False)
+    pd.testing.assert_series_equal(result['min_volatility'], full.loc[full['Volatility'].idxmin()], check_names=False)
+
+
+@pytest.mark.parametrize('k', [10, 300])
+def test_top_k_matches_the_full_frame(k):
+    # k below and above the chunk size
+    full, chunks = _chunks()
+    reducer = TopKReducer(SYMBOLS, k=k)
+    for chunk in chunks:
+        reducer.update(*chunk)
+
+    expected = full.sort_values('Sharpe Ratio', ascending=False, kind='stable', ignore_index=True).iloc[:k]
+    pd.testing.assert_frame_equal(reducer.result(), expected)
+
+
+def test_frontier_keeps_the_best_return_per_bucket():
+    full, chunks = _chunks()
+    reducer = FrontierEnvelopeReducer(SYMBOLS, (0.1, 0.25), n_bins=6)
+    for chunk in chunks:
+        reducer.update(*chunk)
+
+    # Volatilities outside of the range land in the first or last bucket
+    bins = np.clip(np.searchsorted(reducer.edges, full['Volatility'], side='right') - 1, 0, 5)
+    expected = full.loc[full.groupby(bins)['Returns'].idxmax()].sort_values('Volatility', ignore_index=True)
+    pd.testing.assert_frame_equal(reducer.result(), expected)
+
+
+def test_stream_matches_the_full_simulation(stats):
+    simulations_df = monte_carlo_simulation(stats, 5000, seed=1, chunk_size=1000, return_weights=True)
+    results = stream_monte_carlo_simulation(stats, 5000, seed=1, chunk_size=1000, top_k=20)
+
+    pd.testing.assert_series_equal(results['max_sharpe'], simulations_df.loc[simulations_df['Sharpe Ratio'].idxmax()],
+                                   check_names=False)
+    expected = simulations_df.sort_values('Sharpe Ratio', ascending=False, ignore_index=True).iloc[:20]
+    pd.testing.assert_frame_equal(results['top_k'], expected)
+    assert results['frontier']['Returns'].max() == simulations_df['Returns'].max()
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from result_store import METRIC_COLUMNS, ResultStore, save_results
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def simulations_df(stats):
+    return monte_carlo_simulation(stats, 5000, seed=0, return_weights=True)
+
+
+@pytest.fixture
+def store(simulations_df, tmp_path):
+    save_results(simulations_df, tmp_path / 'run.arrow', metadata={'seed': 0}, batch_size=1000)
+    store = ResultStore(tmp_path / 'run.arrow')
+    # Record which batches a query decompresses
+    store.reads = []
+    batch = store._batch
+
+    def read_batch(i, columns=None):
+        store.reads.append(i)
+        return batch(i, columns)
+
+    store._batch = read_batch
+    return store
+
+
+def _by_sharpe(simulations_df):
+    return simulations_df.sort_values('Sharpe Ratio', ascending=False, kind='stable', ignore_index=True)
+
+
+def test_round_trip(simulations_df, store):
+    assert len(store) == 5000 and store.metadata == {'seed': 0}
+    assert store.symbols == list(simulations_df.columns[3:])
+    pd.testing.assert_frame_equal(store.read(), _by_sharpe(simulations_df))
+    pd.testing.assert_frame_equal(store.read(columns=METRIC_COLUMNS), _by_sharpe(simulations_df)[METRIC_COLUMNS])
+
+
+def test_top_sharpe_reads_only_the_first_batches(simulations_df, store):
+    pd.testing.assert_frame_equal(store.top_sharpe(1500), _by_sharpe(simulations_df).iloc[:1500])
+    assert store.reads == [0, 1]
+
+
+def test_min_volatility(simulations_df, store):
+    best = store.min_volatility()
+    pd.testing.assert_series_equal(best, simulations_df.loc[simulations_df['Volatility'].idxmin()], check_names=False)
+
+    min_return = simulations_df['Returns'].quantile(0.9)
+    qualifying = simulations_df[simulations_df['Returns'] >= min_return]
+    best = store.min_volatility(min_return=min_return)
+    pd.testing.assert_series_equal(best, qualifying.loc[qualifying['Volatility'].idxmin()], check_names=False)
+    assert store.min_volatility(min_return=simulations_df['Returns'].max() + 1.0) is None
+
+
+def test_float32_uncompressed_weights_column(simulations_df, tmp_path):
+    symbols = list(simulations_df.columns[3:])
+    script_df = simulations_df[METRIC_COLUMNS].assign(Weights=list(simulations_df[symbols].to_numpy()))
+    save_results(script_df, tmp_path / 'run.arrow', symbols=symbols, dtype=np.float32, compression=None)
+
+    read = ResultStore(tmp_path / 'run.arrow').read()
+    assert (read.dtypes == np.float32).all()
+    pd.testing.assert_frame_equal(read, _by_sharpe(simulations_df).astype(np.float32))
@@ -0,0 +1,37 @@
+import numpy as np
+import pandas as pd
+
+from monte_carlo_portfolio_optimisation import iter_simulation_chunks, monte_carlo_simulation, optimal_portfolios
+
+
+def test_same_seed_same_portfolios(stats):
+    first = monte_carlo_simulation(stats, 5000, seed=7, chunk_size=1000, return_weights=True)
+    second = monte_carlo_simulation(stats, 5000, seed=7, chunk_size=1000, return_weights=True)
+    pd.testing.assert_frame_equal(first, second)
+
+
+def test_seed_independent_of_n_workers(stats):
+    serial = monte_carlo_simulation(stats, 10000, seed=3, chunk_size=1000, n_workers=1, return_weights=True)
+    threaded = monte_carlo_simulation(stats, 10000, seed=3, chunk_size=1000, n_workers=4, return_weights=True)
+    pd.testing.assert_frame_equal(serial, threaded)
+
+
+def test_chunks_match_the_full_simulation(stats):
+    full = monte_carlo_simulation(stats, 5000, seed=11, chunk_size=1500)
+    sharpe = np.concatenate([chunk[3] for chunk in iter_simulation_chunks(stats, 5000, seed=11, chunk_size=1500)])
+    np.testing.assert_array_equal(full['Sharpe Ratio'].to_numpy(), sharpe)
+
+
+def test_seed_sequence_accepted(stats):
+    seed_seq = np.random.SeedSequence(5)
+    from_int = monte_carlo_simulation(stats, 2000, seed=5)
+    from_seq = monte_carlo_simulation(stats, 2000, seed=seed_seq)
+    pd.testing.assert_frame_equal(from_int, from_seq)
+
+
+def test_optimal_portfolios_default_matches_the_numpy_simulation(stats):
+    # The default engine must not depend on whether numba happens to be installed
+    simulations_df = monte_carlo_simulation(stats, 5000, seed=9, chunk_size=2000, return_weights=True)
+    best = optimal_portfolios(stats, 5000, seed=9, chunk_size=2000)
+    pd.testing.assert_series_equal(best['max_sharpe'], simulations_df.loc[simulations_df['Sharpe Ratio'].idxmax()],
+                                   check_names=False)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from monte_carlo_portfolio_optimisation import monte_carlo_simulation
+from simulation_buffers import SimulationBuffers
+
+
+def test_to_frame_shares_memory(stats):
+    buffers = monte_carlo_simulation(stats, 2000, seed=0, out=SimulationBuffers.allocate(2000, stats.symbols, weights=True))
+    frame = buffers.to_frame()
+
+    assert np.shares_memory(frame['Returns'].to_numpy(), buffers.returns)
+    assert np.shares_memory(frame['Sharpe Ratio'].to_numpy(), buffers.sharpe)
+    assert np.shares_memory(frame[stats.symbols[0]].to_numpy(), buffers.weights)
+    np.testing.assert_array_equal(frame[stats.symbols].to_numpy(), buffers.weights.T)
+
+
+def test_to_arrow_shares_memory(stats):
+    pytest.importorskip('pyarrow')
+    buffers = monte_carlo_simulation(stats, 2000, seed=0, out=SimulationBuffers.allocate(2000, stats.symbols, weights=True))
+    table = buffers.to_arrow()
+
+    returns = table.column('Returns').chunk(0).to_numpy(zero_copy_only=True)
+    weights = table.column(stats.symbols[0]).chunk(0).to_numpy(zero_copy_only=True)
+    assert np.shares_memory(returns, buffers.returns)
+    assert np.shares_memory(weights, buffers.weights)
+
+
+def test_buffers_match_the_dataframe_result(stats):
+    expected = monte_carlo_simulation(stats, 3000, seed=1, chunk_size=1000, return_weights=True)
+    buffers = monte_carlo_simulation(stats, 3000, seed=1, chunk_size=1000,
+                                     out=SimulationBuffers.allocate(3000, stats.symbols, weights=True))
+    pd.testing.assert_frame_equal(buffers.to_frame(), expected)
+
+
+def test_memmap_round_trip(stats, tmp_path):
+    out = SimulationBuffers.allocate(2500, stats.symbols, weights=True, directory=tmp_path / 'run')
+    monte_carlo_simulation(stats, 2500, seed=2, chunk_size=1000, out=out)
+    expected = out.to_frame().copy()
+    del out
+
+    reopened = SimulationBuffers.open(tmp_path / 'run')
+    assert isinstance(reopened.returns, np.memmap)
+    assert reopened.symbols == list(stats.symbols)
+    pd.testing.assert_frame_equal(reopened.to_frame(), expected)
+    with pytest.raises(ValueError):
+        reopened.returns[0] = 0.0
+
+
+def test_float32_buffers(stats):
+    single = monte_carlo_simulation(stats, 2000, seed=3, dtype=np.float32, return_weights=True)
+    double = monte_carlo_simulation(stats, 2000, seed=3, return_weights=True)
+
+    assert (single.dtypes == np.float32).all()
+    np.testing.assert_allclose(single.to_numpy(), double.to_numpy(), rtol=1e-4, atol=1e-6)
+
+
+def test_validate_rejects_mismatched_buffers(stats):
+    with pytest.raises(ValueError):
+        monte_carlo_simulation(stats, 1000, out=SimulationBuffers.allocate(999, stats.symbols))
+    with pytest.raises(ValueError):
+        monte_carlo_simulation(stats, 1000, out=SimulationBuffers.allocate(1000, stats.symbols[:-1], weights=True))